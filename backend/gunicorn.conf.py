@@ -0,0 +1,32 @@
+"""Gunicorn settings for running the API with several uvicorn workers per node.
+
+    gunicorn -c gunicorn.conf.py server:app
+
+Each worker owns its own event loop and Motor client, so the app is not
+preloaded: every worker imports server.py, opens its pool and runs the warmup
+in server.startup() before it accepts connections. Per-worker state lives in
+CACHE_BACKEND=memory; set CACHE_BACKEND=mongo to share cached data between
+workers. Size MONGO_MAX_POOL_SIZE as total connections / workers.
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get("BIND", "0.0.0.0:8001")
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+# Workers read this to tell whether a per-process CACHE_BACKEND is shared by all of them
+os.environ["WEB_CONCURRENCY"] = str(workers)
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = False
+
+# Warmup happens inside the worker's lifespan, so allow it time before the
+# arbiter considers a worker stuck.
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 60))
+graceful_timeout = int(os.environ.get("GUNICORN_GRACEFUL_TIMEOUT", 30))
+keepalive = int(os.environ.get("GUNICORN_KEEPALIVE", 5))
+
+# Recycle workers periodically; jitter keeps them from restarting together.
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", 0))
+max_requests_jitter = int(os.environ.get("GUNICORN_MAX_REQUESTS_JITTER", 0))
+
+accesslog = os.environ.get("GUNICORN_ACCESS_LOG", "-")
+errorlog = "-"
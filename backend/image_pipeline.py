@@ -0,0 +1,104 @@
+"""Proof photo processing, run inside worker processes.
+
+Kept free of server.py imports so process pool workers only load Pillow and
+this module, not the application, its Mongo client or its settings.
+"""
+import base64
+import binascii
+import io
+from typing import Optional, Tuple
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # optional: callers store proofs as received without Pillow
+    Image = None
+    ImageOps = None
+
+MIME_TYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp"}
+
+
+class ProofImageError(ValueError):
+    """The uploaded proof is not an image we can accept"""
+
+
+def split_data_url(value: str) -> Tuple[Optional[str], str]:
+    """Split "data:image/png;base64,AAAA" into ("image/png", "AAAA"); bare base64 gives (None, value)"""
+    if value.startswith("data:") and "," in value:
+        header, payload = value.split(",", 1)
+        return header[5:].split(";", 1)[0] or None, payload
+    return None, value
+
+
+def to_data_url(mime: str, data: bytes) -> str:
+    return f"data:{mime};base64,{base64.b64encode(data).decode('ascii')}"
+
+
+def decoded_size(payload: str) -> int:
+    """Size in bytes of a base64 payload, computed without decoding it"""
+    length = len(payload.rstrip("="))
+    return length * 3 // 4
+
+
+def _encode(img, fmt: str, quality: int) -> bytes:
+    out = io.BytesIO()
+    if fmt == "WEBP":
+        img.save(out, "WEBP", quality=quality, method=4)
+    else:
+        img.save(out, "JPEG", quality=quality, optimize=True, progressive=True)
+    return out.getvalue()
+
+
+def process_image_bytes(data: bytes, max_dim: int, thumb_dim: int, quality: int,
+                        fmt: str = "JPEG", max_pixels: int = 50_000_000) -> dict:
+    """Downscale and re-encode a photo and build its thumbnail"""
+    if Image is None:
+        raise RuntimeError("Pillow is not installed")
+    fmt = fmt.upper()
+    if fmt not in MIME_TYPES:
+        raise ProofImageError(f"Unsupported output format: {fmt}")
+    try:
+        img = Image.open(io.BytesIO(data))
+        # Image.open only parses the header, so dimensions are checked before any pixel decode
+        if img.width * img.height > max_pixels:
+            raise ProofImageError(f"Image is {img.width}x{img.height}, above the {max_pixels} pixel limit")
+        # Let the JPEG decoder scale by 1/2..1/8 while decoding instead of resizing full size pixels
+        img.draft("RGB", (max_dim, max_dim))
+        img = ImageOps.exif_transpose(img)
+        if img.mode != "RGB":
+            img = img.convert("RGB")
+        img.thumbnail((max_dim, max_dim), Image.LANCZOS)
+        image = _encode(img, fmt, quality)
+        width, height = img.size
+        img.thumbnail((thumb_dim, thumb_dim), Image.LANCZOS)
+        thumbnail = _encode(img, fmt, quality)
+    except (OSError, Image.DecompressionBombError) as exc:
+        raise ProofImageError(f"Could not decode image: {exc}") from exc
+    return {
+        "mime": MIME_TYPES[fmt],
+        "image": image,
+        "thumbnail": thumbnail,
+        "width": width,
+        "height": height,
+        "original_bytes": len(data),
+    }
+
+
+def process_proof_image(payload: str, max_dim: int, thumb_dim: int, quality: int,
+                        fmt: str = "JPEG", max_pixels: int = 50_000_000) -> dict:
+    """Process a base64 payload and return the image and thumbnail as data URLs"""
+    try:
+        data = base64.b64decode(payload, validate=True)
+    except (binascii.Error, ValueError) as exc:
+        raise ProofImageError("Proof image is not valid base64") from exc
+    result = process_image_bytes(data, max_dim, thumb_dim, quality, fmt, max_pixels)
+    return {
+        "image": to_data_url(result["mime"], result["image"]),
+        "thumbnail": to_data_url(result["mime"], result["thumbnail"]),
+        "meta": {
+            "format": fmt.lower(),
+            "width": result["width"],
+            "height": result["height"],
+            "bytes": len(result["image"]),
+            "original_bytes": result["original_bytes"],
+        },
+    }
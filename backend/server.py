@@ -1,26 +1,236 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Query
+from fastapi import FastAPI, APIRouter, HTTPException, Query, Request, Form, File, UploadFile
+from fastapi.responses import JSONResponse, ORJSONResponse, Response, StreamingResponse
 from dotenv import load_dotenv
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.middleware.base import BaseHTTPMiddleware
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorGridFSBucket
+from bson import Binary, ObjectId
+from bson.errors import InvalidId
+from gridfs.errors import NoFile
+from pymongo import IndexModel, ReplaceOne, ReturnDocument, UpdateOne, monitoring
+from pymongo.errors import BulkWriteError, CollectionInvalid, DuplicateKeyError, OperationFailure
+from pymongo.results import UpdateResult
+from pymongo.read_preferences import Primary, PrimaryPreferred, Secondary, SecondaryPreferred, Nearest
 import os
+import time
+import asyncio
+import random
+import base64
+import binascii
+import cProfile
+import functools
+import gzip
+import hashlib
+import hmac
+import importlib
+import json
 import logging
+import multiprocessing
+import pstats
+import re
+import sys
+import threading
+import tracemalloc
+from collections import OrderedDict, deque
+from abc import ABC, abstractmethod
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager
 from pathlib import Path
-from pydantic import BaseModel, Field, ConfigDict
-from typing import List, Optional
+from pydantic import BaseModel, Field, ConfigDict, TypeAdapter
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
 import uuid
-from datetime import datetime, timezone
+from datetime import date, datetime, timezone, timedelta
+from zoneinfo import ZoneInfo
 from enum import Enum
 
+import image_pipeline
+from image_pipeline import ProofImageError
+
+try:
+    import orjson
+except ImportError:  # optional: falls back to the stdlib JSON encoder
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # optional: responses are gzip compressed only
+    brotli = None
+
+try:
+    import numpy as np
+except ImportError:  # optional: ETA training computes quantiles in pure Python
+    np = None
+
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# ==================== CONFIGURATION ====================
+def env_int(name: str, default: Optional[int] = None) -> Optional[int]:
+    """Read an optional integer setting from the environment"""
+    value = os.environ.get(name, "").strip()
+    return int(value) if value else default
+
+def env_list(name: str, default: str = "") -> List[str]:
+    """Read a comma separated setting from the environment"""
+    return [v.strip() for v in os.environ.get(name, default).split(",") if v.strip()]
+
+# Compressor name -> module that must be importable for pymongo to use it
+COMPRESSOR_MODULES = {"zstd": "zstandard", "snappy": "snappy", "zlib": "zlib"}
+
+READ_PREFERENCES = {
+    "primary": Primary,
+    "primaryPreferred": PrimaryPreferred,
+    "secondary": Secondary,
+    "secondaryPreferred": SecondaryPreferred,
+    "nearest": Nearest,
+}
+
+def resolve_compressors(requested: List[str], explicit: bool = True) -> List[str]:
+    """Keep only the wire compressors whose libraries are installed, in preference order"""
+    available = []
+    for name in requested:
+        module = COMPRESSOR_MODULES.get(name)
+        if module is None:
+            logger.warning("Ignoring unknown MongoDB compressor %r", name)
+            continue
+        try:
+            importlib.import_module(module)
+        except ImportError:
+            if explicit:
+                logger.warning("MongoDB compressor %r requested but %r is not installed", name, module)
+            continue
+        available.append(name)
+    return available
+
+def build_read_preference(name: str, max_staleness: Optional[int]):
+    """Build a pymongo read preference from its camelCase name"""
+    if name not in READ_PREFERENCES:
+        raise ValueError(f"Unknown read preference: {name}")
+    if name == "primary":
+        return Primary()
+    return READ_PREFERENCES[name](max_staleness=max_staleness if max_staleness is not None else -1)
+
+class MongoPoolMetrics(monitoring.ConnectionPoolListener):
+    """Connection pool listener keeping utilisation counters per server"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pools = {}
+
+    def _pool(self, address) -> dict:
+        key = f"{address[0]}:{address[1]}"
+        if key not in self._pools:
+            self._pools[key] = {
+                "open": 0,
+                "checked_out": 0,
+                "max_checked_out": 0,
+                "waiting": 0,
+                "max_waiting": 0,
+                "created": 0,
+                "closed": 0,
+                "checkout_failed": 0,
+                "cleared": 0,
+            }
+        return self._pools[key]
+
+    def _update(self, address, **deltas):
+        with self._lock:
+            pool = self._pool(address)
+            for field, delta in deltas.items():
+                pool[field] += delta
+            pool["max_checked_out"] = max(pool["max_checked_out"], pool["checked_out"])
+            pool["max_waiting"] = max(pool["max_waiting"], pool["waiting"])
+
+    def pool_created(self, event):
+        self._update(event.address)
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self._update(event.address, cleared=1)
+
+    def pool_closed(self, event):
+        with self._lock:
+            self._pools.pop(f"{event.address[0]}:{event.address[1]}", None)
+
+    def connection_created(self, event):
+        self._update(event.address, open=1, created=1)
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._update(event.address, open=-1, closed=1)
+
+    def connection_check_out_started(self, event):
+        self._update(event.address, waiting=1)
+
+    def connection_check_out_failed(self, event):
+        self._update(event.address, waiting=-1, checkout_failed=1)
+
+    def connection_checked_out(self, event):
+        self._update(event.address, waiting=-1, checked_out=1)
+
+    def connection_checked_in(self, event):
+        self._update(event.address, checked_out=-1)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {address: dict(counters) for address, counters in self._pools.items()}
+
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+MONGO_SETTINGS = {
+    "maxPoolSize": env_int("MONGO_MAX_POOL_SIZE", 100),
+    "minPoolSize": env_int("MONGO_MIN_POOL_SIZE", 0),
+    "maxIdleTimeMS": env_int("MONGO_MAX_IDLE_TIME_MS"),
+    "waitQueueTimeoutMS": env_int("MONGO_WAIT_QUEUE_TIMEOUT_MS"),
+    "serverSelectionTimeoutMS": env_int("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000),
+    "connectTimeoutMS": env_int("MONGO_CONNECT_TIMEOUT_MS", 5000),
+    "socketTimeoutMS": env_int("MONGO_SOCKET_TIMEOUT_MS", 30000),
+    "compressors": resolve_compressors(
+        env_list("MONGO_COMPRESSORS", "zstd,snappy,zlib"),
+        explicit="MONGO_COMPRESSORS" in os.environ
+    ),
+    "appname": os.environ.get("MONGO_APP_NAME", "last-mile-api"),
+}
+REPORTING_READ_PREFERENCE = os.environ.get("MONGO_REPORTING_READ_PREFERENCE", "secondaryPreferred")
+REPORTING_MAX_STALENESS_S = env_int("MONGO_REPORTING_MAX_STALENESS_S")
+
+pool_metrics = MongoPoolMetrics()
+client = AsyncIOMotorClient(
+    mongo_url,
+    event_listeners=[pool_metrics],
+    **{k: v for k, v in MONGO_SETTINGS.items() if v not in (None, [])}
+)
+# Scans and writes always go to the primary; dashboard, analytics and list
+# endpoints read through reporting_db so they can be served by secondaries.
 db = client[os.environ['DB_NAME']]
+reporting_db = client.get_database(
+    os.environ['DB_NAME'],
+    read_preference=build_read_preference(REPORTING_READ_PREFERENCE, REPORTING_MAX_STALENESS_S)
+)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # startup() and shutdown() are defined at the bottom of this module
+    await startup()
+    yield
+    await shutdown()
+
+DefaultResponse = ORJSONResponse if orjson is not None else JSONResponse
 
 # Create the main app without a prefix
-app = FastAPI()
+app = FastAPI(lifespan=lifespan, default_response_class=DefaultResponse)
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
@@ -118,10 +328,20 @@ class Shipment(BaseModel):
     run_sheet_id: Optional[str] = None
     delivery_notes: Optional[str] = None
     rescheduled_date: Optional[str] = None
+    # rescheduled_date parsed to YYYY-MM-DD while the shipment waits in the reschedule queue
+    reschedule_day: Optional[str] = None
+    # Day a rescheduled shipment was moved back into the assignment pool for
+    requeued_for: Optional[str] = None
+    # Predicted delivery window while out for delivery (computed, not stored)
+    eta: Optional[Dict[str, Any]] = None
     inscan_date: Optional[str] = None
     inscan_time: Optional[str] = None
     # Delivery proof fields
     delivery_proof_image: Optional[str] = None
+    delivery_proof_thumbnail: Optional[str] = None
+    # Set for proofs sent as multipart or resumable uploads: GET /api/proofs/files/{file_id}
+    delivery_proof_file_id: Optional[str] = None
+    delivery_proof_meta: Optional[Dict[str, Any]] = None
     delivery_latitude: Optional[float] = None
     delivery_longitude: Optional[float] = None
     delivery_timestamp: Optional[str] = None
@@ -162,12 +382,19 @@ class RunSheet(BaseModel):
     is_scanned_in: bool = False
     scanned_out_at: Optional[str] = None
     scanned_in_at: Optional[str] = None
+    # Gate reconciliation results when the scan sent the AWBs it read
+    scan_out_report: Optional[Dict[str, Any]] = None
+    scan_in_report: Optional[Dict[str, Any]] = None
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class RunSheetCreate(BaseModel):
     champ_id: str
     shipment_ids: List[str]
 
+class RunSheetScan(BaseModel):
+    """AWBs physically scanned at the gate"""
+    awbs: List[str] = Field(max_length=2000)
+
 # Delivery Attempt Models
 class DeliveryAttempt(BaseModel):
     model_config = ConfigDict(extra="ignore")
@@ -223,6 +450,14 @@ class Pickup(BaseModel):
     champ_id: Optional[str] = None
     champ_name: Optional[str] = None
     notes: Optional[str] = None
+    # Delivery route the pickup address belongs to, used for dispatch
+    route: Optional[str] = None
+    # Pickup address coordinates
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+    # Completion proof, served by GET /api/proofs/{proof_id}
+    proof_id: Optional[str] = None
+    proof_meta: Optional[Dict[str, Any]] = None
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
@@ -231,6 +466,9 @@ class SellerPickupCreate(BaseModel):
     seller_address: str
     seller_phone: str
     pickup_items: List[PickupItem]
+    route: Optional[str] = None
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
 
 class CustomerReturnCreate(BaseModel):
     customer_name: str
@@ -238,12 +476,18 @@ class CustomerReturnCreate(BaseModel):
     customer_phone: str
     original_awb: Optional[str] = None
     return_reason: Optional[str] = None
+    route: Optional[str] = None
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
 
 class PersonalShoppingCreate(BaseModel):
     customer_name: str
     customer_address: str
     customer_phone: str
     shopping_items: List[PersonalShoppingItem]
+    route: Optional[str] = None
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
 
 class PickupUpdate(BaseModel):
     status: Optional[PickupStatus] = None
@@ -273,7 +517,8 @@ class ShoppingHistoryEntry(BaseModel):
     value_collected: float = 0
     champ_id: Optional[str] = None
     champ_name: Optional[str] = None
-    proof_image: Optional[str] = None
+    proof_id: Optional[str] = None
+    proof_image: Optional[str] = None  # only on entries written before proofs were stored separately
     latitude: Optional[float] = None
     longitude: Optional[float] = None
     notes: Optional[str] = None
@@ -286,6 +531,9 @@ class UnsubmittedItemsCreate(BaseModel):
     seller_phone: str
     pickup_items: List[PickupItem]
     notes: Optional[str] = None
+    route: Optional[str] = None
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
 
 # Champ Delivery Action Model
 class ChampDeliveryAction(BaseModel):
@@ -314,235 +562,1822 @@ def prepare_doc_for_db(doc: dict) -> dict:
             doc[key] = value.isoformat()
     return doc
 
-# ==================== BIN LOCATION ROUTES ====================
-@api_router.post("/bin-locations", response_model=BinLocation)
-async def create_bin_location(input: BinLocationCreate):
-    bin_loc = BinLocation(**input.model_dump())
-    doc = prepare_doc_for_db(bin_loc.model_dump())
-    await db.bin_locations.insert_one(doc)
-    return bin_loc
-
-@api_router.get("/bin-locations", response_model=List[BinLocation])
-async def get_bin_locations(route: Optional[str] = None):
-    query = {} if not route else {"route": route}
-    locations = await db.bin_locations.find(query, {"_id": 0}).to_list(1000)
-    return locations
+def geo_point(latitude: Optional[float], longitude: Optional[float]) -> Optional[dict]:
+    """GeoJSON point for a 2dsphere index, or None when the coordinates are missing or invalid"""
+    if latitude is None or longitude is None:
+        return None
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        return None
+    return {"type": "Point", "coordinates": [longitude, latitude]}
 
-@api_router.get("/bin-locations/{bin_id}", response_model=BinLocation)
-async def get_bin_location(bin_id: str):
-    location = await db.bin_locations.find_one({"id": bin_id}, {"_id": 0})
-    if not location:
-        raise HTTPException(status_code=404, detail="Bin location not found")
-    return location
+def normalize_awb(awb: str) -> str:
+    return re.sub(r"\s+", "", awb or "").upper()
 
-# ==================== CHAMP ROUTES ====================
-@api_router.post("/champs", response_model=Champ)
-async def create_champ(input: ChampCreate):
-    champ = Champ(**input.model_dump())
-    doc = prepare_doc_for_db(champ.model_dump())
-    await db.champs.insert_one(doc)
-    return champ
+def phone_digits(phone: Optional[str]) -> str:
+    return "".join(ch for ch in phone or "" if ch.isdigit())
 
-@api_router.get("/champs", response_model=List[Champ])
-async def get_champs(is_active: Optional[bool] = None):
-    query = {} if is_active is None else {"is_active": is_active}
-    champs = await db.champs.find(query, {"_id": 0}).to_list(1000)
-    return champs
+def search_fields(name: Optional[str], phone: Optional[str], awb: Optional[str] = None) -> dict:
+    """Normalised copies of the fields behind the prefix indexes used by /api/search"""
+    digits = phone_digits(phone)
+    fields = {
+        "name_norm": (name or "").strip().lower(),
+        "phone_digits": digits,
+        # Reversed so "last N digits" lookups are also index prefix scans
+        "phone_digits_rev": digits[::-1],
+    }
+    if awb is not None:
+        fields["awb_norm"] = normalize_awb(awb)
+    return fields
 
-@api_router.get("/champs/{champ_id}", response_model=Champ)
-async def get_champ(champ_id: str):
-    champ = await db.champs.find_one({"id": champ_id}, {"_id": 0})
-    if not champ:
-        raise HTTPException(status_code=404, detail="Champ not found")
-    return champ
+# (name fields, phone fields, awb field) behind each collection's search fields; the
+# first non-empty name and phone are the ones indexed
+SHIPMENT_SEARCH_SOURCES = (["recipient_name"], ["recipient_phone"], "awb")
+PICKUP_SEARCH_SOURCES = (["customer_name", "seller_name"], ["customer_phone", "seller_phone"], None)
 
-@api_router.put("/champs/{champ_id}", response_model=Champ)
-async def update_champ(champ_id: str, input: ChampCreate):
-    result = await db.champs.update_one(
-        {"id": champ_id},
-        {"$set": input.model_dump()}
-    )
-    if result.matched_count == 0:
-        raise HTTPException(status_code=404, detail="Champ not found")
-    return await get_champ(champ_id)
+def derived_search_fields(doc: dict, name_fields: List[str], phone_fields: List[str], awb_field: Optional[str]) -> dict:
+    name = next((doc[f] for f in name_fields if doc.get(f)), None)
+    phone = next((doc[f] for f in phone_fields if doc.get(f)), None)
+    return search_fields(name, phone, doc.get(awb_field, "") if awb_field else None)
 
-# ==================== SHIPMENT ROUTES ====================
-@api_router.post("/shipments", response_model=Shipment)
-async def create_shipment(input: ShipmentCreate):
-    # Check if AWB already exists
-    existing = await db.shipments.find_one({"awb": input.awb})
-    if existing:
-        raise HTTPException(status_code=400, detail="AWB already exists")
-    
-    shipment = Shipment(**input.model_dump())
+def shipment_doc(shipment: "Shipment") -> dict:
+    """Build the stored document for a new shipment, including derived fields"""
     doc = prepare_doc_for_db(shipment.model_dump())
-    await db.shipments.insert_one(doc)
-    return shipment
+    doc.update(derived_search_fields(doc, *SHIPMENT_SEARCH_SOURCES))
+    return doc
 
-@api_router.post("/shipments/bulk", response_model=List[Shipment])
-async def create_shipments_bulk(inputs: List[ShipmentCreate]):
-    shipments = []
-    for input in inputs:
-        existing = await db.shipments.find_one({"awb": input.awb})
-        if not existing:
-            shipment = Shipment(**input.model_dump())
-            doc = prepare_doc_for_db(shipment.model_dump())
-            await db.shipments.insert_one(doc)
-            shipments.append(shipment)
-    return shipments
+def pickup_doc(pickup: "Pickup") -> dict:
+    """Build the stored document for a new pickup, including derived fields"""
+    doc = prepare_doc_for_db(pickup.model_dump())
+    location = geo_point(pickup.latitude, pickup.longitude)
+    if location:
+        doc["location"] = location
+    doc.update(derived_search_fields(doc, *PICKUP_SEARCH_SOURCES))
+    return doc
 
-@api_router.get("/shipments", response_model=List[Shipment])
-async def get_shipments(
-    status: Optional[ShipmentStatus] = None,
-    route: Optional[str] = None,
-    champ_id: Optional[str] = None,
-    bin_location_id: Optional[str] = None,
-    inscan_date_from: Optional[str] = None,
-    inscan_date_to: Optional[str] = None
-):
-    query = {}
-    if status:
-        query["status"] = status.value
-    if route:
-        query["route"] = route
-    if champ_id:
-        query["champ_id"] = champ_id
-    if bin_location_id:
-        query["bin_location_id"] = bin_location_id
-    
-    # Date range filter for inscan_date
-    if inscan_date_from or inscan_date_to:
-        date_query = {}
-        if inscan_date_from:
-            date_query["$gte"] = inscan_date_from
-        if inscan_date_to:
-            date_query["$lte"] = inscan_date_to
-        if date_query:
-            query["inscan_date"] = date_query
-    
-    shipments = await db.shipments.find(query, {"_id": 0}).sort("created_at", -1).to_list(1000)
-    return shipments
+# List validators, built once per model and shared by every request
+LIST_ADAPTERS: Dict[type, TypeAdapter] = {}
 
-@api_router.get("/shipments/{shipment_id}", response_model=Shipment)
-async def get_shipment(shipment_id: str):
-    shipment = await db.shipments.find_one({"id": shipment_id}, {"_id": 0})
-    if not shipment:
-        raise HTTPException(status_code=404, detail="Shipment not found")
-    return shipment
+def list_adapter(model: type) -> TypeAdapter:
+    adapter = LIST_ADAPTERS.get(model)
+    if adapter is None:
+        adapter = LIST_ADAPTERS[model] = TypeAdapter(List[model])
+    return adapter
 
-@api_router.get("/shipments/awb/{awb}", response_model=Shipment)
-async def get_shipment_by_awb(awb: str):
-    shipment = await db.shipments.find_one({"awb": awb}, {"_id": 0})
-    if not shipment:
-        raise HTTPException(status_code=404, detail="Shipment not found")
-    return shipment
+def model_projection(model: type) -> dict:
+    """Projection fetching only the fields a response model exposes"""
+    return {"_id": 0, **{name: 1 for name in model.model_fields}}
 
-@api_router.put("/shipments/{shipment_id}", response_model=Shipment)
-async def update_shipment(shipment_id: str, input: ShipmentUpdate):
-    update_data = {k: v for k, v in input.model_dump().items() if v is not None}
-    update_data["updated_at"] = datetime.now(timezone.utc).isoformat()
-    
-    result = await db.shipments.update_one(
-        {"id": shipment_id},
-        {"$set": update_data}
-    )
-    if result.matched_count == 0:
-        raise HTTPException(status_code=404, detail="Shipment not found")
-    return await get_shipment(shipment_id)
+# How list endpoints turn DB documents into a response:
+#   validate    - FastAPI validates against response_model and encodes (default)
+#   adapter     - one TypeAdapter validation, serialized straight to JSON bytes
+#   passthrough - documents are trusted as stored and encoded without validation
+SERIALIZATION_MODE = os.environ.get("SERIALIZATION_MODE", "validate")
+if SERIALIZATION_MODE not in ("validate", "adapter", "passthrough"):
+    raise ValueError(f"Unknown SERIALIZATION_MODE: {SERIALIZATION_MODE}")
 
-# ==================== LOGISTICS OPERATIONS ====================
+def list_response(model: type, docs: List[dict]):
+    """Serialize documents fetched with model_projection(model) for a List[model] endpoint"""
+    if SERIALIZATION_MODE == "adapter":
+        adapter = list_adapter(model)
+        return Response(adapter.dump_json(adapter.validate_python(docs)), media_type="application/json")
+    if SERIALIZATION_MODE == "passthrough":
+        return DefaultResponse(docs)
+    return docs
 
-# Step 1: In-Scan shipment (Warehouse to Logistics)
-@api_router.post("/logistics/in-scan/{awb}", response_model=Shipment)
-async def in_scan_shipment(awb: str):
-    shipment = await db.shipments.find_one({"awb": awb}, {"_id": 0})
-    if not shipment:
-        raise HTTPException(status_code=404, detail="Shipment not found")
-    
-    if shipment["status"] != ShipmentStatus.PENDING_HANDOVER.value:
-        raise HTTPException(status_code=400, detail=f"Shipment already in status: {shipment['status']}")
-    
-    now = datetime.now(timezone.utc)
-    await db.shipments.update_one(
-        {"awb": awb},
-        {"$set": {
-            "status": ShipmentStatus.IN_SCANNED.value,
-            "inscan_date": now.strftime("%Y-%m-%d"),
-            "inscan_time": now.strftime("%H:%M:%S"),
-            "updated_at": now.isoformat()
-        }}
-    )
-    return await get_shipment_by_awb(awb)
+# ==================== CACHE ====================
+class CacheBackend(ABC):
+    """Async key/value cache interface; values must be JSON-compatible"""
+    name = "abstract"
+    # Whether every worker sees the same entries (and so each other's invalidations)
+    shared = False
 
-# Step 2: Assign to Bin Location based on Route
-@api_router.post("/logistics/assign-bin", response_model=List[Shipment])
-async def assign_to_bin(shipment_ids: List[str], bin_location_id: str):
-    # Verify bin location exists
-    bin_loc = await db.bin_locations.find_one({"id": bin_location_id}, {"_id": 0})
-    if not bin_loc:
-        raise HTTPException(status_code=404, detail="Bin location not found")
-    
-    updated_shipments = []
-    for sid in shipment_ids:
-        result = await db.shipments.update_one(
-            {"id": sid, "status": ShipmentStatus.IN_SCANNED.value},
-            {"$set": {
-                "bin_location_id": bin_location_id,
-                "status": ShipmentStatus.ASSIGNED_TO_BIN.value,
-                "updated_at": datetime.now(timezone.utc).isoformat()
-            }}
+    @abstractmethod
+    async def get(self, key: str) -> Any:
+        ...
+
+    @abstractmethod
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        ...
+
+    @abstractmethod
+    async def delete(self, key: str) -> None:
+        ...
+
+    @abstractmethod
+    async def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        """Increment a counter, starting a new TTL window when the key is created"""
+
+class InMemoryCache(CacheBackend):
+    """Per-process LRU cache; the default, and the stand-in for a shared backend in single-worker setups"""
+    name = "memory"
+
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def _live(self, key: str):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, _ = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _store(self, key: str, value: Any, expires_at: Optional[float]):
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def get(self, key: str) -> Any:
+        entry = self._live(key)
+        return entry[1] if entry else None
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        self._store(key, value, time.monotonic() + ttl if ttl else None)
+
+    async def delete(self, key: str) -> None:
+        self._entries.pop(key, None)
+
+    async def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        entry = self._live(key)
+        if entry is None:
+            value, expires_at = amount, (time.monotonic() + ttl if ttl else None)
+        else:
+            expires_at, value = entry[0], entry[1] + amount
+        self._store(key, value, expires_at)
+        return value
+
+class MongoCache(CacheBackend):
+    """Cache shared by every worker through a MongoDB collection with a TTL index"""
+    name = "mongo"
+    shared = True
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    @staticmethod
+    def _expiry(ttl: Optional[float]) -> Optional[datetime]:
+        return datetime.fromtimestamp(time.time() + ttl, timezone.utc) if ttl else None
+
+    @staticmethod
+    def _is_live(doc: Optional[dict]) -> bool:
+        if not doc:
+            return False
+        expires_at = doc.get("expires_at")
+        if expires_at is None:
+            return True
+        if expires_at.tzinfo is None:
+            expires_at = expires_at.replace(tzinfo=timezone.utc)
+        return expires_at > datetime.now(timezone.utc)
+
+    async def get(self, key: str) -> Any:
+        doc = await self.collection.find_one({"_id": key})
+        return doc["value"] if self._is_live(doc) else None
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        await self.collection.update_one(
+            {"_id": key},
+            {"$set": {"value": value, "expires_at": self._expiry(ttl)}},
+            upsert=True
         )
-        if result.modified_count > 0:
-            shipment = await db.shipments.find_one({"id": sid}, {"_id": 0})
-            updated_shipments.append(shipment)
-    
-    # Update bin location count
-    await db.bin_locations.update_one(
-        {"id": bin_location_id},
-        {"$inc": {"current_count": len(updated_shipments)}}
-    )
-    
-    return updated_shipments
 
-# Step 3: Assign to Champ (AWB wise)
-@api_router.post("/logistics/assign-champ", response_model=List[Shipment])
-async def assign_to_champ(shipment_ids: List[str], champ_id: str):
-    # Verify champ exists
-    champ = await db.champs.find_one({"id": champ_id}, {"_id": 0})
-    if not champ:
-        raise HTTPException(status_code=404, detail="Champ not found")
-    
-    updated_shipments = []
-    for sid in shipment_ids:
-        result = await db.shipments.update_one(
-            {"id": sid, "status": {"$in": [ShipmentStatus.ASSIGNED_TO_BIN.value, ShipmentStatus.RESCHEDULED.value, ShipmentStatus.RETURNED_TO_WH.value]}},
-            {"$set": {
-                "champ_id": champ_id,
-                "status": ShipmentStatus.ASSIGNED_TO_CHAMP.value,
-                "updated_at": datetime.now(timezone.utc).isoformat()
-            }}
+    async def delete(self, key: str) -> None:
+        await self.collection.delete_one({"_id": key})
+
+    async def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        # The TTL monitor only runs once a minute, so expired windows are reset here
+        await self.collection.delete_one({"_id": key, "expires_at": {"$lte": datetime.now(timezone.utc)}})
+        doc = await self.collection.find_one_and_update(
+            {"_id": key},
+            {"$inc": {"value": amount}, "$setOnInsert": {"expires_at": self._expiry(ttl)}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
         )
-        if result.modified_count > 0:
-            shipment = await db.shipments.find_one({"id": sid}, {"_id": 0})
-            updated_shipments.append(shipment)
-    
-    return updated_shipments
+        return doc["value"]
 
-# ==================== RUN SHEET ROUTES ====================
+CACHE_BACKEND = os.environ.get("CACHE_BACKEND", "memory")
 
-# Step 4: Generate Run Sheet
-@api_router.post("/run-sheets", response_model=RunSheet)
-async def create_run_sheet(input: RunSheetCreate):
-    # Verify champ exists
-    champ = await db.champs.find_one({"id": input.champ_id}, {"_id": 0})
-    if not champ:
-        raise HTTPException(status_code=404, detail="Champ not found")
-    
-    # Get shipments and calculate totals
-    shipments = await db.shipments.find(
-        {"id": {"$in": input.shipment_ids}, "champ_id": input.champ_id},
-        {"_id": 0}
-    ).to_list(1000)
+def build_cache(name: str) -> CacheBackend:
+    if name == "memory":
+        return InMemoryCache(max_entries=env_int("CACHE_MAX_ENTRIES", 10000))
+    if name == "mongo":
+        return MongoCache(db.cache_entries)
+    raise ValueError(f"Unknown CACHE_BACKEND: {name}")
+
+cache = build_cache(CACHE_BACKEND)
+
+# gunicorn.conf.py exports its worker count; anything else runs one worker per process group
+WEB_WORKERS = env_int("WEB_CONCURRENCY", 1)
+# How long a worker may serve data another worker has already invalidated when the
+# cache backend is per-process (CACHE_BACKEND=memory with several workers)
+LOCAL_CACHE_STALE_S = env_int("LOCAL_CACHE_STALE_S", 5)
+
+def cache_is_shared() -> bool:
+    """True when invalidations made through `cache` reach every worker serving the app"""
+    return cache.shared or WEB_WORKERS <= 1
+
+def local_ttl(ttl: float) -> float:
+    """Cap a TTL when other workers can't see this worker's invalidations"""
+    return ttl if cache_is_shared() else min(ttl, LOCAL_CACHE_STALE_S)
+
+if not cache_is_shared():
+    logger.warning(
+        "CACHE_BACKEND=%s is per-process with %d workers: cross-worker changes are seen within %ds",
+        CACHE_BACKEND, WEB_WORKERS, LOCAL_CACHE_STALE_S
+    )
+
+# Reference data is small, read on almost every screen and changes rarely
+REFERENCE_TTL_S = env_int("REFERENCE_CACHE_TTL_S", 60)
+
+async def _load_bins():
+    return await reporting_db.bin_locations.find({}, {"_id": 0}).to_list(1000)
+
+async def _load_routes():
+    return await reporting_db.shipments.distinct("route")
+
+REFERENCE_LOADERS: Dict[str, Callable[[], Awaitable[Any]]] = {
+    "bins": _load_bins,
+    "routes": _load_routes,
+}
+
+async def get_reference(name: str, refresh: bool = False) -> Any:
+    """Return cached reference data, loading it on a miss"""
+    key = f"ref:{name}"
+    value = None if refresh else await cache.get(key)
+    if value is None:
+        value = await REFERENCE_LOADERS[name]()
+        await cache.set(key, value, ttl=local_ttl(REFERENCE_TTL_S))
+    return value
+
+async def invalidate_reference(name: str):
+    """Drop cached reference data; other workers only follow immediately with a shared backend"""
+    await cache.delete(f"ref:{name}")
+
+# ==================== WRITE BATCHING ====================
+# Scan handlers at peak issue thousands of single-document updates a minute. With
+# WRITE_BATCH_MS > 0 those updates are held for up to WRITE_BATCH_MS (or until
+# WRITE_BATCH_MAX_OPS are waiting) and sent as one unordered bulk_write; each caller
+# still gets its own UpdateResult. bulk_write only reports totals, so every batched
+# update also sets a fresh `write_id`: when a batch matched fewer documents than it had
+# updates, one query on those ids tells which updates matched. Batches are flushed on
+# shutdown. WRITE_BATCH_MS=0 (the default) sends every update directly.
+WRITE_BATCH_MS = env_int("WRITE_BATCH_MS", 0)
+WRITE_BATCH_MAX_OPS = env_int("WRITE_BATCH_MAX_OPS", 500)
+
+class WriteBatcher:
+    """Coalesces update_one calls on one collection into unordered bulk writes"""
+
+    def __init__(self, collection, max_delay_ms: int, max_ops: int):
+        self.collection = collection
+        self.max_delay_s = max_delay_ms / 1000
+        self.max_ops = max_ops
+        self._pending: List[tuple] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._flushes: set = set()
+        self._closed = False
+        self.stats = {"batches": 0, "ops": 0, "max_batch": 0, "lookups": 0}
+
+    async def update_one(self, filter: dict, update: dict, upsert: bool = False) -> UpdateResult:
+        if self.max_delay_s <= 0 or self._closed:
+            return await self.collection.update_one(filter, update, upsert=upsert)
+        write_id = ObjectId()
+        update = {**update, "$set": {**update.get("$set", {}), "write_id": write_id}}
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((UpdateOne(filter, update, upsert=upsert), write_id, future))
+        if len(self._pending) >= self.max_ops:
+            self._start_flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.max_delay_s, self._start_flush)
+        return await future
+
+    def _start_flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.create_task(self._flush(batch))
+            self._flushes.add(task)
+            task.add_done_callback(self._flushes.discard)
+
+    async def _flush(self, batch: List[tuple]):
+        failed: Dict[int, Exception] = {}
+        try:
+            result = await self.collection.bulk_write([op for op, _, _ in batch], ordered=False)
+            matched, upserted = result.matched_count, result.upserted_ids
+        except BulkWriteError as exc:
+            details = exc.details
+            failed = {e["index"]: DuplicateKeyError(e["errmsg"], e["code"], e) if e["code"] == 11000
+                      else exc for e in details.get("writeErrors", [])}
+            matched = details.get("nMatched", 0)
+            upserted = {u["index"]: u["_id"] for u in details.get("upserted", [])}
+        except Exception as exc:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+        self.stats["batches"] += 1
+        self.stats["ops"] += len(batch)
+        self.stats["max_batch"] = max(self.stats["max_batch"], len(batch))
+
+        candidates = [i for i in range(len(batch)) if i not in failed and i not in upserted]
+        if matched == len(candidates):
+            matched_ids = {batch[i][1] for i in candidates}
+        else:
+            # A document updated twice in one batch keeps the later write_id, so the
+            # earlier update reads as unmatched; scans don't touch a shipment twice per batch
+            self.stats["lookups"] += 1
+            try:
+                docs = await self.collection.find(
+                    {"write_id": {"$in": [batch[i][1] for i in candidates]}}, {"_id": 0, "write_id": 1}
+                ).to_list(None)
+            except Exception as exc:
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(exc)
+                return
+            matched_ids = {d["write_id"] for d in docs}
+        for index, (_, write_id, future) in enumerate(batch):
+            if future.done():
+                continue
+            if index in failed:
+                future.set_exception(failed[index])
+            elif index in upserted:
+                future.set_result(UpdateResult({"n": 1, "nModified": 0, "upserted": upserted[index]}, True))
+            else:
+                # Every batched update sets a new write_id, so a match is always a modification
+                n = 1 if write_id in matched_ids else 0
+                future.set_result(UpdateResult({"n": n, "nModified": n}, True))
+
+    async def close(self):
+        """Flush what is waiting and send later updates directly"""
+        self._closed = True
+        self._start_flush()
+        if self._flushes:
+            await asyncio.gather(*self._flushes, return_exceptions=True)
+
+shipment_writes = WriteBatcher(db.shipments, WRITE_BATCH_MS, WRITE_BATCH_MAX_OPS)
+WRITE_BATCHERS = {"shipments": shipment_writes}
+
+# ==================== JOB QUEUE ====================
+# Follow-up work that does not need to finish before a handler responds (counter
+# updates, thumbnails, denormalised copies, notifications) is written to the `jobs`
+# collection and run by workers. A claimed job is invisible to other workers until
+# its visibility timeout passes, so a worker that dies mid-job only delays it; a live
+# worker keeps renewing the lease for as long as the job runs. Handlers must still be
+# safe to run more than once.
+JOB_WORKERS = env_int("JOB_WORKERS", 1)
+JOB_POLL_S = float(os.environ.get("JOB_POLL_S", "1.0"))
+JOB_VISIBILITY_TIMEOUT_S = env_int("JOB_VISIBILITY_TIMEOUT_S", 300)
+# A running job renews its lease this often, so only a dead worker's jobs time out
+JOB_HEARTBEAT_S = env_int("JOB_HEARTBEAT_S", max(1, JOB_VISIBILITY_TIMEOUT_S // 3))
+JOB_MAX_ATTEMPTS = env_int("JOB_MAX_ATTEMPTS", 5)
+JOB_BACKOFF_S = env_int("JOB_BACKOFF_S", 5)
+JOB_BACKOFF_MAX_S = env_int("JOB_BACKOFF_MAX_S", 600)
+JOB_RETENTION_S = env_int("JOB_RETENTION_S", 7 * 24 * 3600)
+
+JOB_HANDLERS: Dict[str, Callable[..., Awaitable[Any]]] = {}
+
+class PermanentJobError(Exception):
+    """Raised by a job handler when retrying cannot help"""
+
+def job_handler(job_type: str):
+    """Register an async function as the handler for a job type; it is called with the job payload as kwargs"""
+    def register(fn):
+        JOB_HANDLERS[job_type] = fn
+        return fn
+    return register
+
+_job_wakeup = asyncio.Event()
+
+async def enqueue_job(job_type: str, delay_s: float = 0, max_attempts: Optional[int] = None,
+                      key: Optional[str] = None, **payload) -> Optional[str]:
+    """Queue a job and return its id. With a `key`, at most one job with that key waits
+    in the queue at a time; enqueueing another returns None."""
+    if job_type not in JOB_HANDLERS:
+        raise ValueError(f"No handler registered for job type {job_type}")
+    now = datetime.now(timezone.utc)
+    job = {
+        "id": str(uuid.uuid4()),
+        "type": job_type,
+        "payload": payload,
+        "status": "queued",
+        "attempts": 0,
+        "max_attempts": max_attempts or JOB_MAX_ATTEMPTS,
+        "run_at": now + timedelta(seconds=delay_s),
+        "created_at": now
+    }
+    if key:
+        job["key"] = key
+    try:
+        await db.jobs.insert_one(job)
+    except DuplicateKeyError:
+        return None
+    _job_wakeup.set()
+    return job["id"]
+
+async def claim_job() -> Optional[dict]:
+    """Take the oldest runnable job, or one whose previous worker's lease expired"""
+    now = datetime.now(timezone.utc)
+    return await db.jobs.find_one_and_update(
+        {"$or": [
+            {"status": "queued", "run_at": {"$lte": now}},
+            {"status": "running", "locked_until": {"$lte": now}},
+        ]},
+        {
+            "$set": {"status": "running", "locked_until": now + timedelta(seconds=JOB_VISIBILITY_TIMEOUT_S)},
+            "$inc": {"attempts": 1},
+            # A running job no longer blocks a follow-up with the same key
+            "$unset": {"key": ""}
+        },
+        sort=[("run_at", 1)],
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER
+    )
+
+def job_backoff(attempts: int) -> float:
+    """Exponential backoff with jitter so failing jobs don't retry in lockstep"""
+    delay = min(JOB_BACKOFF_MAX_S, JOB_BACKOFF_S * 2 ** (attempts - 1))
+    return delay * random.uniform(0.5, 1.0)
+
+async def extend_job_lease(lease: dict):
+    """Push locked_until forward while a job runs, so a long job is not re-claimed mid-flight"""
+    while True:
+        await asyncio.sleep(JOB_HEARTBEAT_S)
+        try:
+            locked_until = datetime.now(timezone.utc) + timedelta(seconds=JOB_VISIBILITY_TIMEOUT_S)
+            result = await db.jobs.update_one({**lease, "status": "running"}, {"$set": {"locked_until": locked_until}})
+        except Exception:
+            logger.exception("Extending the lease on job %s failed", lease["id"])
+            continue
+        if not result.matched_count:
+            logger.warning("Job %s lost its lease; another worker may be running it", lease["id"])
+            return
+
+async def run_job(job: dict):
+    # Matching on attempts keeps a worker whose lease expired from overwriting the retry's result
+    lease = {"id": job["id"], "attempts": job["attempts"]}
+    if job["attempts"] > job["max_attempts"]:
+        # Every attempt's worker died mid-run (a job that crashes its process lands here);
+        # stop re-claiming it rather than run it forever
+        now = datetime.now(timezone.utc)
+        logger.error("Job %s (%s) lost its lease on every attempt; marking it failed", job["id"], job["type"])
+        await db.jobs.update_one(lease, {
+            "$set": {"status": "failed", "last_error": "lease expired on the final attempt", "updated_at": now,
+                     "expires_at": now + timedelta(seconds=JOB_RETENTION_S)},
+            "$unset": {"locked_until": ""}
+        })
+        return
+    try:
+        handler = JOB_HANDLERS.get(job["type"])
+        if handler is None:
+            raise PermanentJobError(f"No handler registered for job type {job['type']}")
+        heartbeat = asyncio.create_task(extend_job_lease(lease))
+        try:
+            await handler(**job["payload"])
+        finally:
+            heartbeat.cancel()
+    except Exception as exc:
+        now = datetime.now(timezone.utc)
+        permanent = isinstance(exc, PermanentJobError) or job["attempts"] >= job["max_attempts"]
+        logger.warning("Job %s (%s) attempt %d failed: %r", job["id"], job["type"], job["attempts"], exc)
+        update = {"status": "failed" if permanent else "queued", "last_error": repr(exc), "updated_at": now}
+        if permanent:
+            update["expires_at"] = now + timedelta(seconds=JOB_RETENTION_S)
+        else:
+            update["run_at"] = now + timedelta(seconds=job_backoff(job["attempts"]))
+        await db.jobs.update_one(lease, {"$set": update, "$unset": {"locked_until": ""}})
+        return
+    now = datetime.now(timezone.utc)
+    await db.jobs.update_one(lease, {
+        "$set": {"status": "done", "updated_at": now, "expires_at": now + timedelta(seconds=JOB_RETENTION_S)},
+        "$unset": {"locked_until": ""}
+    })
+
+async def job_worker(stop: asyncio.Event):
+    """Run jobs until `stop` is set; sleeps up to JOB_POLL_S when the queue is empty"""
+    while not stop.is_set():
+        try:
+            job = await claim_job()
+        except Exception:
+            logger.exception("Claiming a job failed")
+            job = None
+        if job is not None:
+            try:
+                await run_job(job)
+            except Exception:
+                # Recording the outcome failed; the lease expires and the job is claimed again
+                logger.exception("Running job %s failed", job["id"])
+            continue
+        _job_wakeup.clear()
+        try:
+            await asyncio.wait_for(_job_wakeup.wait(), timeout=JOB_POLL_S)
+        except asyncio.TimeoutError:
+            pass
+
+_job_stop = asyncio.Event()
+_job_tasks: List[asyncio.Task] = []
+
+def start_job_workers(count: int):
+    _job_stop.clear()
+    for _ in range(count):
+        _job_tasks.append(asyncio.create_task(job_worker(_job_stop)))
+
+async def stop_job_workers(timeout: float = 10):
+    """Let workers finish the job in hand; anything still running is retried after its lease expires"""
+    _job_stop.set()
+    _job_wakeup.set()
+    if _job_tasks:
+        _, pending = await asyncio.wait(_job_tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+    _job_tasks.clear()
+
+# ==================== HTTP CACHING ====================
+# Each collection the UI lists has a version counter in `collection_versions`, bumped
+# by every handler or job that writes it. GETs under the prefixes below get an ETag
+# derived from the path, query string and those versions, so the browser revalidates
+# with If-None-Match and an unchanged list costs one point read and a 304.
+#
+# A counter is split over VERSION_SHARDS documents ("<collection>:<n>"); a write bumps
+# one at random and readers sum them, so concurrent writers to a busy collection don't
+# all queue on a single document. Sources served from this worker's memory rather than
+# the database (the champ directory, the ETA model) are not versioned in the database
+# at all: ETAG_LOCAL_SOURCES fingerprints what this worker actually holds, so a worker
+# that has not picked up a change yet cannot confirm a client's newer ETag.
+CONDITIONAL_GET_PREFIXES = [
+    ("/api/shipments", ("shipments",)),
+    ("/api/logistics/undelivered", ("shipments",)),
+    ("/api/run-sheets", ("run_sheets",)),
+    ("/api/champs", ("champs",)),
+    ("/api/champ/", ("shipments", "pickups", "run_sheets", "champs", "eta_model")),
+    ("/api/bin-locations", ("bin_locations",)),
+    ("/api/delivery-attempts", ("delivery_attempts",)),
+    ("/api/pickups", ("pickups",)),
+    ("/api/reschedules", ("shipments", "champs")),
+]
+ETAG_LOCAL_SOURCES: Dict[str, Callable[[], Awaitable[str]]] = {
+    "champs": lambda: champ_directory.fingerprint(),
+    "eta_model": lambda: eta_predictor.fingerprint(),
+}
+VERSION_SHARDS = env_int("VERSION_SHARDS", 8)
+COMPRESSION_MIN_BYTES = env_int("COMPRESSION_MIN_BYTES", 1000)
+COMPRESSIBLE_TYPES = ("application/json", "text/")
+
+def version_shard_ids(name: str) -> List[str]:
+    return [f"{name}:{shard}" for shard in range(VERSION_SHARDS)]
+
+async def touch(*collections: str):
+    """Record that `collections` changed, invalidating ETags of responses built from them"""
+    now = datetime.now(timezone.utc)
+    await asyncio.gather(*[
+        db.collection_versions.update_one(
+            {"_id": f"{name}:{random.randrange(VERSION_SHARDS)}"},
+            {"$inc": {"version": 1}, "$set": {"updated_at": now}}, upsert=True
+        )
+        for name in collections if name not in ETAG_LOCAL_SOURCES
+    ])
+
+async def collection_versions(collections: tuple) -> Dict[str, dict]:
+    """{collection: {"version", "updated_at"}}, summed over the collection's shards"""
+    shard_ids = [shard_id for name in collections for shard_id in version_shard_ids(name)]
+    # Read from the primary: a lagging secondary could confirm an ETag the client just invalidated
+    versions: Dict[str, dict] = {}
+    for doc in await db.collection_versions.find({"_id": {"$in": shard_ids}}).to_list(None):
+        entry = versions.setdefault(doc["_id"].rpartition(":")[0], {"version": 0, "updated_at": None})
+        entry["version"] += doc.get("version", 0)
+        if doc.get("updated_at") and (entry["updated_at"] is None or doc["updated_at"] > entry["updated_at"]):
+            entry["updated_at"] = doc["updated_at"]
+    return versions
+
+def touches(*collections: str):
+    """Decorate a write handler so it bumps the versions of the collections it modifies.
+    The bump runs even when the handler fails part way, since some writes may have landed."""
+    def decorate(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            try:
+                return await fn(*args, **kwargs)
+            finally:
+                await touch(*collections)
+        return wrapper
+    return decorate
+
+def conditional_collections(path: str) -> Optional[tuple]:
+    for prefix, collections in CONDITIONAL_GET_PREFIXES:
+        if path.startswith(prefix):
+            return collections
+    return None
+
+async def conditional_get(request: Request, call_next):
+    collections = conditional_collections(request.url.path) if request.method == "GET" else None
+    if not collections:
+        return await call_next(request)
+    stored = tuple(name for name in collections if name not in ETAG_LOCAL_SOURCES)
+    local = [name for name in collections if name in ETAG_LOCAL_SOURCES]
+    versions, *fingerprints = await asyncio.gather(
+        collection_versions(stored), *[ETAG_LOCAL_SOURCES[name]() for name in local]
+    )
+    tag_source = "|".join(
+        [request.url.path, request.url.query, SERIALIZATION_MODE]
+        + [f"{name}:{versions.get(name, {}).get('version', 0)}" for name in stored]
+        + [f"{name}:{fingerprint}" for name, fingerprint in zip(local, fingerprints)]
+    )
+    etag = f'W/"{hashlib.sha1(tag_source.encode()).hexdigest()[:20]}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    modified = [v["updated_at"].replace(tzinfo=timezone.utc) for v in versions.values() if v.get("updated_at")]
+    last_modified = max(modified) if modified else None
+    # Last-Modified has one second resolution; it is only safe to hand out once no
+    # later write can fall within the same second
+    if last_modified and datetime.now(timezone.utc) - last_modified >= timedelta(seconds=1):
+        headers["Last-Modified"] = last_modified.strftime("%a, %d %b %Y %H:%M:%S GMT")
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        if etag in [t.strip() for t in if_none_match.split(",")] or if_none_match.strip() == "*":
+            return Response(status_code=304, headers=headers)
+    elif "Last-Modified" in headers and request.headers.get("if-modified-since") == headers["Last-Modified"]:
+        return Response(status_code=304, headers=headers)
+
+    response = await call_next(request)
+    if response.status_code == 200:
+        response.headers.update(headers)
+    return response
+
+def accepted_encoding(accept_encoding: str) -> Optional[str]:
+    offered = set()
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        if params.replace(" ", "") not in ("q=0", "q=0.0"):
+            offered.add(name.strip().lower())
+    if brotli is not None and "br" in offered:
+        return "br"
+    if "gzip" in offered:
+        return "gzip"
+    return None
+
+class CompressionMiddleware:
+    """Brotli (when installed) or gzip for JSON and text responses above COMPRESSION_MIN_BYTES.
+    Images and other already compressed payloads pass through untouched."""
+
+    def __init__(self, app, minimum_size: int = 1000):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        encoding = accepted_encoding(Headers(scope=scope).get("accept-encoding", "")) if scope["type"] == "http" else None
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+        body = []
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start, passthrough
+            if passthrough:
+                await send(message)
+                return
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                content_type = headers.get("content-type", "")
+                if "content-encoding" in headers or not content_type.startswith(COMPRESSIBLE_TYPES):
+                    passthrough = True
+                    await send(message)
+                else:
+                    start = message
+                return
+            body.append(message.get("body", b""))
+            if message.get("more_body", False):
+                return
+            data = b"".join(body)
+            headers = MutableHeaders(raw=start["headers"])
+            if len(data) >= self.minimum_size:
+                if encoding == "br":
+                    data = brotli.compress(data, quality=4)
+                else:
+                    data = gzip.compress(data, compresslevel=6)
+                headers["Content-Encoding"] = encoding
+                headers.add_vary_header("Accept-Encoding")
+            headers["Content-Length"] = str(len(data))
+            await send(start)
+            await send({"type": "http.response.body", "body": data})
+
+        await self.app(scope, receive, send_compressed)
+
+# ==================== ADMISSION CONTROL ====================
+# Requests are sorted into priority classes before they reach a handler. Each class has
+# its own concurrency limit and wait queue per worker, so a burst of report queries
+# can only hold a few event loop slots and pool connections. Warehouse and champ app
+# writes (scans, delivery actions) are never queued. Reporting requests are turned
+# away with 503 + Retry-After instead of queueing behind them: when their own queue is
+# full, when they wait longer than the class timeout, or as soon as
+# ADMISSION_REPORTING_YIELD_AT critical requests are in flight.
+ADMISSION_ENABLED = env_int("ADMISSION_ENABLED", 1) == 1
+ADMISSION_RETRY_AFTER_S = env_int("ADMISSION_RETRY_AFTER_S", 2)
+ADMISSION_REPORTING_YIELD_AT = env_int("ADMISSION_REPORTING_YIELD_AT", 16)
+
+# (class, methods, path pattern); the first match wins, anything else is "default"
+ADMISSION_RULES = [
+    ("critical", {"POST", "PUT"}, re.compile(
+        r"^/api/(logistics/|run-sheets/[^/]+/scan-|champ/|delivery-attempts$|uploads|pickups/[^/]+/(complete|add-delivery))"
+    )),
+    ("critical", {"GET"}, re.compile(r"^/api/(champ/|track/)")),
+    ("reporting", {"GET"}, re.compile(
+        r"^/api/(dashboard/|shipments$|run-sheets$|pickups$|delivery-attempts$|search|geo/nearby/|sla/|archive/"
+        r"|reschedules/|logistics/undelivered|pickups/[^/]+/history)"
+    )),
+    ("reporting", {"POST"}, re.compile(r"^/api/((geo|search)/backfill|archive/run|eta/train)$")),
+]
+
+# class -> (concurrency limit, queue cap, queue timeout ms); a limit of 0 never queues or sheds
+ADMISSION_DEFAULTS = {
+    "critical": (0, 0, 0),
+    "default": (64, 256, 5000),
+    "reporting": (8, 16, 1000),
+}
+
+class AdmissionLane:
+    """Concurrency limit and bounded wait queue for one priority class"""
+
+    def __init__(self, name: str, limit: int, max_queue: int, queue_timeout_ms: int):
+        self.name = name
+        self.limit = limit
+        self.max_queue = max_queue
+        self.queue_timeout_s = queue_timeout_ms / 1000
+        self._slots = asyncio.Semaphore(limit) if limit else None
+        self.in_flight = 0
+        self.queued = 0
+        self.peak_in_flight = 0
+        self.peak_queued = 0
+        self.admitted = 0
+        self.shed: Dict[str, int] = {"queue_full": 0, "timeout": 0, "yield": 0}
+        self.wait_ms_total = 0.0
+        self.service_ms_total = 0.0
+
+    async def acquire(self) -> Optional[str]:
+        """Take a slot; returns the shed reason when the request must be turned away"""
+        if self._slots is not None:
+            if self._slots.locked():
+                if self.queued >= self.max_queue:
+                    return "queue_full"
+                self.queued += 1
+                self.peak_queued = max(self.peak_queued, self.queued)
+                started = time.perf_counter()
+                try:
+                    await asyncio.wait_for(self._slots.acquire(), self.queue_timeout_s)
+                except asyncio.TimeoutError:
+                    return "timeout"
+                finally:
+                    self.queued -= 1
+                self.wait_ms_total += (time.perf_counter() - started) * 1000
+            else:
+                await self._slots.acquire()
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        self.admitted += 1
+        return None
+
+    def release(self, service_ms: float):
+        self.in_flight -= 1
+        self.service_ms_total += service_ms
+        if self._slots is not None:
+            self._slots.release()
+
+    def snapshot(self) -> dict:
+        return {
+            "limit": self.limit or None,
+            "max_queue": self.max_queue,
+            "queue_timeout_ms": round(self.queue_timeout_s * 1000),
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "peak_in_flight": self.peak_in_flight,
+            "peak_queued": self.peak_queued,
+            "admitted": self.admitted,
+            "shed": dict(self.shed),
+            "avg_wait_ms": round(self.wait_ms_total / self.admitted, 2) if self.admitted else 0,
+            "avg_service_ms": round(self.service_ms_total / self.admitted, 2) if self.admitted else 0,
+        }
+
+def build_admission_lanes() -> Dict[str, AdmissionLane]:
+    lanes = {}
+    for name, (limit, max_queue, timeout_ms) in ADMISSION_DEFAULTS.items():
+        prefix = f"ADMISSION_{name.upper()}"
+        lanes[name] = AdmissionLane(
+            name,
+            env_int(f"{prefix}_CONCURRENCY", limit),
+            env_int(f"{prefix}_QUEUE", max_queue),
+            env_int(f"{prefix}_QUEUE_TIMEOUT_MS", timeout_ms)
+        )
+    return lanes
+
+admission_lanes = build_admission_lanes()
+
+def admission_class(method: str, path: str) -> str:
+    for name, methods, pattern in ADMISSION_RULES:
+        if method in methods and pattern.match(path):
+            return name
+    return "default"
+
+class AdmissionMiddleware:
+    """Apply the per-class limits in admission_lanes before a request reaches the app"""
+
+    def __init__(self, app, lanes: Dict[str, AdmissionLane]):
+        self.app = app
+        self.lanes = lanes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] == "OPTIONS":
+            await self.app(scope, receive, send)
+            return
+        lane = self.lanes[admission_class(scope["method"], scope["path"])]
+        if lane.name == "reporting" and ADMISSION_REPORTING_YIELD_AT \
+                and self.lanes["critical"].in_flight >= ADMISSION_REPORTING_YIELD_AT:
+            reason = "yield"
+        else:
+            reason = await lane.acquire()
+        if reason:
+            lane.shed[reason] += 1
+            response = JSONResponse(
+                {"detail": "Server busy, retry shortly", "priority": lane.name},
+                status_code=503,
+                headers={"Retry-After": str(ADMISSION_RETRY_AFTER_S)}
+            )
+            await response(scope, receive, send)
+            return
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            lane.release((time.perf_counter() - started) * 1000)
+
+# ==================== PROFILING ====================
+# Opt-in profiling of individual requests, for finding out why a handler is slow in
+# production. A request is profiled when it carries PROFILE_TOKEN in an X-Profile-Token
+# header, or when it matches a sampling rule set
+# through /api/system/profiling/rules (every Nth matching request, up to a budget).
+# Rules live in the cache backend, so all workers pick them up with a shared CACHE_BACKEND.
+#
+#   sample   - a thread samples the event loop thread's stack every
+#              PROFILE_SAMPLE_INTERVAL_MS and records collapsed stacks for flamegraphs
+#   cprofile - deterministic cProfile, reported as the top functions by cumulative time
+#
+# Both also record tracemalloc peak and top allocation sites. The profilers see the
+# whole event loop thread, so other requests running concurrently show up too; only
+# one profile runs per worker at a time. Results are stored in `profiles` for
+# PROFILE_RETENTION_S and referenced by the X-Profile-Id response header.
+PROFILE_TOKEN = os.environ.get("PROFILE_TOKEN", "")
+PROFILE_SAMPLE_INTERVAL_MS = env_int("PROFILE_SAMPLE_INTERVAL_MS", 2)
+PROFILE_TOP_N = env_int("PROFILE_TOP_N", 40)
+PROFILE_RETENTION_S = env_int("PROFILE_RETENTION_S", 86400)
+PROFILE_RULES_CHECK_S = env_int("PROFILE_RULES_CHECK_S", 5)
+PROFILE_RULES_KEY = "profiling:rules"
+PROFILE_MODES = ("sample", "cprofile")
+
+class StackSampler:
+    """Samples one thread's Python stack from a background thread"""
+
+    def __init__(self, thread_id: int, interval_s: float):
+        self.thread_id = thread_id
+        self.interval_s = interval_s
+        self.stacks: Dict[str, int] = {}
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    @staticmethod
+    def frame_label(frame) -> str:
+        return f"{frame.f_globals.get('__name__', '?')}:{frame.f_code.co_qualname}"
+
+    def _run(self):
+        while not self._stop.wait(self.interval_s):
+            frame = sys._current_frames().get(self.thread_id)
+            names = []
+            while frame is not None:
+                names.append(self.frame_label(frame))
+                frame = frame.f_back
+            if names:
+                stack = ";".join(reversed(names))
+                self.stacks[stack] = self.stacks.get(stack, 0) + 1
+                self.samples += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def collapsed(self) -> str:
+        """Brendan Gregg's collapsed format, as read by flamegraph.pl and speedscope"""
+        return "\n".join(f"{stack} {count}" for stack, count in sorted(self.stacks.items()))
+
+class RequestProfiler:
+    def __init__(self, mode: str):
+        self.mode = mode
+        self._sampler: Optional[StackSampler] = None
+        self._profile: Optional[cProfile.Profile] = None
+        self._owns_tracemalloc = False
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._owns_tracemalloc = True
+        tracemalloc.reset_peak()
+        if self.mode == "cprofile":
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        else:
+            self._sampler = StackSampler(threading.get_ident(), PROFILE_SAMPLE_INTERVAL_MS / 1000)
+            self._sampler.start()
+
+    async def stop(self) -> dict:
+        # cProfile hooks the thread that enabled it, so it is disabled here on the loop
+        # thread; building the report (pstats sorting, the tracemalloc snapshot) takes
+        # long enough on a busy worker that it runs in a thread instead
+        if self._profile is not None:
+            self._profile.disable()
+        return await asyncio.to_thread(self._report)
+
+    def _report(self) -> dict:
+        result: Dict[str, Any] = {}
+        if self._profile is not None:
+            stats = pstats.Stats(self._profile)
+            result["top_functions"] = [
+                {
+                    "function": f"{path}:{line}({name})",
+                    "calls": calls,
+                    "total_ms": round(total * 1000, 3),
+                    "cumulative_ms": round(cumulative * 1000, 3),
+                }
+                for (path, line, name), (_, calls, total, cumulative, _) in sorted(
+                    stats.stats.items(), key=lambda item: item[1][3], reverse=True
+                )[:PROFILE_TOP_N]
+            ]
+        if self._sampler is not None:
+            self._sampler.stop()
+            result["samples"] = self._sampler.samples
+            result["collapsed"] = self._sampler.collapsed()
+        current, peak = tracemalloc.get_traced_memory()
+        top = tracemalloc.take_snapshot().statistics("lineno")[:PROFILE_TOP_N]
+        if self._owns_tracemalloc:
+            tracemalloc.stop()
+        result["memory"] = {
+            "current_bytes": current,
+            "peak_bytes": peak,
+            "top_allocations": [{"site": str(stat.traceback), "bytes": stat.size, "count": stat.count} for stat in top],
+        }
+        return result
+
+class ProfilingRules:
+    """Sampling rules shared through the cache backend: profile 1 in `every` matching requests"""
+
+    def __init__(self):
+        self.rules: List[dict] = []
+        self._counters: Dict[str, int] = {}
+        self._checked_at = 0.0
+
+    async def refresh(self):
+        if time.monotonic() - self._checked_at < PROFILE_RULES_CHECK_S:
+            return
+        self._checked_at = time.monotonic()
+        self.rules = await cache.get(PROFILE_RULES_KEY) or []
+
+    async def save(self, rules: List[dict]):
+        await cache.set(PROFILE_RULES_KEY, rules)
+        self.rules = rules
+        self._checked_at = time.monotonic()
+
+    async def match(self, method: str, path: str) -> Optional[dict]:
+        await self.refresh()
+        for rule in self.rules:
+            if rule["method"] not in ("*", method) or not path.startswith(rule["path"]):
+                continue
+            seen = self._counters.get(rule["id"], 0) + 1
+            self._counters[rule["id"]] = seen
+            if seen % rule["every"] == 0 and seen // rule["every"] <= rule["max_profiles"]:
+                return rule
+        return None
+
+profiling_rules = ProfilingRules()
+_profiling_active = False
+
+def has_profile_token(value: Optional[str]) -> bool:
+    # Compared as bytes: compare_digest rejects str arguments with non-ASCII characters
+    return bool(PROFILE_TOKEN) and value is not None and hmac.compare_digest(value.encode(), PROFILE_TOKEN.encode())
+
+def request_profile_token(request: Request) -> Optional[str]:
+    # Header only: query strings end up in access and proxy logs
+    return request.headers.get("x-profile-token")
+
+def require_profile_token(request: Request):
+    if not has_profile_token(request_profile_token(request)):
+        raise HTTPException(status_code=403, detail="Profiling requires PROFILE_TOKEN")
+
+class ProfilingMiddleware:
+    """Run requests selected by token or sampling rule under a RequestProfiler"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        global _profiling_active
+        if scope["type"] != "http" or not PROFILE_TOKEN:
+            await self.app(scope, receive, send)
+            return
+        request = Request(scope)
+        mode = None
+        rule_id = None
+        if has_profile_token(request_profile_token(request)):
+            mode = request.headers.get("x-profile-mode") or "sample"
+        else:
+            rule = await profiling_rules.match(scope["method"], scope["path"])
+            if rule:
+                mode, rule_id = rule["mode"], rule["id"]
+        if mode not in PROFILE_MODES or _profiling_active:
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = str(uuid.uuid4())
+        status = {}
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                MutableHeaders(raw=message["headers"])["X-Profile-Id"] = profile_id
+            await send(message)
+
+        _profiling_active = True
+        try:
+            profiler = RequestProfiler(mode)
+            started = time.perf_counter()
+            profiler.start()
+            try:
+                await self.app(scope, receive, send_with_id)
+            finally:
+                elapsed_ms = (time.perf_counter() - started) * 1000
+                result = await profiler.stop()
+                await self.store(profile_id, mode, rule_id, scope, request, status.get("code"), elapsed_ms, result)
+        finally:
+            # Reset even when the profiler fails, or this worker would never profile again
+            _profiling_active = False
+
+    async def store(self, profile_id, mode, rule_id, scope, request, status_code, elapsed_ms, result):
+        doc = {
+            "id": profile_id,
+            "mode": mode,
+            "rule_id": rule_id,
+            "method": scope["method"],
+            "path": scope["path"],
+            "query": request.url.query,
+            "status_code": status_code,
+            "duration_ms": round(elapsed_ms, 2),
+            "pid": os.getpid(),
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "expires_at": datetime.now(timezone.utc) + timedelta(seconds=PROFILE_RETENTION_S),
+            **result,
+        }
+        try:
+            await db.profiles.insert_one(doc)
+        except Exception:
+            logger.exception("Could not store profile %s", profile_id)
+
+class ProfilingRule(BaseModel):
+    method: str = "GET"
+    path: str
+    every: int = Field(100, ge=1)
+    max_profiles: int = Field(10, ge=1, le=1000)
+    mode: str = Field("sample", pattern="^(sample|cprofile)$")
+
+# ==================== CHAMP DIRECTORY ====================
+CHAMP_DIRECTORY_CHECK_S = env_int("CHAMP_DIRECTORY_CHECK_S", 5)
+CHAMP_DIRECTORY_VERSION_KEY = "champs:version"
+
+class ChampDirectory:
+    """In-memory champ_id -> champ map, so handlers resolve champ names without a query.
+
+    Loaded at startup and updated in place by this worker's writes. Writes also bump a
+    version in the cache backend; other workers reload when they see it change (checked
+    at most every CHAMP_DIRECTORY_CHECK_S seconds). When the cache backend is per-process
+    other workers' bumps are invisible, so the map is instead reloaded outright once it
+    is LOCAL_CACHE_STALE_S old.
+    """
+
+    def __init__(self):
+        self._champs: Dict[str, dict] = {}
+        self._version = None
+        self._checked_at = 0.0
+        self._loaded_at = 0.0
+        self._fingerprint: Optional[str] = None
+
+    async def load(self):
+        champs = await db.champs.find({}, {"_id": 0}).to_list(None)
+        self._version = await cache.get(CHAMP_DIRECTORY_VERSION_KEY)
+        self._champs = {c["id"]: c for c in champs}
+        self._fingerprint = None
+        self._checked_at = self._loaded_at = time.monotonic()
+
+    async def _refresh_if_stale(self):
+        now = time.monotonic()
+        if not cache_is_shared() and now - self._loaded_at >= LOCAL_CACHE_STALE_S:
+            await self.load()
+            return
+        if now - self._checked_at < CHAMP_DIRECTORY_CHECK_S:
+            return
+        self._checked_at = now
+        if await cache.get(CHAMP_DIRECTORY_VERSION_KEY) != self._version:
+            await self.load()
+
+    async def get(self, champ_id: str) -> Optional[dict]:
+        await self._refresh_if_stale()
+        champ = self._champs.get(champ_id)
+        if champ is None:
+            # Created by another worker since the last reload
+            champ = await db.champs.find_one({"id": champ_id}, {"_id": 0})
+            if champ:
+                self._champs[champ_id] = champ
+                self._fingerprint = None
+        return champ
+
+    async def all(self) -> List[dict]:
+        await self._refresh_if_stale()
+        return list(self._champs.values())
+
+    async def fingerprint(self) -> str:
+        """Hash of the champs this worker holds, for ETags of responses built from them"""
+        await self._refresh_if_stale()
+        if self._fingerprint is None:
+            champs = sorted(self._champs.values(), key=lambda c: c["id"])
+            self._fingerprint = hashlib.sha1(json.dumps(champs, sort_keys=True, default=str).encode()).hexdigest()[:16]
+        return self._fingerprint
+
+    async def put(self, champ: dict):
+        self._champs[champ["id"]] = champ
+        self._fingerprint = None
+        self._version = await cache.incr(CHAMP_DIRECTORY_VERSION_KEY)
+
+champ_directory = ChampDirectory()
+
+CHAMP_NAME_COPIES = ["pickups", "run_sheets", "shopping_history"]
+CHAMP_RENAME_BATCH = env_int("CHAMP_RENAME_BATCH", 500)
+
+@job_handler("champ_rename")
+async def propagate_champ_rename(champ_id: str, name: str):
+    """Rewrite denormalised champ_name copies in batches so no single write runs long.
+
+    The name to write is always re-read from the champ rather than taken from the job:
+    a job queued before a later rename (or overlapping with that rename's own job)
+    would otherwise write the older name back. After a pass the champ is read again
+    and the pass repeats if it was renamed meanwhile, so the last job to finish leaves
+    the current name everywhere.
+    """
+    while True:
+        champ = await db.champs.find_one({"id": champ_id}, {"_id": 0, "name": 1})
+        if not champ:
+            return
+        if champ["name"] != name:
+            logger.info("Champ %s renamed again since this job was queued; propagating the current name", champ_id)
+            name = champ["name"]
+        for collection in CHAMP_NAME_COPIES:
+            updated = 0
+            while True:
+                stale = await db[collection].find(
+                    {"champ_id": champ_id, "champ_name": {"$ne": name}}, {"_id": 1}
+                ).limit(CHAMP_RENAME_BATCH).to_list(CHAMP_RENAME_BATCH)
+                if not stale:
+                    break
+                result = await db[collection].update_many(
+                    {"_id": {"$in": [d["_id"] for d in stale]}, "champ_name": {"$ne": name}},
+                    {"$set": {"champ_name": name}}
+                )
+                updated += result.modified_count
+            if updated:
+                logger.info("Renamed champ %s in %d %s documents", champ_id, updated, collection)
+                await touch(collection)
+        current = await db.champs.find_one({"id": champ_id}, {"_id": 0, "name": 1})
+        if not current or current["name"] == name:
+            return
+
+# ==================== NOTIFICATIONS ====================
+# Status changes write an event to the `notifications` outbox instead of calling an
+# SMS/WhatsApp provider inline. Events for the same recipient that arrive within
+# NOTIFY_COALESCE_S are merged into one message, keeping only the latest event per
+# shipment or pickup, and a dispatch job sends due messages in provider batches
+# under a per-second rate limit. Delivery is at least once: a send the provider
+# rejects is retried with backoff (status "retrying") up to NOTIFY_MAX_ATTEMPTS times
+# before it is marked failed. Request handlers queue events from a background task
+# (notify_soon) so the outbox write is not on their response path.
+NOTIFY_PROVIDER = os.environ.get("NOTIFY_PROVIDER", "log")
+NOTIFY_CHANNEL = os.environ.get("NOTIFY_CHANNEL", "sms")
+NOTIFY_COALESCE_S = env_int("NOTIFY_COALESCE_S", 30)
+NOTIFY_RATE_PER_S = env_int("NOTIFY_RATE_PER_S", 20)
+NOTIFY_MAX_UPDATES = env_int("NOTIFY_MAX_UPDATES", 3)
+NOTIFY_RETENTION_S = env_int("NOTIFY_RETENTION_S", 30 * 24 * 3600)
+NOTIFY_MAX_ATTEMPTS = env_int("NOTIFY_MAX_ATTEMPTS", 5)
+NOTIFY_RETRY_S = env_int("NOTIFY_RETRY_S", 30)
+NOTIFY_RETRY_MAX_S = env_int("NOTIFY_RETRY_MAX_S", 3600)
+# Statuses the dispatcher sends; only "pending" still collects new events
+NOTIFY_SENDABLE = ["pending", "retrying"]
+
+NOTIFICATION_TEMPLATES = {
+    "pickup_assigned": "{champ_name} will collect your {pickup_label} pickup.",
+    "shipment_out_for_delivery": "Shipment {awb} is out for delivery with {champ_name}.",
+    "shipment_delivered": "Shipment {awb} has been delivered.",
+    "shipment_cancelled": "Delivery of shipment {awb} was cancelled.",
+    "shipment_rescheduled": "Delivery of shipment {awb} is rescheduled to {reschedule_date}.",
+}
+
+class _BlankFields(dict):
+    def __missing__(self, key):
+        return ""
+
+def render_notification(events: List[dict]) -> str:
+    """One message for a coalesced set of events: the latest event per subject, oldest first"""
+    latest: Dict[str, dict] = {}
+    for event in events:
+        latest.pop(event["subject"], None)
+        latest[event["subject"]] = event
+    lines = [
+        NOTIFICATION_TEMPLATES[e["event"]].format_map(_BlankFields(e.get("context") or {}))
+        for e in latest.values()
+    ]
+    if len(lines) > NOTIFY_MAX_UPDATES:
+        extra = len(lines) - NOTIFY_MAX_UPDATES
+        lines = lines[:NOTIFY_MAX_UPDATES] + [f"And {extra} more update{'s' if extra > 1 else ''}."]
+    return " ".join(lines)
+
+class NotificationProvider(ABC):
+    """Sends rendered messages; implementations override send_batch"""
+    name = "abstract"
+    max_batch = 100
+
+    @abstractmethod
+    async def send_batch(self, messages: List[dict]) -> List[Optional[str]]:
+        """Send [{"to", "channel", "body"}]; return an error message or None for each"""
+
+class LogNotificationProvider(NotificationProvider):
+    """Writes messages to the application log; the default until a gateway is configured"""
+    name = "log"
+
+    async def send_batch(self, messages: List[dict]) -> List[Optional[str]]:
+        for message in messages:
+            logger.info("Notification %s to %s: %s", message["channel"], message["to"], message["body"])
+        return [None] * len(messages)
+
+class FakeNotificationProvider(NotificationProvider):
+    """Keeps the most recent messages in memory so tests and local runs can inspect them"""
+    name = "fake"
+
+    def __init__(self, keep: int = 1000):
+        self.sent = deque(maxlen=keep)
+        self.batches = 0
+
+    async def send_batch(self, messages: List[dict]) -> List[Optional[str]]:
+        self.batches += 1
+        sent_at = datetime.now(timezone.utc).isoformat()
+        self.sent.extend({**m, "sent_at": sent_at} for m in messages)
+        return [None] * len(messages)
+
+NOTIFICATION_PROVIDERS: Dict[str, Callable[[], NotificationProvider]] = {
+    "log": LogNotificationProvider,
+    "fake": FakeNotificationProvider,
+}
+
+def build_notification_provider(name: str) -> Optional[NotificationProvider]:
+    if name == "none":
+        return None
+    if name not in NOTIFICATION_PROVIDERS:
+        raise ValueError(f"Unknown NOTIFY_PROVIDER: {name}")
+    return NOTIFICATION_PROVIDERS[name]()
+
+notification_provider = build_notification_provider(NOTIFY_PROVIDER)
+
+async def notify(event: str, to: Optional[str], subject: str, **context):
+    """Queue a notification event; never raises, so callers' writes are unaffected by outbox trouble.
+    Events without a template (e.g. shipment_no_response) are not sent."""
+    recipient = phone_digits(to)
+    if notification_provider is None or not recipient or event not in NOTIFICATION_TEMPLATES:
+        return
+    now = datetime.now(timezone.utc)
+    entry = {"event": event, "subject": subject, "context": context, "at": now}
+    for _ in range(2):
+        try:
+            # At most one pending notification per recipient (partial unique index);
+            # a second concurrent insert loses the race and joins the winner's on retry
+            result = await db.notifications.update_one(
+                {"recipient": recipient, "channel": NOTIFY_CHANNEL, "status": "pending"},
+                {
+                    "$push": {"events": entry},
+                    "$setOnInsert": {
+                        "id": str(uuid.uuid4()),
+                        "to": to,
+                        "send_after": now + timedelta(seconds=NOTIFY_COALESCE_S),
+                        "created_at": now
+                    }
+                },
+                upsert=True
+            )
+            if result.upserted_id is not None:
+                await enqueue_job("notifications_dispatch", delay_s=NOTIFY_COALESCE_S)
+            return
+        except DuplicateKeyError:
+            continue
+        except Exception:
+            logger.exception("Could not queue %s notification for %s", event, subject)
+            return
+
+_notify_tasks: Set[asyncio.Task] = set()
+
+def notify_soon(event: str, to: Optional[str], subject: str, **context):
+    """notify() from a background task, for request handlers that should not wait on the outbox"""
+    task = asyncio.create_task(notify(event, to, subject, **context))
+    _notify_tasks.add(task)
+    task.add_done_callback(_notify_tasks.discard)
+
+async def drain_notifications():
+    """Let queued notify_soon() writes land before shutdown"""
+    if _notify_tasks:
+        await asyncio.gather(*_notify_tasks, return_exceptions=True)
+
+def notify_backoff(attempts: int) -> float:
+    delay = min(NOTIFY_RETRY_MAX_S, NOTIFY_RETRY_S * 2 ** (attempts - 1))
+    return delay * random.uniform(0.5, 1.0)
+
+async def take_send_tokens(provider: NotificationProvider, wanted: int) -> int:
+    """Fixed one-second window shared through the cache backend; returns how many sends are allowed now"""
+    used = await cache.incr(f"notify:rate:{provider.name}:{int(time.time())}", wanted, ttl=2)
+    return max(0, min(wanted, NOTIFY_RATE_PER_S - (used - wanted)))
+
+@job_handler("notifications_dispatch")
+async def dispatch_notifications():
+    provider = notification_provider
+    if provider is None:
+        return
+    now = datetime.now(timezone.utc)
+    # Sends interrupted by a dead worker go out again. They are requeued as "retrying"
+    # rather than "pending", which may already be taken by a newer message for the recipient.
+    await db.notifications.update_many(
+        {"status": "sending", "claimed_at": {"$lte": now - timedelta(seconds=JOB_VISIBILITY_TIMEOUT_S)}},
+        {"$set": {"status": "retrying"}}
+    )
+    due = await db.notifications.find(
+        {"status": {"$in": NOTIFY_SENDABLE}, "send_after": {"$lte": now}}, {"_id": 0, "id": 1}
+    ).sort("send_after", 1).limit(provider.max_batch).to_list(provider.max_batch)
+    if not due:
+        return
+    granted = await take_send_tokens(provider, len(due))
+    if granted:
+        claim = str(uuid.uuid4())
+        await db.notifications.update_many(
+            {"id": {"$in": [d["id"] for d in due[:granted]]}, "status": {"$in": NOTIFY_SENDABLE}},
+            {"$set": {"status": "sending", "claim": claim, "claimed_at": now}}
+        )
+        claimed = await db.notifications.find({"claim": claim}, {"_id": 0}).to_list(None)
+        messages = [
+            {"to": n["to"], "channel": n["channel"], "body": render_notification(n["events"])}
+            for n in claimed
+        ]
+        try:
+            errors = await provider.send_batch(messages)
+        except Exception:
+            # The job itself is retried with backoff
+            await db.notifications.update_many({"claim": claim}, {"$set": {"status": "retrying"}})
+            raise
+        sent_at = datetime.now(timezone.utc)
+        ops, retry_delays = [], []
+        for n, message, error in zip(claimed, messages, errors):
+            attempts = n.get("attempts", 0) + 1
+            update = {"body": message["body"], "error": error, "attempts": attempts}
+            if error and attempts < NOTIFY_MAX_ATTEMPTS:
+                delay = notify_backoff(attempts)
+                retry_delays.append(delay)
+                update.update(status="retrying", send_after=sent_at + timedelta(seconds=delay))
+            else:
+                update.update(
+                    status="failed" if error else "sent",
+                    sent_at=sent_at,
+                    expires_at=sent_at + timedelta(seconds=NOTIFY_RETENTION_S)
+                )
+            ops.append(UpdateOne({"id": n["id"]}, {"$set": update}))
+        await db.notifications.bulk_write(ops, ordered=False)
+        if retry_delays:
+            await enqueue_job("notifications_dispatch", delay_s=min(retry_delays))
+    if granted < len(due) or len(due) == provider.max_batch:
+        # Throttled or more waiting: continue in the next rate window
+        await enqueue_job("notifications_dispatch", delay_s=1)
+
+@job_handler("notify_pickups_assigned")
+async def notify_pickups_assigned(pickup_ids: List[str]):
+    pickups = await db.pickups.find({"id": {"$in": pickup_ids}}, {"_id": 0}).to_list(None)
+    for pickup in pickups:
+        await notify(**pickup_assigned_event(pickup))
+
+def pickup_assigned_event(pickup: dict) -> dict:
+    return {
+        "event": "pickup_assigned",
+        "to": pickup.get("customer_phone") or pickup.get("seller_phone"),
+        "subject": pickup["id"],
+        "champ_name": pickup.get("champ_name"),
+        "pickup_label": pickup["pickup_type"].replace("_", " "),
+    }
+
+@job_handler("notify_run_sheet_out")
+async def notify_run_sheet_out(run_sheet_id: str, champ_name: str):
+    cursor = db.shipments.find(
+        {"run_sheet_id": run_sheet_id, "status": ShipmentStatus.OUT_FOR_DELIVERY.value},
+        {"_id": 0, "awb": 1, "recipient_phone": 1}
+    )
+    async for shipment in cursor:
+        await notify(
+            "shipment_out_for_delivery", shipment.get("recipient_phone"), shipment["awb"],
+            awb=shipment["awb"], champ_name=champ_name
+        )
+
+# ==================== PROOF IMAGES ====================
+PROOF_IMAGE_MAX_BYTES = env_int("PROOF_IMAGE_MAX_BYTES", 10 * 1024 * 1024)
+PROOF_IMAGE_MAX_PIXELS = env_int("PROOF_IMAGE_MAX_PIXELS", 50_000_000)
+PROOF_IMAGE_MAX_DIM = env_int("PROOF_IMAGE_MAX_DIM", 1600)
+PROOF_THUMBNAIL_DIM = env_int("PROOF_THUMBNAIL_DIM", 256)
+PROOF_IMAGE_QUALITY = env_int("PROOF_IMAGE_QUALITY", 75)
+PROOF_IMAGE_FORMAT = os.environ.get("PROOF_IMAGE_FORMAT", "JPEG").upper()
+if PROOF_IMAGE_FORMAT not in image_pipeline.MIME_TYPES:
+    raise ValueError(f"Unknown PROOF_IMAGE_FORMAT: {PROOF_IMAGE_FORMAT} (expected one of {', '.join(image_pipeline.MIME_TYPES)})")
+PROOF_IMAGE_WORKERS = env_int("PROOF_IMAGE_WORKERS", min(2, os.cpu_count() or 1))
+# Max-age for a full image served in place of a thumbnail that may exist later
+PROOF_FALLBACK_MAX_AGE_S = env_int("PROOF_FALLBACK_MAX_AGE_S", 300)
+
+_image_executor: Optional[ProcessPoolExecutor] = None
+
+def image_executor() -> ProcessPoolExecutor:
+    global _image_executor
+    if _image_executor is None:
+        # spawn, not fork: forking a process that runs Motor's threads can inherit held locks
+        _image_executor = ProcessPoolExecutor(
+            max_workers=PROOF_IMAGE_WORKERS,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+    return _image_executor
+
+async def shutdown_image_executor():
+    """Wait for in-flight image jobs without blocking the event loop"""
+    global _image_executor
+    if _image_executor is not None:
+        executor, _image_executor = _image_executor, None
+        await asyncio.to_thread(executor.shutdown, wait=True)
+
+async def ingest_proof_image(value: Optional[str]) -> dict:
+    """Size-check, downscale and thumbnail a base64 proof photo in the image process pool.
+
+    Returns {"image", "thumbnail", "meta"}; empty for no image. Without Pillow the image
+    is stored as received, after the size check.
+    """
+    if not value:
+        return {}
+    _, payload = image_pipeline.split_data_url(value)
+    size = image_pipeline.decoded_size(payload)
+    if size > PROOF_IMAGE_MAX_BYTES:
+        raise HTTPException(status_code=413, detail=f"Proof image is {size} bytes, limit is {PROOF_IMAGE_MAX_BYTES}")
+    if image_pipeline.Image is None:
+        return {"image": value, "thumbnail": None, "meta": {"bytes": size}}
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(
+            image_executor(),
+            image_pipeline.process_proof_image,
+            payload, PROOF_IMAGE_MAX_DIM, PROOF_THUMBNAIL_DIM, PROOF_IMAGE_QUALITY,
+            PROOF_IMAGE_FORMAT, PROOF_IMAGE_MAX_PIXELS
+        )
+    except ProofImageError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+def proof_fields(prefix: str, proof: dict) -> dict:
+    """Document fields for a stored proof: inline data URLs or an uploaded GridFS file"""
+    return {
+        f"{prefix}_image": proof.get("image"),
+        f"{prefix}_thumbnail": proof.get("thumbnail"),
+        f"{prefix}_meta": proof.get("meta"),
+        f"{prefix}_file_id": proof.get("file_id"),
+    }
+
+async def store_proof(owner: str, proof: dict) -> Optional[str]:
+    """Save a proof once in `proofs` and return the id documents reference it by"""
+    if not proof:
+        return None
+    doc = {
+        "id": str(uuid.uuid4()),
+        "owner": owner,
+        "image": proof.get("image"),
+        "thumbnail": proof.get("thumbnail"),
+        "file_id": proof.get("file_id"),
+        "meta": proof.get("meta"),
+        "created_at": datetime.now(timezone.utc).isoformat()
+    }
+    await db.proofs.insert_one(doc)
+    await enqueue_proof_thumbnail(proof, "proofs", doc["id"], "thumbnail")
+    return doc["id"]
+
+# ==================== BIN LOCATION ROUTES ====================
+@api_router.post("/bin-locations", response_model=BinLocation)
+@touches("bin_locations")
+async def create_bin_location(input: BinLocationCreate):
+    bin_loc = BinLocation(**input.model_dump())
+    doc = prepare_doc_for_db(bin_loc.model_dump())
+    await db.bin_locations.insert_one(doc)
+    await invalidate_reference("bins")
+    return bin_loc
+
+@api_router.get("/bin-locations", response_model=List[BinLocation])
+async def get_bin_locations(route: Optional[str] = None):
+    locations = await get_reference("bins")
+    if route:
+        locations = [loc for loc in locations if loc["route"] == route]
+    return locations
+
+@api_router.get("/bin-locations/{bin_id}", response_model=BinLocation)
+async def get_bin_location(bin_id: str):
+    location = await db.bin_locations.find_one({"id": bin_id}, {"_id": 0})
+    if not location:
+        raise HTTPException(status_code=404, detail="Bin location not found")
+    return location
+
+# ==================== CHAMP ROUTES ====================
+@api_router.post("/champs", response_model=Champ)
+@touches("champs")
+async def create_champ(input: ChampCreate):
+    champ = Champ(**input.model_dump())
+    doc = prepare_doc_for_db(champ.model_dump())
+    await db.champs.insert_one(doc)
+    doc.pop("_id", None)
+    await champ_directory.put(doc)
+    return champ
+
+@api_router.get("/champs", response_model=List[Champ])
+async def get_champs(is_active: Optional[bool] = None):
+    champs = await champ_directory.all()
+    if is_active is not None:
+        champs = [c for c in champs if c.get("is_active", True) == is_active]
+    return champs
+
+@api_router.get("/champs/{champ_id}", response_model=Champ)
+async def get_champ(champ_id: str):
+    champ = await champ_directory.get(champ_id)
+    if not champ:
+        raise HTTPException(status_code=404, detail="Champ not found")
+    return champ
+
+@api_router.put("/champs/{champ_id}", response_model=Champ)
+@touches("champs")
+async def update_champ(champ_id: str, input: ChampCreate):
+    previous = await db.champs.find_one_and_update(
+        {"id": champ_id},
+        {"$set": input.model_dump()},
+        projection={"_id": 0}
+    )
+    if previous is None:
+        raise HTTPException(status_code=404, detail="Champ not found")
+    champ = {**previous, **input.model_dump()}
+    await champ_directory.put(champ)
+    if previous.get("name") != input.name:
+        await enqueue_job("champ_rename", champ_id=champ_id, name=input.name)
+    return champ
+
+# ==================== SHIPMENT ROUTES ====================
+async def existing_awbs(awbs: List[str]) -> Set[str]:
+    """AWBs already used by a live or archived shipment; archiving must not free an AWB for reuse"""
+    found = set()
+    for collection in (db.shipments, db.shipments_archive):
+        missing = [awb for awb in awbs if awb not in found]
+        if not missing:
+            break
+        docs = await collection.find({"awb": {"$in": missing}}, {"_id": 0, "awb": 1}).to_list(None)
+        found.update(d["awb"] for d in docs)
+    return found
+
+@api_router.post("/shipments", response_model=Shipment)
+@touches("shipments")
+async def create_shipment(input: ShipmentCreate):
+    if await existing_awbs([input.awb]):
+        raise HTTPException(status_code=400, detail="AWB already exists")
+    
+    shipment = Shipment(**input.model_dump())
+    await db.shipments.insert_one(shipment_doc(shipment))
+    return shipment
+
+@api_router.post("/shipments/bulk", response_model=List[Shipment])
+@touches("shipments")
+async def create_shipments_bulk(inputs: List[ShipmentCreate]):
+    shipments = []
+    taken = await existing_awbs([input.awb for input in inputs])
+    for input in inputs:
+        if input.awb not in taken:
+            shipment = Shipment(**input.model_dump())
+            await db.shipments.insert_one(shipment_doc(shipment))
+            shipments.append(shipment)
+            taken.add(input.awb)
+    return shipments
+
+@api_router.get("/shipments", response_model=List[Shipment])
+async def get_shipments(
+    status: Optional[ShipmentStatus] = None,
+    route: Optional[str] = None,
+    champ_id: Optional[str] = None,
+    bin_location_id: Optional[str] = None,
+    inscan_date_from: Optional[str] = None,
+    inscan_date_to: Optional[str] = None
+):
+    query = {}
+    if status:
+        query["status"] = status.value
+    if route:
+        query["route"] = route
+    if champ_id:
+        query["champ_id"] = champ_id
+    if bin_location_id:
+        query["bin_location_id"] = bin_location_id
+    
+    # Date range filter for inscan_date
+    if inscan_date_from or inscan_date_to:
+        date_query = {}
+        if inscan_date_from:
+            date_query["$gte"] = inscan_date_from
+        if inscan_date_to:
+            date_query["$lte"] = inscan_date_to
+        if date_query:
+            query["inscan_date"] = date_query
+    
+    shipments = await reporting_db.shipments.find(query, model_projection(Shipment)).sort("created_at", -1).to_list(1000)
+    return list_response(Shipment, shipments)
+
+@api_router.get("/shipments/{shipment_id}", response_model=Shipment)
+async def get_shipment(shipment_id: str):
+    shipment = await find_shipment({"id": shipment_id})
+    if not shipment:
+        raise HTTPException(status_code=404, detail="Shipment not found")
+    return shipment
+
+@api_router.get("/shipments/awb/{awb}", response_model=Shipment)
+async def get_shipment_by_awb(awb: str):
+    shipment = await find_shipment({"awb": awb})
+    if not shipment:
+        raise HTTPException(status_code=404, detail="Shipment not found")
+    return shipment
+
+@api_router.put("/shipments/{shipment_id}", response_model=Shipment)
+@touches("shipments")
+async def update_shipment(shipment_id: str, input: ShipmentUpdate):
+    update_data = {k: v for k, v in input.model_dump().items() if v is not None}
+    update_data["updated_at"] = datetime.now(timezone.utc).isoformat()
+    if "rescheduled_date" in update_data:
+        update_data.update(reschedule_fields(update_data["rescheduled_date"]))
+    
+    result = await db.shipments.update_one(
+        {"id": shipment_id},
+        {"$set": update_data}
+    )
+    if result.matched_count == 0:
+        raise HTTPException(status_code=404, detail="Shipment not found")
+    return await get_shipment(shipment_id)
+
+# ==================== LOGISTICS OPERATIONS ====================
+
+# Step 1: In-Scan shipment (Warehouse to Logistics)
+@api_router.post("/logistics/in-scan/{awb}", response_model=Shipment)
+@touches("shipments")
+async def in_scan_shipment(awb: str):
+    shipment = await db.shipments.find_one({"awb": awb}, {"_id": 0})
+    if not shipment:
+        raise HTTPException(status_code=404, detail="Shipment not found")
+    
+    if shipment["status"] != ShipmentStatus.PENDING_HANDOVER.value:
+        raise HTTPException(status_code=400, detail=f"Shipment already in status: {shipment['status']}")
+    
+    now = datetime.now(timezone.utc)
+    await shipment_writes.update_one(
+        {"awb": awb},
+        {"$set": {
+            "status": ShipmentStatus.IN_SCANNED.value,
+            "inscan_date": now.strftime("%Y-%m-%d"),
+            "inscan_time": now.strftime("%H:%M:%S"),
+            "updated_at": now.isoformat()
+        }}
+    )
+    return await get_shipment_by_awb(awb)
+
+# Step 2: Assign to Bin Location based on Route
+@api_router.post("/logistics/assign-bin", response_model=List[Shipment])
+@touches("shipments")
+async def assign_to_bin(shipment_ids: List[str], bin_location_id: str):
+    # Verify bin location exists
+    bin_loc = await db.bin_locations.find_one({"id": bin_location_id}, {"_id": 0})
+    if not bin_loc:
+        raise HTTPException(status_code=404, detail="Bin location not found")
+    
+    now = datetime.now(timezone.utc).isoformat()
+    moved, errors = [], []
+    # One WRITE_BATCH_MAX_OPS chunk in flight at a time: a large request can't take every
+    # pool connection when updates go out directly, and with batching each chunk fills one batch
+    for start in range(0, len(shipment_ids), WRITE_BATCH_MAX_OPS):
+        chunk = shipment_ids[start:start + WRITE_BATCH_MAX_OPS]
+        results = await asyncio.gather(*[
+            shipment_writes.update_one(
+                {"id": sid, "status": ShipmentStatus.IN_SCANNED.value},
+                {"$set": {
+                    "bin_location_id": bin_location_id,
+                    "status": ShipmentStatus.ASSIGNED_TO_BIN.value,
+                    "updated_at": now
+                }}
+            )
+            for sid in chunk
+        ], return_exceptions=True)
+        for sid, result in zip(chunk, results):
+            if isinstance(result, Exception):
+                errors.append((sid, result))
+            elif result.modified_count > 0:
+                moved.append(sid)
+    if errors:
+        logger.warning("assign-bin: %d of %d updates failed, first for %s: %r",
+                       len(errors), len(shipment_ids), errors[0][0], errors[0][1])
+        if not moved:
+            raise errors[0][1]
+    # Shipments whose update failed are left IN_SCANNED and, like those in any other
+    # status, are simply missing from the response; the caller retries them
+    updated_shipments = []
+    if moved:
+        # Queued before reading the moved shipments back, so the bin is recounted even if that read fails
+        await enqueue_bin_count(bin_location_id)
+        by_id = {doc["id"]: doc for doc in await db.shipments.find({"id": {"$in": moved}}, {"_id": 0}).to_list(None)}
+        updated_shipments = [by_id[sid] for sid in moved if sid in by_id]
+    
+    return updated_shipments
+
+async def enqueue_bin_count(bin_location_id: str):
+    # Keyed, so a burst of moves for one bin queues a single recount
+    await enqueue_job("bin_count", key=f"bin_count:{bin_location_id}", bin_location_id=bin_location_id)
+
+@job_handler("bin_count")
+async def update_bin_count(bin_location_id: str, delta: int = 0):
+    """Recount the shipments sitting in a bin. A recount rather than an $inc, so a job
+    that runs twice (its lease expired mid-run and it was re-claimed) cannot double count.
+    `delta` is accepted only so jobs queued before this change still run."""
+    count = await db.shipments.count_documents({
+        "bin_location_id": bin_location_id, "status": ShipmentStatus.ASSIGNED_TO_BIN.value
+    })
+    result = await db.bin_locations.update_one(
+        {"id": bin_location_id, "current_count": {"$ne": count}},
+        {"$set": {"current_count": count}}
+    )
+    if result.modified_count:
+        await touch("bin_locations")
+
+# Step 3: Assign to Champ (AWB wise)
+@api_router.post("/logistics/assign-champ", response_model=List[Shipment])
+@touches("shipments")
+async def assign_to_champ(shipment_ids: List[str], champ_id: str):
+    # Verify champ exists
+    champ = await champ_directory.get(champ_id)
+    if not champ:
+        raise HTTPException(status_code=404, detail="Champ not found")
+    
+    updated_shipments = []
+    for sid in shipment_ids:
+        result = await db.shipments.update_one(
+            {"id": sid, "status": {"$in": [ShipmentStatus.ASSIGNED_TO_BIN.value, ShipmentStatus.RESCHEDULED.value, ShipmentStatus.RETURNED_TO_WH.value]}},
+            {"$set": {
+                "champ_id": champ_id,
+                "status": ShipmentStatus.ASSIGNED_TO_CHAMP.value,
+                "updated_at": datetime.now(timezone.utc).isoformat()
+            }}
+        )
+        if result.modified_count > 0:
+            shipment = await db.shipments.find_one({"id": sid}, {"_id": 0})
+            updated_shipments.append(shipment)
+    
+    for bin_location_id in {s.get("bin_location_id") for s in updated_shipments} - {None}:
+        await enqueue_bin_count(bin_location_id)
+    
+    return updated_shipments
+
+# ==================== RUN SHEET ROUTES ====================
+
+# Step 4: Generate Run Sheet
+@api_router.post("/run-sheets", response_model=RunSheet)
+@touches("run_sheets", "shipments")
+async def create_run_sheet(input: RunSheetCreate):
+    # Verify champ exists
+    champ = await champ_directory.get(input.champ_id)
+    if not champ:
+        raise HTTPException(status_code=404, detail="Champ not found")
+    
+    # Get shipments and calculate totals
+    shipments = await db.shipments.find(
+        {"id": {"$in": input.shipment_ids}, "champ_id": input.champ_id},
+        {"_id": 0}
+    ).to_list(1000)
     
     if not shipments:
         raise HTTPException(status_code=400, detail="No valid shipments found for this champ")
@@ -564,11 +2399,10 @@ async def create_run_sheet(input: RunSheetCreate):
     await db.run_sheets.insert_one(doc)
     
     # Update shipments with run sheet ID
-    for s in shipments:
-        await db.shipments.update_one(
-            {"id": s["id"]},
-            {"$set": {"run_sheet_id": run_sheet.id}}
-        )
+    await db.shipments.update_many(
+        {"id": {"$in": run_sheet.shipment_ids}},
+        {"$set": {"run_sheet_id": run_sheet.id}}
+    )
     
     return run_sheet
 
@@ -583,8 +2417,8 @@ async def get_run_sheets(champ_id: Optional[str] = None, is_active: Optional[boo
         else:
             query["is_scanned_in"] = True
     
-    run_sheets = await db.run_sheets.find(query, {"_id": 0}).to_list(1000)
-    return run_sheets
+    run_sheets = await reporting_db.run_sheets.find(query, model_projection(RunSheet)).to_list(1000)
+    return list_response(RunSheet, run_sheets)
 
 @api_router.get("/run-sheets/{run_sheet_id}", response_model=RunSheet)
 async def get_run_sheet(run_sheet_id: str):
@@ -593,9 +2427,49 @@ async def get_run_sheet(run_sheet_id: str):
         raise HTTPException(status_code=404, detail="Run sheet not found")
     return run_sheet
 
+# Parcels that can come back to the warehouse on scan-in
+RETURNABLE_SHIPMENT_STATUSES = [
+    ShipmentStatus.OUT_FOR_DELIVERY.value,
+    ShipmentStatus.CANCELLED.value,
+    ShipmentStatus.NO_RESPONSE.value,
+]
+
+async def scan_manifest(run_sheet: dict, awbs: List[str]) -> tuple:
+    """Load the run sheet's shipments and every scanned AWB in one query.
+
+    Returns (on_sheet, scanned, report): shipments on the run sheet by AWB, the set of
+    scanned AWBs, and the parts of the reconciliation that don't depend on the gate:
+    `foreign` parcels belong to another run sheet (or none), `extra` AWBs are unknown.
+    """
+    cleaned = [a.strip() for a in awbs if a.strip()]
+    scanned = set(cleaned)
+    docs = await db.shipments.find(
+        {"$or": [{"id": {"$in": run_sheet["shipment_ids"]}}, {"awb": {"$in": list(scanned)}}]},
+        {"_id": 0, "id": 1, "awb": 1, "status": 1}
+    ).to_list(None)
+    sheet_ids = set(run_sheet["shipment_ids"])
+    on_sheet = {d["awb"]: d for d in docs if d["id"] in sheet_ids}
+    known = {d["awb"] for d in docs}
+    report = {
+        "scanned": len(scanned),
+        "duplicate_scans": len(cleaned) - len(scanned),
+        "foreign": sorted((scanned & known) - on_sheet.keys()),
+        "extra": sorted(scanned - known),
+        "at": datetime.now(timezone.utc).isoformat(),
+    }
+    return on_sheet, scanned, report
+
+def check_strict(report: dict, strict: bool, *fields: str):
+    if strict and any(report[f] for f in fields):
+        raise HTTPException(status_code=409, detail={"message": "Scan does not match the run sheet", "report": report})
+
 # Step 5: Scan Run Sheet at Outbound Security
 @api_router.post("/run-sheets/{run_sheet_id}/scan-out", response_model=RunSheet)
-async def scan_out_run_sheet(run_sheet_id: str):
+@touches("run_sheets", "shipments")
+async def scan_out_run_sheet(run_sheet_id: str, manifest: Optional[RunSheetScan] = None, strict: bool = False):
+    """Scan a run sheet out. With a manifest of gate-scanned AWBs only the parcels that
+    were scanned go out for delivery; missing, foreign and unknown ones are reported.
+    `strict` rejects the scan (409) instead when anything doesn't match."""
     run_sheet = await db.run_sheets.find_one({"id": run_sheet_id}, {"_id": 0})
     if not run_sheet:
         raise HTTPException(status_code=404, detail="Run sheet not found")
@@ -603,39 +2477,77 @@ async def scan_out_run_sheet(run_sheet_id: str):
     if run_sheet["is_scanned_out"]:
         raise HTTPException(status_code=400, detail="Run sheet already scanned out")
     
-    await db.run_sheets.update_one(
-        {"id": run_sheet_id},
-        {"$set": {
-            "is_scanned_out": True,
-            "scanned_out_at": datetime.now(timezone.utc).isoformat()
-        }}
+    now = datetime.now(timezone.utc).isoformat()
+    run_sheet_update = {"is_scanned_out": True, "scanned_out_at": now}
+    shipment_query = {"run_sheet_id": run_sheet_id}
+    if manifest is not None:
+        on_sheet, scanned, report = await scan_manifest(run_sheet, manifest.awbs)
+        verified = scanned & on_sheet.keys()
+        report["verified"] = sorted(verified)
+        report["missing"] = sorted(on_sheet.keys() - scanned)
+        check_strict(report, strict, "missing", "foreign", "extra")
+        run_sheet_update["scan_out_report"] = report
+        shipment_query["id"] = {"$in": [on_sheet[awb]["id"] for awb in verified]}
+    
+    # The is_scanned_out condition makes a second gate scan racing this one a no-op
+    result = await db.run_sheets.update_one(
+        {"id": run_sheet_id, "is_scanned_out": False},
+        {"$set": run_sheet_update}
     )
+    if result.modified_count == 0:
+        raise HTTPException(status_code=400, detail="Run sheet already scanned out")
     
-    # Update all shipments to out for delivery
+    # Update shipments (all, or the verified ones) to out for delivery
     await db.shipments.update_many(
-        {"run_sheet_id": run_sheet_id},
+        shipment_query,
         {"$set": {
             "status": ShipmentStatus.OUT_FOR_DELIVERY.value,
-            "updated_at": datetime.now(timezone.utc).isoformat()
+            "updated_at": now
         }}
     )
+    await enqueue_job("notify_run_sheet_out", run_sheet_id=run_sheet_id, champ_name=run_sheet["champ_name"])
     
     return await get_run_sheet(run_sheet_id)
 
 # Step 8: Scan Run Sheet on Return
 @api_router.post("/run-sheets/{run_sheet_id}/scan-in", response_model=RunSheet)
-async def scan_in_run_sheet(run_sheet_id: str):
+@touches("run_sheets", "shipments")
+async def scan_in_run_sheet(run_sheet_id: str, manifest: Optional[RunSheetScan] = None, strict: bool = False):
+    """Scan a run sheet back in. With a manifest of the AWBs that came back, undelivered
+    parcels that were scanned return to the warehouse; undelivered parcels that weren't
+    scanned are reported `missing`, and scanned parcels recorded as delivered `delivered`."""
     run_sheet = await db.run_sheets.find_one({"id": run_sheet_id}, {"_id": 0})
     if not run_sheet:
         raise HTTPException(status_code=404, detail="Run sheet not found")
     
+    now = datetime.now(timezone.utc).isoformat()
+    run_sheet_update = {"is_scanned_in": True, "scanned_in_at": now}
+    returned_ids = []
+    if manifest is not None:
+        on_sheet, scanned, report = await scan_manifest(run_sheet, manifest.awbs)
+        delivered = {awb for awb, s in on_sheet.items() if s["status"] == ShipmentStatus.DELIVERED.value}
+        expected = on_sheet.keys() - delivered
+        report["verified"] = sorted(scanned & expected)
+        report["missing"] = sorted(expected - scanned)
+        report["delivered"] = sorted(scanned & delivered)
+        check_strict(report, strict, "missing", "delivered", "foreign", "extra")
+        run_sheet_update["scan_in_report"] = report
+        returned_ids = [on_sheet[awb]["id"] for awb in scanned & expected]
+    
     await db.run_sheets.update_one(
         {"id": run_sheet_id},
-        {"$set": {
-            "is_scanned_in": True,
-            "scanned_in_at": datetime.now(timezone.utc).isoformat()
-        }}
+        {"$set": run_sheet_update}
     )
+    if returned_ids:
+        await db.shipments.update_many(
+            {"id": {"$in": returned_ids}, "status": {"$in": RETURNABLE_SHIPMENT_STATUSES}},
+            {"$set": {
+                "status": ShipmentStatus.RETURNED_TO_WH.value,
+                "champ_id": None,
+                "run_sheet_id": None,
+                "updated_at": now
+            }}
+        )
     
     return await get_run_sheet(run_sheet_id)
 
@@ -643,6 +2555,7 @@ async def scan_in_run_sheet(run_sheet_id: str):
 
 # Step 6 & 7: Record Delivery Attempt
 @api_router.post("/delivery-attempts", response_model=DeliveryAttempt)
+@touches("delivery_attempts", "shipments")
 async def create_delivery_attempt(input: DeliveryAttemptCreate):
     # Verify shipment exists
     shipment = await db.shipments.find_one({"id": input.shipment_id}, {"_id": 0})
@@ -654,6 +2567,9 @@ async def create_delivery_attempt(input: DeliveryAttemptCreate):
     if not run_sheet:
         raise HTTPException(status_code=404, detail="Run sheet not found")
     
+    if input.outcome == DeliveryOutcome.RESCHEDULED:
+        checked_reschedule_day(input.rescheduled_date)
+    
     attempt = DeliveryAttempt(
         **input.model_dump(),
         champ_id=run_sheet["champ_id"]
@@ -675,7 +2591,7 @@ async def create_delivery_attempt(input: DeliveryAttemptCreate):
     elif input.outcome == DeliveryOutcome.RESCHEDULED:
         new_status = ShipmentStatus.RESCHEDULED.value
         if input.rescheduled_date:
-            update_data["rescheduled_date"] = input.rescheduled_date
+            update_data.update(reschedule_fields(input.rescheduled_date))
     
     if new_status:
         update_data["status"] = new_status
@@ -703,13 +2619,200 @@ async def get_delivery_attempts(
     if champ_id:
         query["champ_id"] = champ_id
     
-    attempts = await db.delivery_attempts.find(query, {"_id": 0}).to_list(1000)
-    return attempts
+    attempts = await reporting_db.delivery_attempts.find(query, model_projection(DeliveryAttempt)).to_list(1000)
+    if not attempts and shipment_id:
+        # Attempts move to the archive together with their shipment
+        attempts = await reporting_db.delivery_attempts_archive.find(query, model_projection(DeliveryAttempt)).to_list(1000)
+    return list_response(DeliveryAttempt, attempts)
+
+# ==================== RESCHEDULE QUEUE ====================
+# Rescheduled shipments wait in status RESCHEDULED keyed by reschedule_day. Shortly
+# after midnight (OPERATIONS_TZ) a rollover job moves those due that day, or overdue,
+# back into the assignment pool (RETURNED_TO_WH, requeued_for=<day>) in batches, so
+# dispatch reads exactly the day's parcels from an index.
+OPERATIONS_TZ = ZoneInfo(os.environ.get("OPERATIONS_TZ", "UTC"))
+RESCHEDULE_BATCH_SIZE = env_int("RESCHEDULE_BATCH_SIZE", 1000)
+RESCHEDULE_ROLLOVER_DELAY_S = env_int("RESCHEDULE_ROLLOVER_DELAY_S", 300)
+RESCHEDULE_CAPACITY_PER_CHAMP = env_int("RESCHEDULE_CAPACITY_PER_CHAMP", 40)
+RESCHEDULE_JOB_KEY = "reschedule_rollover"
+RESCHEDULE_DATE_FORMATS = ["%d-%m-%Y", "%d/%m/%Y"]
+
+def parse_reschedule_day(value: Optional[str]) -> Optional[str]:
+    """Normalise the free-text rescheduled_date to YYYY-MM-DD; None if it isn't a date"""
+    value = (value or "").strip()
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)
+        if parsed.tzinfo is not None:
+            parsed = parsed.astimezone(OPERATIONS_TZ)
+        return parsed.date().isoformat()
+    except ValueError:
+        pass
+    for fmt in RESCHEDULE_DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt).date().isoformat()
+        except ValueError:
+            continue
+    return None
+
+def checked_reschedule_day(value: Optional[str]) -> Optional[str]:
+    """parse_reschedule_day for client input: a date that can't be read is a 400, not a
+    shipment that silently never comes back out of the queue. A missing date is allowed
+    and shows up as unscheduled in the capacity view."""
+    day = parse_reschedule_day(value)
+    if day is None and value and value.strip():
+        raise HTTPException(
+            status_code=400, detail=f"Unrecognised reschedule date {value!r}; use YYYY-MM-DD, DD-MM-YYYY or DD/MM/YYYY"
+        )
+    return day
+
+def reschedule_fields(value: Optional[str]) -> dict:
+    return {"rescheduled_date": value, "reschedule_day": checked_reschedule_day(value), "requeued_for": None}
+
+def operations_today() -> date:
+    return datetime.now(OPERATIONS_TZ).date()
+
+def seconds_until_after_midnight(offset_s: int) -> float:
+    """Seconds until `offset_s` past the next local (OPERATIONS_TZ) midnight"""
+    now = datetime.now(OPERATIONS_TZ)
+    midnight = datetime.combine(now.date() + timedelta(days=1), datetime.min.time(), OPERATIONS_TZ)
+    return (midnight - now).total_seconds() + offset_s
+
+async def backfill_reschedule_days() -> int:
+    """Parse reschedule_day for shipments rescheduled before the queue existed"""
+    updated = 0
+    while True:
+        docs = await db.shipments.find(
+            {"status": ShipmentStatus.RESCHEDULED.value, "reschedule_day": {"$exists": False}},
+            {"_id": 1, "rescheduled_date": 1}
+        ).limit(RESCHEDULE_BATCH_SIZE).to_list(RESCHEDULE_BATCH_SIZE)
+        if not docs:
+            return updated
+        await db.shipments.bulk_write([
+            UpdateOne({"_id": d["_id"]}, {"$set": {"reschedule_day": parse_reschedule_day(d.get("rescheduled_date"))}})
+            for d in docs
+        ], ordered=False)
+        updated += len(docs)
+
+async def requeue_due_reschedules(day: str) -> int:
+    """Move RESCHEDULED shipments due on or before `day` into the assignment pool"""
+    moved = 0
+    while True:
+        docs = await db.shipments.find(
+            {"status": ShipmentStatus.RESCHEDULED.value, "reschedule_day": {"$lte": day}},
+            {"_id": 1}
+        ).limit(RESCHEDULE_BATCH_SIZE).to_list(RESCHEDULE_BATCH_SIZE)
+        if not docs:
+            return moved
+        result = await db.shipments.update_many(
+            {"_id": {"$in": [d["_id"] for d in docs]}, "status": ShipmentStatus.RESCHEDULED.value},
+            {"$set": {
+                "status": ShipmentStatus.RETURNED_TO_WH.value,
+                "requeued_for": day,
+                "reschedule_day": None,
+                "champ_id": None,
+                "run_sheet_id": None,
+                "updated_at": datetime.now(timezone.utc).isoformat()
+            }}
+        )
+        moved += result.modified_count
+
+@job_handler("reschedule_rollover")
+async def reschedule_rollover():
+    day = operations_today().isoformat()
+    backfilled = await backfill_reschedule_days()
+    moved = await requeue_due_reschedules(day)
+    if backfilled or moved:
+        await touch("shipments")
+        logger.info("Reschedule rollover for %s: requeued %d shipments (%d backfilled)", day, moved, backfilled)
+    await enqueue_job("reschedule_rollover", delay_s=seconds_until_after_midnight(RESCHEDULE_ROLLOVER_DELAY_S), key=RESCHEDULE_JOB_KEY)
+
+async def schedule_reschedule_rollover():
+    # Run once now to catch up on days missed while no worker was up
+    try:
+        await enqueue_job("reschedule_rollover", key=RESCHEDULE_JOB_KEY)
+    except Exception:
+        logger.exception("Could not schedule the reschedule rollover")
+
+@api_router.get("/reschedules/due", response_model=List[Shipment])
+async def get_due_reschedules(day: Optional[str] = None, route: Optional[str] = None):
+    """Rescheduled shipments requeued for `day` (default today) and still waiting for a champ"""
+    query = {
+        "requeued_for": day or operations_today().isoformat(),
+        "status": ShipmentStatus.RETURNED_TO_WH.value
+    }
+    if route:
+        query["route"] = route
+    shipments = await reporting_db.shipments.find(query, model_projection(Shipment)).to_list(None)
+    return list_response(Shipment, shipments)
+
+@api_router.get("/reschedules/queue", response_model=List[Shipment])
+async def get_reschedule_queue(day: str, route: Optional[str] = None):
+    """Shipments waiting in the reschedule queue for a future day"""
+    reschedule_day = checked_reschedule_day(day)
+    if reschedule_day is None:
+        raise HTTPException(status_code=400, detail="day is required")
+    query = {"status": ShipmentStatus.RESCHEDULED.value, "reschedule_day": reschedule_day}
+    if route:
+        query["route"] = route
+    shipments = await reporting_db.shipments.find(query, model_projection(Shipment)).to_list(None)
+    return list_response(Shipment, shipments)
+
+@api_router.get("/reschedules/capacity")
+async def get_reschedule_capacity(days: int = Query(14, ge=1, le=90), capacity_per_champ: int = Query(RESCHEDULE_CAPACITY_PER_CHAMP, ge=1)):
+    """Queued reschedules per day and route over the next `days`, against champ capacity"""
+    today = operations_today()
+    last_day = (today + timedelta(days=days - 1)).isoformat()
+    rows, champs = await asyncio.gather(
+        reporting_db.shipments.aggregate([
+            {"$match": {"status": ShipmentStatus.RESCHEDULED.value}},
+            {"$group": {
+                "_id": {"day": "$reschedule_day", "route": "$route"},
+                "count": {"$sum": 1},
+                "value": {"$sum": "$value"}
+            }},
+        ]).to_list(None),
+        champ_directory.all()
+    )
+    active_champs = [c for c in champs if c.get("is_active", True)]
+    capacity_by_route: Dict[str, int] = {}
+    overdue = unscheduled = beyond = 0
+    days_view: Dict[str, dict] = {
+        (today + timedelta(days=i)).isoformat(): {"count": 0, "value": 0, "routes": {}} for i in range(days)
+    }
+    for row in rows:
+        day, route = row["_id"].get("day"), row["_id"].get("route")
+        if day is None:
+            unscheduled += row["count"]
+        elif day < today.isoformat():
+            overdue += row["count"]
+        elif day > last_day:
+            beyond += row["count"]
+        else:
+            if route not in capacity_by_route:
+                capacity_by_route[route] = len(route_candidates(route, active_champs)) * capacity_per_champ
+            entry = days_view[day]
+            entry["count"] += row["count"]
+            entry["value"] += row["value"]
+            entry["routes"][route] = {
+                "count": row["count"],
+                "capacity": capacity_by_route[route],
+                "utilisation": round(row["count"] / capacity_by_route[route], 3) if capacity_by_route[route] else None
+            }
+    return {
+        "today": today.isoformat(),
+        "days": [{"day": day, **entry} for day, entry in days_view.items()],
+        "overdue": overdue,
+        "beyond_window": beyond,
+        "unscheduled": unscheduled
+    }
 
 # ==================== RETURN TO WAREHOUSE ====================
 
 # Step 9: Return undelivered shipments to warehouse
 @api_router.post("/logistics/return-to-warehouse", response_model=List[Shipment])
+@touches("shipments")
 async def return_to_warehouse(shipment_ids: List[str]):
     updated_shipments = []
     for sid in shipment_ids:
@@ -734,19 +2837,70 @@ async def return_to_warehouse(shipment_ids: List[str]):
 # Get undelivered shipments (for common location assignment)
 @api_router.get("/logistics/undelivered", response_model=List[Shipment])
 async def get_undelivered_shipments():
-    shipments = await db.shipments.find(
+    shipments = await reporting_db.shipments.find(
         {"status": {"$in": [
             ShipmentStatus.CANCELLED.value,
             ShipmentStatus.NO_RESPONSE.value,
             ShipmentStatus.RETURNED_TO_WH.value,
             ShipmentStatus.RESCHEDULED.value
         ]}},
-        {"_id": 0}
+        model_projection(Shipment)
     ).to_list(1000)
-    return shipments
+    return list_response(Shipment, shipments)
+
+# ==================== PERSONAL SHOPPING UPDATES ====================
+# Partial deliveries are applied with aggregation-pipeline updates so the item flags,
+# collected_value and status are computed by the server inside a single atomic write:
+# two actions landing together cannot overwrite each other's items. (arrayFilters
+# can't address array elements by index, and can't be combined with a pipeline.)
+def shopping_delivery_pipeline(indices: List[int], replace: bool, status_expr: dict) -> List[dict]:
+    """Pipeline marking shopping_items[indices] delivered and recomputing collected_value/status.
+
+    replace=False adds to the items already delivered; replace=True makes exactly `indices` delivered.
+    """
+    selected = {"$in": ["$$i", list(indices)]}
+    delivered = selected if replace else {"$or": [selected, {"$ifNull": ["$$item.is_delivered", False]}]}
+    return [
+        {"$set": {"shopping_items": {"$map": {
+            "input": {"$range": [0, {"$size": {"$ifNull": ["$shopping_items", []]}}]},
+            "as": "i",
+            "in": {"$let": {
+                "vars": {"item": {"$arrayElemAt": ["$shopping_items", "$$i"]}},
+                "in": {"$mergeObjects": ["$$item", {"is_delivered": delivered}]}
+            }}
+        }}}},
+        {"$set": {
+            "collected_value": {"$sum": {"$map": {
+                "input": "$shopping_items",
+                "as": "item",
+                "in": {"$cond": ["$$item.is_delivered", "$$item.value", 0]}
+            }}},
+            "_items_value": {"$sum": "$shopping_items.value"},
+            "updated_at": datetime.now(timezone.utc).isoformat()
+        }},
+        {"$set": {"status": status_expr}},
+        {"$unset": "_items_value"}
+    ]
+
+def add_delivery_status_expr() -> dict:
+    """Partial until every item's value has been collected"""
+    return {"$cond": [
+        {"$lt": ["$collected_value", "$_items_value"]},
+        PickupStatus.PARTIAL.value,
+        PickupStatus.COMPLETED.value
+    ]}
+
+def completion_status_expr() -> dict:
+    """Completed, unless only some of the items' value was collected"""
+    return {"$cond": [
+        {"$and": [{"$gt": ["$collected_value", 0]}, {"$lt": ["$collected_value", "$_items_value"]}]},
+        PickupStatus.PARTIAL.value,
+        PickupStatus.COMPLETED.value
+    ]}
 
 # ==================== PICKUP ROUTES ====================
 @api_router.post("/pickups/seller", response_model=Pickup)
+@touches("pickups")
 async def create_seller_pickup(input: SellerPickupCreate):
     total_qty = sum(item.quantity for item in input.pickup_items)
     pickup = Pickup(
@@ -755,26 +2909,32 @@ async def create_seller_pickup(input: SellerPickupCreate):
         seller_address=input.seller_address,
         seller_phone=input.seller_phone,
         pickup_items=[item.model_dump() for item in input.pickup_items],
-        total_value=0
+        total_value=0,
+        route=input.route,
+        latitude=input.latitude,
+        longitude=input.longitude
     )
-    doc = prepare_doc_for_db(pickup.model_dump())
-    await db.pickups.insert_one(doc)
+    await db.pickups.insert_one(pickup_doc(pickup))
     return pickup
 
 @api_router.post("/pickups/customer-return", response_model=Pickup)
+@touches("pickups")
 async def create_customer_return(input: CustomerReturnCreate):
     pickup = Pickup(
         pickup_type=PickupType.CUSTOMER_RETURN,
         customer_name=input.customer_name,
         customer_address=input.customer_address,
         customer_phone=input.customer_phone,
-        notes=f"Original AWB: {input.original_awb}, Reason: {input.return_reason}" if input.original_awb else input.return_reason
+        notes=f"Original AWB: {input.original_awb}, Reason: {input.return_reason}" if input.original_awb else input.return_reason,
+        route=input.route,
+        latitude=input.latitude,
+        longitude=input.longitude
     )
-    doc = prepare_doc_for_db(pickup.model_dump())
-    await db.pickups.insert_one(doc)
+    await db.pickups.insert_one(pickup_doc(pickup))
     return pickup
 
 @api_router.post("/pickups/personal-shopping", response_model=Pickup)
+@touches("pickups")
 async def create_personal_shopping(input: PersonalShoppingCreate):
     total_value = sum(item.value for item in input.shopping_items)
     pickup = Pickup(
@@ -783,13 +2943,16 @@ async def create_personal_shopping(input: PersonalShoppingCreate):
         customer_address=input.customer_address,
         customer_phone=input.customer_phone,
         shopping_items=[item.model_dump() for item in input.shopping_items],
-        total_value=total_value
+        total_value=total_value,
+        route=input.route,
+        latitude=input.latitude,
+        longitude=input.longitude
     )
-    doc = prepare_doc_for_db(pickup.model_dump())
-    await db.pickups.insert_one(doc)
+    await db.pickups.insert_one(pickup_doc(pickup))
     return pickup
 
 @api_router.post("/pickups/unsubmitted-items", response_model=Pickup)
+@touches("pickups")
 async def create_unsubmitted_items_pickup(input: UnsubmittedItemsCreate):
     """Create pickup for unsubmitted items (same structure as seller pickup)"""
     pickup = Pickup(
@@ -799,10 +2962,12 @@ async def create_unsubmitted_items_pickup(input: UnsubmittedItemsCreate):
         seller_phone=input.seller_phone,
         pickup_items=[item.model_dump() for item in input.pickup_items],
         notes=input.notes,
-        total_value=0
+        total_value=0,
+        route=input.route,
+        latitude=input.latitude,
+        longitude=input.longitude
     )
-    doc = prepare_doc_for_db(pickup.model_dump())
-    await db.pickups.insert_one(doc)
+    await db.pickups.insert_one(pickup_doc(pickup))
     return pickup
 
 @api_router.get("/pickups", response_model=List[Pickup])
@@ -815,8 +2980,8 @@ async def get_pickups(
         query["pickup_type"] = pickup_type.value
     if status:
         query["status"] = status.value
-    pickups = await db.pickups.find(query, {"_id": 0}).sort("created_at", -1).to_list(1000)
-    return pickups
+    pickups = await reporting_db.pickups.find(query, model_projection(Pickup)).sort("created_at", -1).to_list(1000)
+    return list_response(Pickup, pickups)
 
 @api_router.get("/pickups/{pickup_id}", response_model=Pickup)
 async def get_pickup(pickup_id: str):
@@ -826,13 +2991,14 @@ async def get_pickup(pickup_id: str):
     return pickup
 
 @api_router.put("/pickups/{pickup_id}", response_model=Pickup)
+@touches("pickups")
 async def update_pickup(pickup_id: str, input: PickupUpdate):
     update_data = {k: v for k, v in input.model_dump().items() if v is not None}
     update_data["updated_at"] = datetime.now(timezone.utc).isoformat()
     
     # If assigning champ, get champ name
     if input.champ_id:
-        champ = await db.champs.find_one({"id": input.champ_id}, {"_id": 0})
+        champ = await champ_directory.get(input.champ_id)
         if champ:
             update_data["champ_name"] = champ["name"]
     
@@ -847,27 +3013,159 @@ async def update_pickup(pickup_id: str, input: PickupUpdate):
     return pickup
 
 @api_router.post("/pickups/{pickup_id}/assign/{champ_id}", response_model=Pickup)
+@touches("pickups")
 async def assign_pickup_to_champ(pickup_id: str, champ_id: str):
-    champ = await db.champs.find_one({"id": champ_id}, {"_id": 0})
+    champ = await champ_directory.get(champ_id)
     if not champ:
         raise HTTPException(status_code=404, detail="Champ not found")
     
-    result = await db.pickups.update_one(
+    pickup = await db.pickups.find_one_and_update(
         {"id": pickup_id},
         {"$set": {
             "champ_id": champ_id,
             "champ_name": champ["name"],
             "status": PickupStatus.ASSIGNED.value,
             "updated_at": datetime.now(timezone.utc).isoformat()
-        }}
+        }},
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER
     )
-    if result.matched_count == 0:
+    if not pickup:
         raise HTTPException(status_code=404, detail="Pickup not found")
-    
-    pickup = await db.pickups.find_one({"id": pickup_id}, {"_id": 0})
+    notify_soon(**pickup_assigned_event(pickup))
     return pickup
 
+# ==================== PICKUP DISPATCH ====================
+ASSIGNABLE_PICKUP_STATUSES = [PickupStatus.PENDING.value, PickupStatus.ASSIGNED.value]
+MAX_DISPATCH_BATCH = env_int("MAX_DISPATCH_BATCH", 5000)
+
+class PickupAssignment(BaseModel):
+    pickup_id: str
+    champ_id: Optional[str] = None  # None: choose a champ automatically
+
+class PickupDispatchRequest(BaseModel):
+    assignments: List[PickupAssignment]
+    # Auto-assignment skips champs that already carry this many open shipments + pickups
+    max_load_per_champ: Optional[int] = None
+
+async def champ_open_loads() -> Dict[str, int]:
+    """Open shipments plus open pickups per champ, counted in a single aggregation"""
+    pipeline = [
+        {"$match": {"status": {"$in": [
+            ShipmentStatus.ASSIGNED_TO_CHAMP.value, ShipmentStatus.OUT_FOR_DELIVERY.value
+        ]}, "champ_id": {"$ne": None}}},
+        {"$project": {"_id": 0, "champ_id": 1}},
+        {"$unionWith": {"coll": "pickups", "pipeline": [
+            {"$match": {"status": {"$in": [PickupStatus.ASSIGNED.value, PickupStatus.IN_PROGRESS.value]},
+                        "champ_id": {"$ne": None}}},
+            {"$project": {"_id": 0, "champ_id": 1}}
+        ]}},
+        {"$group": {"_id": "$champ_id", "load": {"$sum": 1}}}
+    ]
+    results = await reporting_db.shipments.aggregate(pipeline).to_list(None)
+    return {r["_id"]: r["load"] for r in results}
+
+def route_candidates(route: Optional[str], champs: List[dict]) -> List[dict]:
+    """Active champs serving the route; every active champ when nobody serves it"""
+    return [c for c in champs if route and route in c.get("assigned_routes", [])] or champs
+
+def choose_champ(candidates: List[dict], loads: Dict[str, int], max_load: Optional[int]) -> Optional[dict]:
+    """Least-loaded candidate still under max_load"""
+    if max_load is not None:
+        candidates = [c for c in candidates if loads.get(c["id"], 0) < max_load]
+    if not candidates:
+        return None
+    return min(candidates, key=lambda c: loads.get(c["id"], 0))
+
+@api_router.post("/pickups/dispatch")
+@touches("pickups")
+async def dispatch_pickups(input: PickupDispatchRequest):
+    """Assign many pickups in one bulk write, auto-choosing champs by route and load where none is given"""
+    if len(input.assignments) > MAX_DISPATCH_BATCH:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_DISPATCH_BATCH} assignments per call")
+    pickup_ids = list(dict.fromkeys(a.pickup_id for a in input.assignments))
+    needs_auto = any(a.champ_id is None for a in input.assignments)
+    pickups_task = db.pickups.find(
+        {"id": {"$in": pickup_ids}}, {"_id": 0, "id": 1, "status": 1, "route": 1, "champ_id": 1}
+    ).to_list(None)
+    loads_task = champ_open_loads() if needs_auto else asyncio.sleep(0, result={})
+    pickups, loads, champs = await asyncio.gather(pickups_task, loads_task, champ_directory.all())
+    pickups_by_id = {p["id"]: p for p in pickups}
+    champs_by_id = {c["id"]: c for c in champs}
+    # The directory may not have seen a champ another worker created moments ago
+    for champ_id in {a.champ_id for a in input.assignments if a.champ_id and a.champ_id not in champs_by_id}:
+        champ = await champ_directory.get(champ_id)
+        if champ:
+            champs_by_id[champ_id] = champ
+    inactive = sorted({
+        a.champ_id for a in input.assignments
+        if a.champ_id in champs_by_id and not champs_by_id[a.champ_id].get("is_active", True)
+    })
+    if inactive:
+        raise HTTPException(status_code=400, detail=f"Champs are not active: {', '.join(inactive)}")
+    active_champs = [c for c in champs if c.get("is_active", True)]
+    candidates_by_route: Dict[Optional[str], List[dict]] = {}
+
+    now = datetime.now(timezone.utc).isoformat()
+    ops, assigned, not_found, skipped, unassigned = [], [], [], [], []
+    seen = set()
+    for assignment in input.assignments:
+        if assignment.pickup_id in seen:
+            skipped.append({"pickup_id": assignment.pickup_id, "reason": "duplicate pickup_id"})
+            continue
+        seen.add(assignment.pickup_id)
+        pickup = pickups_by_id.get(assignment.pickup_id)
+        if not pickup:
+            not_found.append(assignment.pickup_id)
+            continue
+        if pickup["status"] not in ASSIGNABLE_PICKUP_STATUSES:
+            skipped.append({"pickup_id": pickup["id"], "reason": f"status is {pickup['status']}"})
+            continue
+        if assignment.champ_id:
+            champ = champs_by_id.get(assignment.champ_id)
+            if not champ:
+                skipped.append({"pickup_id": pickup["id"], "reason": "champ not found"})
+                continue
+        else:
+            route = pickup.get("route")
+            if route not in candidates_by_route:
+                candidates_by_route[route] = route_candidates(route, active_champs)
+            champ = choose_champ(candidates_by_route[route], loads, input.max_load_per_champ)
+            if not champ:
+                unassigned.append(pickup["id"])
+                continue
+        previous = pickup.get("champ_id")
+        if previous and pickup["status"] == PickupStatus.ASSIGNED.value and previous in loads:
+            # Reassigned away from a champ whose load already counted this pickup
+            loads[previous] -= 1
+        loads[champ["id"]] = loads.get(champ["id"], 0) + 1
+        ops.append(UpdateOne(
+            {"id": pickup["id"], "status": {"$in": ASSIGNABLE_PICKUP_STATUSES}},
+            {"$set": {
+                "champ_id": champ["id"],
+                "champ_name": champ["name"],
+                "status": PickupStatus.ASSIGNED.value,
+                "updated_at": now
+            }}
+        ))
+        assigned.append({"pickup_id": pickup["id"], "champ_id": champ["id"], "champ_name": champ["name"]})
+
+    modified = 0
+    if ops:
+        result = await db.pickups.bulk_write(ops, ordered=False)
+        modified = result.modified_count
+        await enqueue_job("notify_pickups_assigned", pickup_ids=[a["pickup_id"] for a in assigned])
+    return {
+        "assigned": assigned,
+        "modified_count": modified,
+        "not_found": not_found,
+        "skipped": skipped,
+        "unassigned": unassigned,
+        "champ_loads": loads
+    }
+
 @api_router.post("/pickups/{pickup_id}/complete", response_model=Pickup)
+@touches("pickups")
 async def complete_pickup(pickup_id: str, collected_value: float = 0, partial_items: List[str] = None):
     pickup = await db.pickups.find_one({"id": pickup_id}, {"_id": 0})
     if not pickup:
@@ -889,6 +3187,7 @@ async def complete_pickup(pickup_id: str, collected_value: float = 0, partial_it
     return pickup
 
 @api_router.put("/pickups/{pickup_id}/shopping-items", response_model=Pickup)
+@touches("pickups")
 async def update_shopping_items(pickup_id: str, shopping_items: List[PersonalShoppingItem]):
     """Update shopping items delivery status for partial delivery"""
     pickup = await db.pickups.find_one({"id": pickup_id}, {"_id": 0})
@@ -917,49 +3216,61 @@ async def update_shopping_items(pickup_id: str, shopping_items: List[PersonalSho
     return pickup
 
 @api_router.post("/pickups/{pickup_id}/complete-with-proof", response_model=Pickup)
+@touches("pickups")
 async def complete_pickup_with_proof(pickup_id: str, proof: PickupCompletionProof):
     """Complete a pickup with proof (image, location, notes)"""
     pickup = await db.pickups.find_one({"id": pickup_id}, {"_id": 0})
     if not pickup:
         raise HTTPException(status_code=404, detail="Pickup not found")
     
+    proof_image = await ingest_proof_image(proof.proof_image_base64)
+    return await record_pickup_completion(pickup, proof, proof_image)
+
+async def record_pickup_completion(pickup: dict, proof: PickupCompletionProof, proof_image: dict) -> dict:
+    """Complete a pickup whose proof image has already been stored"""
+    pickup_id = pickup["id"]
+    proof_id = await store_proof(f"pickup:{pickup_id}", proof_image)
     update_data = {
         "status": PickupStatus.COMPLETED.value,
         "collected_value": proof.collected_value,
-        "proof_image": proof.proof_image_base64,
+        "proof_id": proof_id,
+        "proof_meta": proof_image.get("meta"),
         "proof_latitude": proof.latitude,
         "proof_longitude": proof.longitude,
+        "proof_location": geo_point(proof.latitude, proof.longitude),
         "completion_notes": proof.notes,
         "completed_at": datetime.now(timezone.utc).isoformat(),
         "updated_at": datetime.now(timezone.utc).isoformat()
     }
     
-    # For personal shopping with partial delivery
-    if pickup.get("pickup_type") == PickupType.PERSONAL_SHOPPING.value:
-        shopping_items = pickup.get("shopping_items", [])
-        if proof.delivered_item_indices is not None:
-            for i, item in enumerate(shopping_items):
-                item["is_delivered"] = i in proof.delivered_item_indices
-            update_data["shopping_items"] = shopping_items
-            
-            delivered_value = sum(item["value"] for item in shopping_items if item.get("is_delivered"))
-            total_value = sum(item["value"] for item in shopping_items)
-            
-            if delivered_value < total_value and delivered_value > 0:
-                update_data["status"] = PickupStatus.PARTIAL.value
-            
-            update_data["collected_value"] = delivered_value
-        
+    is_shopping = pickup.get("pickup_type") == PickupType.PERSONAL_SHOPPING.value
+    
+    # For personal shopping with partial delivery, item flags, collected value and
+    # status are set server-side in the same atomic update
+    if is_shopping and proof.delivered_item_indices is not None:
+        update = [{"$set": {k: {"$literal": v} for k, v in update_data.items()}}] + shopping_delivery_pipeline(
+            proof.delivered_item_indices, replace=True, status_expr=completion_status_expr()
+        )
+    else:
+        update = {"$set": update_data}
+    pickup = await db.pickups.find_one_and_update(
+        {"id": pickup_id}, update, projection={"_id": 0}, return_document=ReturnDocument.AFTER
+    )
+    if not pickup:
+        raise HTTPException(status_code=404, detail="Pickup not found")
+    
+    if is_shopping:
         # Create history entry
+        shopping_items = pickup.get("shopping_items", [])
         delivered_items = [item["item_name"] for item in shopping_items if item.get("is_delivered")]
         history_entry = ShoppingHistoryEntry(
             pickup_id=pickup_id,
-            action="partial_delivery" if update_data["status"] == PickupStatus.PARTIAL.value else "full_delivery",
+            action="partial_delivery" if pickup["status"] == PickupStatus.PARTIAL.value else "full_delivery",
             items_delivered=delivered_items,
-            value_collected=update_data["collected_value"],
+            value_collected=pickup.get("collected_value", 0),
             champ_id=pickup.get("champ_id"),
             champ_name=pickup.get("champ_name"),
-            proof_image=proof.proof_image_base64,
+            proof_id=proof_id,
             latitude=proof.latitude,
             longitude=proof.longitude,
             notes=proof.notes
@@ -967,71 +3278,126 @@ async def complete_pickup_with_proof(pickup_id: str, proof: PickupCompletionProo
         history_doc = prepare_doc_for_db(history_entry.model_dump())
         await db.shopping_history.insert_one(history_doc)
     
-    await db.pickups.update_one({"id": pickup_id}, {"$set": update_data})
-    pickup = await db.pickups.find_one({"id": pickup_id}, {"_id": 0})
     return pickup
 
+def encode_cursor(*values: str) -> str:
+    return base64.urlsafe_b64encode("|".join(values).encode()).decode()
+
+def decode_cursor(cursor: str, parts: int) -> List[str]:
+    try:
+        values = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+    except (binascii.Error, UnicodeDecodeError):
+        values = []
+    if len(values) != parts:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return values
+
 @api_router.get("/pickups/{pickup_id}/history", response_model=List[ShoppingHistoryEntry])
-async def get_pickup_history(pickup_id: str):
-    """Get delivery history for a personal shopping pickup"""
-    history = await db.shopping_history.find(
-        {"pickup_id": pickup_id}, 
-        {"_id": 0}
-    ).sort("created_at", -1).to_list(100)
+async def get_pickup_history(
+    pickup_id: str,
+    response: Response,
+    limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = None
+):
+    """Get delivery history for a personal shopping pickup, newest first.
+
+    When more entries exist, the X-Next-Cursor response header holds the cursor for the next page.
+    """
+    query = {"pickup_id": pickup_id}
+    if cursor:
+        created_at, entry_id = decode_cursor(cursor, 2)
+        query["$or"] = [
+            {"created_at": {"$lt": created_at}},
+            {"created_at": created_at, "id": {"$lt": entry_id}}
+        ]
+    history = await reporting_db.shopping_history.find(
+        query, 
+        model_projection(ShoppingHistoryEntry)
+    ).sort([("created_at", -1), ("id", -1)]).limit(limit + 1).to_list(limit + 1)
+    if len(history) > limit:
+        history = history[:limit]
+        response.headers["X-Next-Cursor"] = encode_cursor(history[-1]["created_at"], history[-1]["id"])
     return history
 
+@api_router.get("/pickups/{pickup_id}/history/summary")
+async def get_pickup_history_summary(pickup_id: str, bucket: str = Query("day", pattern="^(day|hour)$")):
+    """Items delivered and value collected per day (or hour), aggregated by MongoDB"""
+    # created_at is stored as an ISO string, so its prefix is the bucket
+    prefix = 10 if bucket == "day" else 13
+    pipeline = [
+        {"$match": {"pickup_id": pickup_id}},
+        {"$facet": {
+            "buckets": [
+                {"$group": {
+                    "_id": {"$substrCP": ["$created_at", 0, prefix]},
+                    "deliveries": {"$sum": 1},
+                    "items_delivered": {"$sum": {"$size": {"$ifNull": ["$items_delivered", []]}}},
+                    "value_collected": {"$sum": "$value_collected"}
+                }},
+                {"$sort": {"_id": 1}}
+            ],
+            "totals": [
+                {"$group": {
+                    "_id": None,
+                    "deliveries": {"$sum": 1},
+                    "items_delivered": {"$sum": {"$size": {"$ifNull": ["$items_delivered", []]}}},
+                    "value_collected": {"$sum": "$value_collected"},
+                    "first_delivery_at": {"$min": "$created_at"},
+                    "last_delivery_at": {"$max": "$created_at"}
+                }},
+                {"$project": {"_id": 0}}
+            ]
+        }}
+    ]
+    result = (await reporting_db.shopping_history.aggregate(pipeline).to_list(1))[0]
+    return {
+        "pickup_id": pickup_id,
+        "bucket": bucket,
+        "totals": result["totals"][0] if result["totals"] else {"deliveries": 0, "items_delivered": 0, "value_collected": 0},
+        "buckets": [{"period": b.pop("_id"), **b} for b in result["buckets"]]
+    }
+
 @api_router.post("/pickups/{pickup_id}/add-delivery", response_model=Pickup)
+@touches("pickups")
 async def add_partial_delivery(pickup_id: str, proof: PickupCompletionProof):
     """Add another partial delivery to a personal shopping pickup"""
-    pickup = await db.pickups.find_one({"id": pickup_id}, {"_id": 0})
+    pickup = await db.pickups.find_one({"id": pickup_id}, {"_id": 0, "pickup_type": 1})
     if not pickup:
         raise HTTPException(status_code=404, detail="Pickup not found")
     
     if pickup.get("pickup_type") != PickupType.PERSONAL_SHOPPING.value:
         raise HTTPException(status_code=400, detail="This endpoint is only for personal shopping pickups")
     
-    shopping_items = pickup.get("shopping_items", [])
-    
-    # Mark newly delivered items
-    if proof.delivered_item_indices:
-        for i in proof.delivered_item_indices:
-            if i < len(shopping_items):
-                shopping_items[i]["is_delivered"] = True
-    
-    delivered_value = sum(item["value"] for item in shopping_items if item.get("is_delivered"))
-    total_value = sum(item["value"] for item in shopping_items)
+    proof_image = await ingest_proof_image(proof.proof_image_base64)
+    indices = proof.delivered_item_indices or []
     
-    status = PickupStatus.PARTIAL.value if delivered_value < total_value else PickupStatus.COMPLETED.value
+    # Mark newly delivered items and recompute totals in one atomic update
+    pickup = await db.pickups.find_one_and_update(
+        {"id": pickup_id},
+        shopping_delivery_pipeline(indices, replace=False, status_expr=add_delivery_status_expr()),
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER
+    )
+    if not pickup:
+        raise HTTPException(status_code=404, detail="Pickup not found")
     
     # Create history entry
-    delivered_items = [shopping_items[i]["item_name"] for i in (proof.delivered_item_indices or []) if i < len(shopping_items)]
+    shopping_items = pickup.get("shopping_items", [])
+    delivered = [shopping_items[i] for i in indices if 0 <= i < len(shopping_items)]
     history_entry = ShoppingHistoryEntry(
         pickup_id=pickup_id,
         action="partial_delivery",
-        items_delivered=delivered_items,
-        value_collected=sum(shopping_items[i]["value"] for i in (proof.delivered_item_indices or []) if i < len(shopping_items)),
+        items_delivered=[item["item_name"] for item in delivered],
+        value_collected=sum(item["value"] for item in delivered),
         champ_id=pickup.get("champ_id"),
         champ_name=pickup.get("champ_name"),
-        proof_image=proof.proof_image_base64,
+        proof_id=await store_proof(f"pickup:{pickup_id}", proof_image),
         latitude=proof.latitude,
         longitude=proof.longitude,
         notes=proof.notes
     )
     history_doc = prepare_doc_for_db(history_entry.model_dump())
     await db.shopping_history.insert_one(history_doc)
-    
-    # Update pickup
-    await db.pickups.update_one(
-        {"id": pickup_id},
-        {"$set": {
-            "shopping_items": shopping_items,
-            "collected_value": delivered_value,
-            "status": status,
-            "updated_at": datetime.now(timezone.utc).isoformat()
-        }}
-    )
-    
-    pickup = await db.pickups.find_one({"id": pickup_id}, {"_id": 0})
     return pickup
 
 # ==================== CHAMP DELIVERY VIEW ====================
@@ -1039,7 +3405,7 @@ async def add_partial_delivery(pickup_id: str, proof: PickupCompletionProof):
 async def get_champ_shipments(champ_id: str):
     """Get all shipments assigned to a champ (for delivery view)"""
     # First check if champ exists
-    champ = await db.champs.find_one({"id": champ_id}, {"_id": 0})
+    champ = await champ_directory.get(champ_id)
     if not champ:
         raise HTTPException(status_code=404, detail="Champ not found")
     
@@ -1058,17 +3424,32 @@ async def get_champ_shipments(champ_id: str):
     
     shipments = await db.shipments.find(
         {"id": {"$in": shipment_ids}},
-        {"_id": 0}
+        model_projection(Shipment)
     ).to_list(1000)
-    return shipments
+    model = await eta_predictor.current()
+    scanned_out = {rs["id"]: rs.get("scanned_out_at") for rs in run_sheets}
+    for shipment in shipments:
+        shipment["eta"] = eta_for(model, shipment, scanned_out.get(shipment.get("run_sheet_id")))
+    return list_response(Shipment, shipments)
 
 @api_router.post("/champ/delivery-action", response_model=Shipment)
+@touches("shipments", "delivery_attempts")
 async def champ_delivery_action(action: ChampDeliveryAction):
     """Champ marks a shipment as delivered/cancelled/rescheduled with proof"""
     shipment = await db.shipments.find_one({"id": action.shipment_id}, {"_id": 0})
     if not shipment:
         raise HTTPException(status_code=404, detail="Shipment not found")
     
+    if action.action == DeliveryOutcome.RESCHEDULED:
+        checked_reschedule_day(action.reschedule_date)
+    
+    proof = {}
+    if action.action in (DeliveryOutcome.DELIVERED, DeliveryOutcome.CANCELLED):
+        proof = await ingest_proof_image(action.proof_image_base64)
+    return await record_delivery_action(shipment, action, proof)
+
+async def record_delivery_action(shipment: dict, action: ChampDeliveryAction, proof: dict) -> dict:
+    """Apply a delivery action whose proof has already been stored (see ingest_proof_image / proof uploads)"""
     now = datetime.now(timezone.utc)
     update_data = {
         "updated_at": now.isoformat()
@@ -1076,9 +3457,10 @@ async def champ_delivery_action(action: ChampDeliveryAction):
     
     if action.action == DeliveryOutcome.DELIVERED:
         update_data["status"] = ShipmentStatus.DELIVERED.value
-        update_data["delivery_proof_image"] = action.proof_image_base64
+        update_data.update(proof_fields("delivery_proof", proof))
         update_data["delivery_latitude"] = action.latitude
         update_data["delivery_longitude"] = action.longitude
+        update_data["delivery_location"] = geo_point(action.latitude, action.longitude)
         update_data["delivery_timestamp"] = now.isoformat()
         update_data["delivery_notes"] = action.notes
         
@@ -1105,13 +3487,14 @@ async def champ_delivery_action(action: ChampDeliveryAction):
         update_data["status"] = ShipmentStatus.CANCELLED.value
         update_data["cancellation_reason"] = action.cancellation_reason or action.notes
         update_data["delivery_notes"] = action.notes
-        update_data["delivery_proof_image"] = action.proof_image_base64
+        update_data.update(proof_fields("delivery_proof", proof))
         update_data["delivery_latitude"] = action.latitude
         update_data["delivery_longitude"] = action.longitude
+        update_data["delivery_location"] = geo_point(action.latitude, action.longitude)
     
     elif action.action == DeliveryOutcome.RESCHEDULED:
         update_data["status"] = ShipmentStatus.RESCHEDULED.value
-        update_data["rescheduled_date"] = action.reschedule_date
+        update_data.update(reschedule_fields(action.reschedule_date))
         update_data["reschedule_reason"] = action.notes
         update_data["delivery_notes"] = action.notes
     
@@ -1119,18 +3502,1526 @@ async def champ_delivery_action(action: ChampDeliveryAction):
         {"id": action.shipment_id},
         {"$set": update_data}
     )
+    await enqueue_proof_thumbnail(proof, "shipments", action.shipment_id, "delivery_proof_thumbnail")
     
-    shipment = await db.shipments.find_one({"id": action.shipment_id}, {"_id": 0})
-    return shipment
+    notify_soon(
+        f"shipment_{action.action.value}", shipment.get("recipient_phone"), shipment["awb"],
+        awb=shipment["awb"], reschedule_date=action.reschedule_date
+    )
+    return await db.shipments.find_one({"id": action.shipment_id}, {"_id": 0})
+
+# ==================== PROOF UPLOADS ====================
+# Multipart variants of the proof endpoints stream the photo into GridFS chunk by
+# chunk instead of carrying it base64-encoded inside a JSON body. Large photos on
+# flaky connections can instead go through a resumable upload session first and be
+# referenced by upload_id.
+UPLOAD_CHUNK_BYTES = env_int("UPLOAD_CHUNK_BYTES", 256 * 1024)
+UPLOAD_SESSION_TTL_S = env_int("UPLOAD_SESSION_TTL_S", 24 * 3600)
+
+proof_files = AsyncIOMotorGridFSBucket(db, bucket_name="proof_files", chunk_size_bytes=UPLOAD_CHUNK_BYTES)
+
+class UploadSessionCreate(BaseModel):
+    filename: str = "proof.jpg"
+    content_type: str = "image/jpeg"
+    total_bytes: int = Field(gt=0)
+
+class UploadSession(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    filename: str
+    content_type: str
+    total_bytes: int
+    received_bytes: int = 0
+    status: str = "open"  # open, complete
+    file_id: Optional[str] = None
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+
+def check_image_upload(content_type: Optional[str], total_bytes: Optional[int] = None):
+    if not (content_type or "").startswith("image/"):
+        raise HTTPException(status_code=415, detail="Proof uploads must be images")
+    if total_bytes is not None and total_bytes > PROOF_IMAGE_MAX_BYTES:
+        raise HTTPException(status_code=413, detail=f"Proof image is {total_bytes} bytes, limit is {PROOF_IMAGE_MAX_BYTES}")
+
+async def store_proof_file(file: UploadFile, owner: str) -> dict:
+    """Stream a multipart file part into GridFS, holding at most one chunk in memory"""
+    check_image_upload(file.content_type)
+    file_id = ObjectId()
+    grid_in = proof_files.open_upload_stream_with_id(
+        file_id,
+        file.filename or "proof",
+        metadata={"content_type": file.content_type, "owner": owner}
+    )
+    size = 0
+    try:
+        while chunk := await file.read(UPLOAD_CHUNK_BYTES):
+            size += len(chunk)
+            if size > PROOF_IMAGE_MAX_BYTES:
+                raise HTTPException(status_code=413, detail=f"Proof image exceeds {PROOF_IMAGE_MAX_BYTES} bytes")
+            await grid_in.write(chunk)
+    except BaseException:
+        await grid_in.abort()
+        raise
+    await grid_in.close()
+    return {"file_id": str(file_id), "meta": {"bytes": size, "content_type": file.content_type}}
+
+async def claim_upload(upload_id: str, owner: str) -> dict:
+    """Proof reference for a completed upload session"""
+    session = await db.upload_sessions.find_one({"id": upload_id}, {"_id": 0})
+    if not session:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    if session["status"] != "complete":
+        raise HTTPException(status_code=409, detail=f"Upload incomplete: {session['received_bytes']}/{session['total_bytes']} bytes")
+    await db["proof_files.files"].update_one({"_id": ObjectId(session["file_id"])}, {"$set": {"metadata.owner": owner}})
+    return {"file_id": session["file_id"], "meta": {"bytes": session["total_bytes"], "content_type": session["content_type"]}}
+
+async def resolve_proof_upload(file: Optional[UploadFile], upload_id: Optional[str], owner: str) -> dict:
+    if file is not None and upload_id:
+        raise HTTPException(status_code=400, detail="Send either a proof_image file or an upload_id, not both")
+    if file is not None:
+        return await store_proof_file(file, owner)
+    if upload_id:
+        return await claim_upload(upload_id, owner)
+    return {}
+
+async def enqueue_proof_thumbnail(proof: dict, collection: str, doc_id: str, field: str):
+    """Uploaded proofs are stored as sent; their thumbnail is built by a job after the response"""
+    if proof.get("file_id") and not proof.get("thumbnail") and image_pipeline.Image is not None:
+        await enqueue_job("proof_thumbnail", file_id=proof["file_id"], collection=collection, doc_id=doc_id, field=field)
+
+@job_handler("proof_thumbnail")
+async def build_proof_thumbnail(file_id: str, collection: str, doc_id: str, field: str):
+    try:
+        grid_out = await proof_files.open_download_stream(ObjectId(file_id))
+    except NoFile:
+        raise PermanentJobError(f"Proof file {file_id} not found")
+    data = await grid_out.read()
+    loop = asyncio.get_running_loop()
+    try:
+        # Downscaling straight to thumbnail size; the stored original stays untouched
+        result = await loop.run_in_executor(
+            image_executor(),
+            image_pipeline.process_image_bytes,
+            data, PROOF_THUMBNAIL_DIM, PROOF_THUMBNAIL_DIM, PROOF_IMAGE_QUALITY,
+            PROOF_IMAGE_FORMAT, PROOF_IMAGE_MAX_PIXELS
+        )
+    except ProofImageError as exc:
+        raise PermanentJobError(str(exc))
+    await db[collection].update_one(
+        {"id": doc_id},
+        {"$set": {field: image_pipeline.to_data_url(result["mime"], result["image"])}}
+    )
+    await touch(collection)
+
+@api_router.post("/uploads", response_model=UploadSession)
+async def create_upload_session(input: UploadSessionCreate):
+    """Start a resumable proof upload; send the bytes with PUT /uploads/{id}?offset=N"""
+    check_image_upload(input.content_type, input.total_bytes)
+    session = UploadSession(**input.model_dump())
+    doc = prepare_doc_for_db(session.model_dump())
+    doc["expires_at"] = datetime.now(timezone.utc) + timedelta(seconds=UPLOAD_SESSION_TTL_S)
+    await db.upload_sessions.insert_one(doc)
+    return session
+
+@api_router.get("/uploads/{upload_id}", response_model=UploadSession)
+async def get_upload_session(upload_id: str):
+    """Upload progress; received_bytes is the offset to resume from"""
+    session = await db.upload_sessions.find_one({"id": upload_id}, {"_id": 0})
+    if not session:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    return session
+
+@api_router.put("/uploads/{upload_id}", response_model=UploadSession)
+async def append_upload(upload_id: str, request: Request, offset: int = Query(..., ge=0)):
+    """Append the raw request body at `offset`. Each stored chunk is committed on its own,
+    so a dropped connection loses at most the chunk in flight."""
+    session = await db.upload_sessions.find_one({"id": upload_id}, {"_id": 0})
+    if not session:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    if session["status"] != "open":
+        raise HTTPException(status_code=409, detail="Upload already complete")
+    if offset != session["received_bytes"]:
+        raise HTTPException(status_code=409, detail=f"Expected offset {session['received_bytes']}")
+
+    received = session["received_bytes"]
+    buffer = bytearray()
+
+    async def flush(size: int):
+        nonlocal received
+        data = bytes(buffer[:size])
+        # The (upload_id, offset) unique index and the received_bytes condition make
+        # replayed or concurrent appends fail instead of interleaving
+        try:
+            chunk = await db.upload_chunks.insert_one({
+                "upload_id": upload_id,
+                "offset": received,
+                "data": Binary(data),
+                "expires_at": datetime.now(timezone.utc) + timedelta(seconds=UPLOAD_SESSION_TTL_S)
+            })
+        except DuplicateKeyError:
+            raise HTTPException(status_code=409, detail="Upload was modified concurrently; fetch the current offset")
+        result = await db.upload_sessions.update_one(
+            {"id": upload_id, "status": "open", "received_bytes": received},
+            {"$inc": {"received_bytes": len(data)}}
+        )
+        if result.modified_count == 0:
+            await db.upload_chunks.delete_one({"_id": chunk.inserted_id})
+            raise HTTPException(status_code=409, detail="Upload was modified concurrently; fetch the current offset")
+        received += len(data)
+        del buffer[:size]
+
+    async for piece in request.stream():
+        if received + len(buffer) + len(piece) > session["total_bytes"]:
+            raise HTTPException(status_code=413, detail="Upload is larger than its declared total_bytes")
+        buffer.extend(piece)
+        while len(buffer) >= UPLOAD_CHUNK_BYTES:
+            await flush(UPLOAD_CHUNK_BYTES)
+    if buffer:
+        await flush(len(buffer))
+
+    if received == session["total_bytes"]:
+        await finalize_upload(session)
+    return await get_upload_session(upload_id)
+
+async def finalize_upload(session: dict):
+    """Copy the stored chunks, in order, into a GridFS file and drop them.
+
+    The file id is reserved on the session before the copy, so if the process dies part
+    way a retried PUT at the final offset finishes under the same id instead of leaving
+    an orphaned file behind.
+    """
+    reserved = await db.upload_sessions.find_one_and_update(
+        {"id": session["id"], "grid_file_id": {"$exists": False}},
+        {"$set": {"grid_file_id": ObjectId()}},
+        projection={"_id": 0, "grid_file_id": 1},
+        return_document=ReturnDocument.AFTER
+    ) or await db.upload_sessions.find_one({"id": session["id"]}, {"_id": 0, "grid_file_id": 1})
+    file_id = reserved["grid_file_id"]
+    # GridFS writes the files document last, so without one any chunks are a partial copy
+    if not await db["proof_files.files"].find_one({"_id": file_id}, {"_id": 1}):
+        await db["proof_files.chunks"].delete_many({"files_id": file_id})
+        grid_in = proof_files.open_upload_stream_with_id(
+            file_id,
+            session["filename"],
+            metadata={"content_type": session["content_type"], "upload_id": session["id"]}
+        )
+        cursor = db.upload_chunks.find({"upload_id": session["id"]}, {"data": 1}).sort("offset", 1)
+        async for chunk in cursor:
+            await grid_in.write(chunk["data"])
+        await grid_in.close()
+    await db.upload_sessions.update_one(
+        {"id": session["id"]},
+        {"$set": {"status": "complete", "file_id": str(file_id)}}
+    )
+    await db.upload_chunks.delete_many({"upload_id": session["id"]})
+
+@api_router.get("/proofs/files/{file_id}")
+async def download_proof_file(file_id: str):
+    """Stream an uploaded proof image back out of GridFS"""
+    try:
+        grid_out = await proof_files.open_download_stream(ObjectId(file_id))
+    except (InvalidId, NoFile):
+        raise HTTPException(status_code=404, detail="Proof file not found")
+
+    async def chunks():
+        while chunk := await grid_out.readchunk():
+            yield chunk
+
+    content_type = (grid_out.metadata or {}).get("content_type", "application/octet-stream")
+    return StreamingResponse(chunks(), media_type=content_type, headers={"Content-Length": str(grid_out.length)})
+
+@api_router.get("/proofs/{proof_id}")
+async def get_proof_image(proof_id: str, thumbnail: bool = False):
+    """Serve a stored proof as an image, usable directly as an <img> src"""
+    field = "thumbnail" if thumbnail else "image"
+    proof = await db.proofs.find_one({"id": proof_id}, {"_id": 0, field: 1, "file_id": 1})
+    if not proof:
+        raise HTTPException(status_code=404, detail="Proof not found")
+    data_url = proof.get(field)
+    # Only the requested variant is immutable; a stand-in for a missing thumbnail is
+    # cached briefly so clients pick up the thumbnail once it has been built
+    if data_url or not thumbnail:
+        cache_control = "private, max-age=31536000, immutable"
+    else:
+        cache_control = f"private, max-age={PROOF_FALLBACK_MAX_AGE_S}"
+    if not data_url and thumbnail and not proof.get("file_id"):
+        # No thumbnail was generated (Pillow missing); fall back to the full image
+        data_url = (await db.proofs.find_one({"id": proof_id}, {"_id": 0, "image": 1})).get("image")
+    if data_url:
+        mime, payload = image_pipeline.split_data_url(data_url)
+        return Response(
+            base64.b64decode(payload),
+            media_type=mime or "image/jpeg",
+            headers={"Cache-Control": cache_control}
+        )
+    if proof.get("file_id"):
+        response = await download_proof_file(proof["file_id"])
+        response.headers["Cache-Control"] = cache_control
+        return response
+    raise HTTPException(status_code=404, detail="Proof has no image")
+
+@api_router.post("/champ/delivery-action/upload", response_model=Shipment)
+@touches("shipments", "delivery_attempts")
+async def champ_delivery_action_upload(
+    shipment_id: str = Form(...),
+    action: DeliveryOutcome = Form(...),
+    latitude: Optional[float] = Form(None),
+    longitude: Optional[float] = Form(None),
+    notes: Optional[str] = Form(None),
+    payment_collected: float = Form(0),
+    payment_method_used: Optional[PaymentMethod] = Form(None),
+    reschedule_date: Optional[str] = Form(None),
+    cancellation_reason: Optional[str] = Form(None),
+    upload_id: Optional[str] = Form(None),
+    proof_image: Optional[UploadFile] = File(None)
+):
+    """multipart/form-data variant of /champ/delivery-action with the photo as a binary part"""
+    delivery_action = ChampDeliveryAction(
+        shipment_id=shipment_id,
+        action=action,
+        latitude=latitude,
+        longitude=longitude,
+        notes=notes,
+        payment_collected=payment_collected,
+        payment_method_used=payment_method_used,
+        reschedule_date=reschedule_date,
+        cancellation_reason=cancellation_reason
+    )
+    shipment = await db.shipments.find_one({"id": shipment_id}, {"_id": 0})
+    if not shipment:
+        raise HTTPException(status_code=404, detail="Shipment not found")
+    if action == DeliveryOutcome.RESCHEDULED:
+        checked_reschedule_day(reschedule_date)
+    proof = {}
+    if action in (DeliveryOutcome.DELIVERED, DeliveryOutcome.CANCELLED):
+        proof = await resolve_proof_upload(proof_image, upload_id, f"shipment:{shipment_id}")
+    return await record_delivery_action(shipment, delivery_action, proof)
+
+@api_router.post("/pickups/{pickup_id}/complete-with-proof/upload", response_model=Pickup)
+@touches("pickups")
+async def complete_pickup_with_proof_upload(
+    pickup_id: str,
+    latitude: Optional[float] = Form(None),
+    longitude: Optional[float] = Form(None),
+    notes: Optional[str] = Form(None),
+    collected_value: float = Form(0),
+    delivered_item_indices: Optional[str] = Form(None, description="Comma separated item indices"),
+    upload_id: Optional[str] = Form(None),
+    proof_image: Optional[UploadFile] = File(None)
+):
+    """multipart/form-data variant of /pickups/{pickup_id}/complete-with-proof"""
+    try:
+        indices = [int(i) for i in delivered_item_indices.split(",") if i.strip()] if delivered_item_indices is not None else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="delivered_item_indices must be comma separated integers")
+    proof = PickupCompletionProof(
+        pickup_id=pickup_id,
+        latitude=latitude,
+        longitude=longitude,
+        notes=notes,
+        collected_value=collected_value,
+        delivered_item_indices=indices
+    )
+    pickup = await db.pickups.find_one({"id": pickup_id}, {"_id": 0})
+    if not pickup:
+        raise HTTPException(status_code=404, detail="Pickup not found")
+    proof_image_ref = await resolve_proof_upload(proof_image, upload_id, f"pickup:{pickup_id}")
+    return await record_pickup_completion(pickup, proof, proof_image_ref)
 
 @api_router.get("/champ/{champ_id}/pickups", response_model=List[Pickup])
 async def get_champ_pickups(champ_id: str):
     """Get all pickups assigned to a champ"""
     pickups = await db.pickups.find(
         {"champ_id": champ_id, "status": {"$in": ["assigned", "in_progress"]}},
-        {"_id": 0}
+        model_projection(Pickup)
     ).to_list(100)
-    return pickups
+    return list_response(Pickup, pickups)
+
+# ==================== GEO QUERIES ====================
+OPEN_PICKUP_STATUSES = [PickupStatus.PENDING.value, PickupStatus.ASSIGNED.value, PickupStatus.IN_PROGRESS.value]
+
+def parse_bbox(bbox: str) -> dict:
+    """Turn "min_lng,min_lat,max_lng,max_lat" into a GeoJSON polygon"""
+    try:
+        min_lng, min_lat, max_lng, max_lat = (float(v) for v in bbox.split(","))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="bbox must be min_lng,min_lat,max_lng,max_lat")
+    if min_lng >= max_lng or min_lat >= max_lat:
+        raise HTTPException(status_code=400, detail="bbox minimums must be below maximums")
+    return {"type": "Polygon", "coordinates": [[
+        [min_lng, min_lat], [max_lng, min_lat], [max_lng, max_lat], [min_lng, max_lat], [min_lng, min_lat]
+    ]]}
+
+async def find_nearby(collection, key: str, query: dict, projection: dict, latitude: Optional[float],
+                      longitude: Optional[float], radius_m: float, bbox: Optional[str], limit: int) -> List[dict]:
+    """Points of `key` within radius_m of a point (nearest first) or inside a bbox"""
+    if bbox:
+        query = {**query, key: {"$geoWithin": {"$geometry": parse_bbox(bbox)}}}
+        return await collection.find(query, projection).limit(limit).to_list(limit)
+    center = geo_point(latitude, longitude)
+    if center is None:
+        raise HTTPException(status_code=400, detail="Provide a valid latitude and longitude, or a bbox")
+    pipeline = [
+        {"$geoNear": {
+            "near": center,
+            "key": key,
+            "distanceField": "distance_m",
+            "maxDistance": radius_m,
+            "query": query,
+            "spherical": True
+        }},
+        {"$limit": limit},
+        {"$project": {**projection, "distance_m": 1}}
+    ]
+    return await collection.aggregate(pipeline).to_list(limit)
+
+@api_router.get("/geo/nearby/shipments")
+async def get_nearby_shipments(
+    latitude: Optional[float] = None,
+    longitude: Optional[float] = None,
+    radius_m: float = Query(2000, gt=0, le=100000),
+    bbox: Optional[str] = None,
+    status: Optional[ShipmentStatus] = None,
+    route: Optional[str] = None,
+    limit: int = Query(200, ge=1, le=2000)
+):
+    """Shipments whose delivery proof was captured near a point or inside a bbox"""
+    query = {}
+    if status:
+        query["status"] = status.value
+    if route:
+        query["route"] = route
+    projection = {
+        "_id": 0, "id": 1, "awb": 1, "status": 1, "route": 1, "recipient_name": 1,
+        "delivery_latitude": 1, "delivery_longitude": 1, "delivery_timestamp": 1, "delivered_by_champ_id": 1
+    }
+    return await find_nearby(reporting_db.shipments, "delivery_location", query, projection,
+                             latitude, longitude, radius_m, bbox, limit)
+
+@api_router.get("/geo/nearby/pickups")
+async def get_nearby_pickups(
+    latitude: Optional[float] = None,
+    longitude: Optional[float] = None,
+    radius_m: float = Query(2000, gt=0, le=100000),
+    bbox: Optional[str] = None,
+    status: Optional[List[PickupStatus]] = Query(None),
+    pickup_type: Optional[PickupType] = None,
+    completed: bool = False,
+    limit: int = Query(200, ge=1, le=2000)
+):
+    """Open pickups near a point by pickup address, or completed ones by proof location"""
+    key = "proof_location" if completed else "location"
+    query = {}
+    if status:
+        query["status"] = {"$in": [s.value for s in status]}
+    elif not completed:
+        query["status"] = {"$in": OPEN_PICKUP_STATUSES}
+    if pickup_type:
+        query["pickup_type"] = pickup_type.value
+    projection = {
+        "_id": 0, "id": 1, "pickup_type": 1, "status": 1, "seller_name": 1, "customer_name": 1,
+        "champ_id": 1, "latitude": 1, "longitude": 1, "proof_latitude": 1, "proof_longitude": 1
+    }
+    return await find_nearby(reporting_db.pickups, key, query, projection,
+                             latitude, longitude, radius_m, bbox, limit)
+
+# (collection, latitude field, longitude field, GeoJSON field)
+GEO_BACKFILLS = [
+    ("shipments", "delivery_latitude", "delivery_longitude", "delivery_location"),
+    ("pickups", "proof_latitude", "proof_longitude", "proof_location"),
+    ("pickups", "latitude", "longitude", "location"),
+]
+
+@api_router.post("/geo/backfill")
+async def backfill_geo_points(batch_size: int = Query(1000, ge=1, le=10000), max_batches: int = Query(100, ge=1)):
+    """Populate GeoJSON fields from stored latitude/longitude in batches; safe to re-run until done"""
+    updated = {}
+    for collection, lat_field, lng_field, geo_field in GEO_BACKFILLS:
+        key = f"{collection}.{geo_field}"
+        updated[key] = 0
+        query = {lat_field: {"$type": "number"}, lng_field: {"$type": "number"}, geo_field: {"$exists": False}}
+        projection = {"_id": 1, lat_field: 1, lng_field: 1}
+        for _ in range(max_batches):
+            docs = await db[collection].find(query, projection).limit(batch_size).to_list(batch_size)
+            if not docs:
+                break
+            ops = [
+                UpdateOne({"_id": d["_id"]}, {"$set": {geo_field: geo_point(d[lat_field], d[lng_field])}})
+                for d in docs
+            ]
+            await db[collection].bulk_write(ops, ordered=False)
+            updated[key] += len(ops)
+    return {"updated": updated}
+
+# ==================== CHAMP LOCATIONS ====================
+# The champ app batches GPS pings and posts them every few seconds. Pings are kept in
+# the `champ_locations` time-series collection (a plain collection with a TTL index on
+# servers without time-series support) for LOCATION_RETENTION_S. Each worker keeps the
+# latest position per champ in memory: its own ingests update it directly and pings
+# received by other workers are folded in incrementally, at most every
+# LOCATION_INDEX_REFRESH_S. At 500 champs pinging every 10 s that is ~50 small inserts a
+# second; writes share at most LOCATION_WRITE_CONCURRENCY pool connections, don't touch
+# collection versions and don't go through the job queue, so they can't crowd out scans.
+LOCATION_RETENTION_S = env_int("LOCATION_RETENTION_S", 7 * 86400)
+LOCATION_MAX_PINGS = env_int("LOCATION_MAX_PINGS", 500)
+LOCATION_MAX_FUTURE_S = env_int("LOCATION_MAX_FUTURE_S", 300)
+LOCATION_WRITE_CONCURRENCY = env_int("LOCATION_WRITE_CONCURRENCY", 4)
+LOCATION_INDEX_REFRESH_S = env_int("LOCATION_INDEX_REFRESH_S", 5)
+LOCATION_INDEX_MAX_AGE_S = env_int("LOCATION_INDEX_MAX_AGE_S", 3600)
+# Pings committed by other workers slightly out of received_at order are still picked up
+LOCATION_REFRESH_OVERLAP_S = 2
+# What servers without time-series support (before 5.0) answer to the `timeseries`
+# option: InvalidOptions, CommandNotSupported, or an unknown-field error
+TIMESERIES_UNSUPPORTED_CODES = {72, 115, 40415}
+NAMESPACE_EXISTS = 48
+
+class LocationPing(BaseModel):
+    latitude: float = Field(ge=-90, le=90)
+    longitude: float = Field(ge=-180, le=180)
+    recorded_at: datetime
+    accuracy_m: Optional[float] = Field(None, ge=0)
+    speed_mps: Optional[float] = Field(None, ge=0)
+    heading: Optional[float] = Field(None, ge=0, lt=360)
+    battery: Optional[float] = Field(None, ge=0, le=100)
+
+class LocationPingBatch(BaseModel):
+    pings: List[LocationPing] = Field(min_length=1, max_length=LOCATION_MAX_PINGS)
+
+async def ensure_location_collection():
+    if "champ_locations" in await db.list_collection_names(filter={"name": "champ_locations"}):
+        return
+    try:
+        await db.create_collection(
+            "champ_locations",
+            timeseries={"timeField": "received_at", "metaField": "champ_id", "granularity": "seconds"},
+            expireAfterSeconds=LOCATION_RETENTION_S
+        )
+    except CollectionInvalid:
+        # Another worker (or a ping's insert) created it between the check and the create
+        await ensure_location_ttl()
+    except OperationFailure as exc:
+        if exc.code == NAMESPACE_EXISTS:
+            await ensure_location_ttl()
+        elif exc.code in TIMESERIES_UNSUPPORTED_CODES:
+            logger.warning("Time-series collections unavailable; storing champ locations in a TTL collection")
+            await db.champ_locations.create_index("received_at", expireAfterSeconds=LOCATION_RETENTION_S)
+        else:
+            raise
+
+async def ensure_location_ttl():
+    """A plain champ_locations collection (created by an insert, or on an older server) needs the TTL index"""
+    info = await db.list_collections(filter={"name": "champ_locations"}).to_list(1)
+    if info and info[0].get("type") != "timeseries":
+        await db.champ_locations.create_index("received_at", expireAfterSeconds=LOCATION_RETENTION_S)
+
+def as_utc(value: datetime) -> datetime:
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+def location_entry(champ_id: str, doc: dict) -> dict:
+    longitude, latitude = doc["location"]["coordinates"]
+    return {
+        "champ_id": champ_id,
+        "latitude": latitude,
+        "longitude": longitude,
+        "recorded_at": as_utc(doc["recorded_at"]),
+        "received_at": as_utc(doc["received_at"]),
+        "accuracy_m": doc.get("accuracy_m"),
+        "speed_mps": doc.get("speed_mps"),
+        "heading": doc.get("heading"),
+        "battery": doc.get("battery"),
+    }
+
+class LatestLocations:
+    """champ_id -> most recent ping (by device time) seen by any worker"""
+
+    def __init__(self):
+        self._latest: Dict[str, dict] = {}
+        self._watermark: Optional[datetime] = None
+        self._refreshed_at = 0.0
+        self._refresh_lock = asyncio.Lock()
+
+    def offer(self, entry: dict):
+        current = self._latest.get(entry["champ_id"])
+        if current is None or entry["recorded_at"] >= current["recorded_at"]:
+            self._latest[entry["champ_id"]] = entry
+
+    async def load(self):
+        started = datetime.now(timezone.utc)
+        since = started - timedelta(seconds=LOCATION_INDEX_MAX_AGE_S)
+        rows = await reporting_db.champ_locations.aggregate([
+            {"$match": {"received_at": {"$gte": since}}},
+            {"$sort": {"recorded_at": 1}},
+            {"$group": {"_id": "$champ_id", "doc": {"$last": "$$ROOT"}}},
+        ], allowDiskUse=True).to_list(None)
+        self._latest = {}
+        for row in rows:
+            self.offer(location_entry(row["_id"], row["doc"]))
+        self._watermark = started
+        self._refreshed_at = time.monotonic()
+
+    async def refresh(self):
+        if time.monotonic() - self._refreshed_at < LOCATION_INDEX_REFRESH_S:
+            return
+        async with self._refresh_lock:
+            if time.monotonic() - self._refreshed_at < LOCATION_INDEX_REFRESH_S:
+                return
+            if self._watermark is None:
+                await self.load()
+                return
+            started = datetime.now(timezone.utc)
+            since = self._watermark - timedelta(seconds=LOCATION_REFRESH_OVERLAP_S)
+            cursor = db.champ_locations.find({"received_at": {"$gt": since}}, {"_id": 0})
+            async for doc in cursor:
+                self.offer(location_entry(doc["champ_id"], doc))
+            cutoff = started - timedelta(seconds=LOCATION_INDEX_MAX_AGE_S)
+            self._latest = {k: v for k, v in self._latest.items() if v["received_at"] >= cutoff}
+            self._watermark = started
+            self._refreshed_at = time.monotonic()
+
+    async def all(self) -> List[dict]:
+        await self.refresh()
+        return list(self._latest.values())
+
+latest_locations = LatestLocations()
+_location_writes = asyncio.Semaphore(LOCATION_WRITE_CONCURRENCY)
+
+@api_router.post("/champ/{champ_id}/locations")
+async def record_champ_locations(champ_id: str, batch: LocationPingBatch):
+    """Store a batch of GPS pings from the champ app"""
+    if not await champ_directory.get(champ_id):
+        raise HTTPException(status_code=404, detail="Champ not found")
+    received_at = datetime.now(timezone.utc)
+    latest_allowed = received_at + timedelta(seconds=LOCATION_MAX_FUTURE_S)
+    docs = []
+    for ping in batch.pings:
+        recorded_at = as_utc(ping.recorded_at)
+        # Devices with a wrong clock would otherwise pin the latest position forever
+        if recorded_at > latest_allowed:
+            continue
+        doc = {
+            "champ_id": champ_id,
+            "received_at": received_at,
+            "recorded_at": recorded_at,
+            "location": geo_point(ping.latitude, ping.longitude),
+        }
+        for field in ("accuracy_m", "speed_mps", "heading", "battery"):
+            value = getattr(ping, field)
+            if value is not None:
+                doc[field] = value
+        docs.append(doc)
+    if docs:
+        async with _location_writes:
+            await db.champ_locations.insert_many(docs, ordered=False)
+        latest_locations.offer(location_entry(champ_id, max(docs, key=lambda d: d["recorded_at"])))
+    return {"accepted": len(docs), "rejected": len(batch.pings) - len(docs)}
+
+@api_router.get("/geo/champs")
+async def get_champ_positions(
+    max_age_s: int = Query(900, ge=1),
+    route: Optional[str] = None,
+    active_only: bool = True
+):
+    """Latest known position of each champ, newest first"""
+    now = datetime.now(timezone.utc)
+    cutoff = now - timedelta(seconds=max_age_s)
+    positions = []
+    for entry in await latest_locations.all():
+        if entry["recorded_at"] < cutoff:
+            continue
+        champ = await champ_directory.get(entry["champ_id"])
+        if not champ or (active_only and not champ.get("is_active", True)):
+            continue
+        if route and route not in champ.get("assigned_routes", []):
+            continue
+        age_s = round((now - entry["recorded_at"]).total_seconds())
+        positions.append({**entry, "champ_name": champ["name"], "age_s": age_s})
+    positions.sort(key=lambda p: p["recorded_at"], reverse=True)
+    return positions
+
+@api_router.get("/geo/champs/{champ_id}/track")
+async def get_champ_track(
+    champ_id: str,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    limit: int = Query(1000, ge=1, le=10000)
+):
+    """A champ's pings in device time order, for replaying a route"""
+    received = {"$gte": as_utc(since) if since else datetime.now(timezone.utc) - timedelta(hours=12)}
+    if until:
+        received["$lte"] = as_utc(until)
+    docs = await reporting_db.champ_locations.find(
+        {"champ_id": champ_id, "received_at": received}, {"_id": 0}
+    ).sort("received_at", 1).limit(limit).to_list(limit)
+    track = [location_entry(champ_id, doc) for doc in docs]
+    track.sort(key=lambda p: p["recorded_at"])
+    return track
+
+# ==================== SEARCH ====================
+SEARCH_PROJECTIONS = {
+    "shipments": {
+        "_id": 0, "id": 1, "awb": 1, "recipient_name": 1, "recipient_phone": 1, "recipient_address": 1,
+        "route": 1, "status": 1, "created_at": 1
+    },
+    "pickups": {
+        "_id": 0, "id": 1, "pickup_type": 1, "status": 1, "seller_name": 1, "seller_phone": 1,
+        "customer_name": 1, "customer_phone": 1, "champ_name": 1, "created_at": 1
+    },
+}
+
+# Fixed scores for the index lookups; text matches use their textScore (typically < 10)
+SEARCH_SCORES = {"awb_exact": 100, "awb_prefix": 60, "phone": 50, "name_prefix": 20}
+SEARCH_MAX_DEPTH = 500
+
+def prefix_regex(value: str) -> dict:
+    """Anchored, case-sensitive regex so MongoDB can answer it with an index range scan"""
+    return {"$regex": f"^{re.escape(value)}"}
+
+def search_lookups(collection: str, q: str) -> List[tuple]:
+    """(match label, query) pairs to try for a search term, strongest first"""
+    lookups = []
+    term = q.strip()
+    awb = normalize_awb(term)
+    digits = phone_digits(term)
+    if collection == "shipments" and awb and " " not in term:
+        lookups.append(("awb_exact", {"awb_norm": awb}))
+        lookups.append(("awb_prefix", {"awb_norm": prefix_regex(awb)}))
+    if len(digits) >= 3 and len(digits) >= len(re.sub(r"[\s+()-]", "", term)):
+        lookups.append(("phone", {"$or": [
+            {"phone_digits": prefix_regex(digits)},
+            {"phone_digits_rev": prefix_regex(digits[::-1])}
+        ]}))
+    if len(term) >= 2 and any(ch.isalpha() for ch in term):
+        lookups.append(("name_prefix", {"name_norm": prefix_regex(term.lower())}))
+    return lookups
+
+async def search_collection(collection: str, q: str, depth: int, extra: dict, archived: bool = False) -> List[dict]:
+    """Ranked hits from one collection (or its archive): index lookups first, then the text index"""
+    coll = reporting_db[f"{collection}_archive" if archived else collection]
+    projection = SEARCH_PROJECTIONS[collection]
+    kind = {"type": collection[:-1], "archived": True} if archived else {"type": collection[:-1]}
+    hits: Dict[str, dict] = {}
+    for label, query in search_lookups(collection, q):
+        docs = await coll.find({**query, **extra}, projection).limit(depth).to_list(depth)
+        for doc in docs:
+            if doc["id"] not in hits:
+                hits[doc["id"]] = {**doc, **kind, "matched": label, "score": SEARCH_SCORES[label]}
+    text_query = {"$text": {"$search": q}, **extra}
+    docs = await coll.find(
+        text_query, {**projection, "score": {"$meta": "textScore"}}
+    ).sort([("score", {"$meta": "textScore"})]).limit(depth).to_list(depth)
+    for doc in docs:
+        if doc["id"] not in hits:
+            hits[doc["id"]] = {**doc, **kind, "matched": "text"}
+    return list(hits.values())
+
+@api_router.get("/search")
+async def search(
+    q: str = Query(..., min_length=2, max_length=100),
+    scope: str = Query("all", pattern="^(all|shipments|pickups)$"),
+    status: Optional[str] = None,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(20, ge=1, le=100),
+    include_archived: bool = True
+):
+    """Search shipments and pickups by AWB, phone number (prefix or last digits), name or address.
+    Archived shipments are searched when live shipments don't fill the requested page."""
+    if offset + limit > SEARCH_MAX_DEPTH:
+        raise HTTPException(status_code=400, detail=f"Cannot page beyond {SEARCH_MAX_DEPTH} results")
+    depth = offset + limit + 1
+    extra = {"status": status} if status else {}
+    collections = ["shipments", "pickups"] if scope == "all" else [scope]
+    results = await asyncio.gather(*(search_collection(c, q, depth, extra) for c in collections))
+    hits = [hit for result in results for hit in result]
+    live_shipments = {h["id"] for h in hits if h["type"] == "shipment"}
+    if include_archived and "shipments" in collections and len(live_shipments) < depth:
+        archived = await search_collection("shipments", q, depth - len(live_shipments), extra, archived=True)
+        hits += [h for h in archived if h["id"] not in live_shipments]
+    hits.sort(key=lambda h: (h["score"], h.get("created_at") or ""), reverse=True)
+    return {
+        "query": q,
+        "offset": offset,
+        "limit": limit,
+        "has_more": len(hits) > offset + limit,
+        "hits": hits[offset:offset + limit]
+    }
+
+SEARCH_BACKFILLS = [
+    ("shipments", *SHIPMENT_SEARCH_SOURCES),
+    ("pickups", *PICKUP_SEARCH_SOURCES),
+]
+
+@api_router.post("/search/backfill")
+async def backfill_search_fields(batch_size: int = Query(1000, ge=1, le=10000), max_batches: int = Query(100, ge=1)):
+    """Populate normalised search fields for documents created before search indexing"""
+    updated = {}
+    for collection, name_fields, phone_fields, awb_field in SEARCH_BACKFILLS:
+        updated[collection] = 0
+        projection = {"_id": 1, **{f: 1 for f in name_fields + phone_fields}}
+        if awb_field:
+            projection[awb_field] = 1
+        for _ in range(max_batches):
+            docs = await db[collection].find({"phone_digits": {"$exists": False}}, projection).limit(batch_size).to_list(batch_size)
+            if not docs:
+                break
+            ops = []
+            for d in docs:
+                fields = derived_search_fields(d, name_fields, phone_fields, awb_field)
+                ops.append(UpdateOne({"_id": d["_id"]}, {"$set": fields}))
+            await db[collection].bulk_write(ops, ordered=False)
+            updated[collection] += len(ops)
+    return {"updated": updated}
+
+# ==================== CUSTOMER TRACKING ====================
+# Public, unauthenticated endpoint for the customer tracking portal. It returns a
+# status timeline only: no phone, address, payment or proof data. Tracking refreshes
+# cluster on the same few AWBs, so responses are kept in a per-process cache (no
+# network hop even when CACHE_BACKEND=mongo), concurrent misses for one AWB share a
+# single query, and reads go to the reporting read preference.
+TRACKING_CACHE_TTL_S = env_int("TRACKING_CACHE_TTL_S", 15)
+TRACKING_NOT_FOUND_TTL_S = env_int("TRACKING_NOT_FOUND_TTL_S", 5)
+TRACKING_CACHE_ENTRIES = env_int("TRACKING_CACHE_ENTRIES", 50000)
+TRACKING_RATE_PER_MIN = env_int("TRACKING_RATE_PER_MIN", 120)
+TRACKING_TRUST_PROXY = env_int("TRACKING_TRUST_PROXY", 0)
+
+TRACKING_STATUS_LABELS = {
+    ShipmentStatus.PENDING_HANDOVER.value: "Order received",
+    ShipmentStatus.IN_SCANNED.value: "Arrived at delivery hub",
+    ShipmentStatus.ASSIGNED_TO_BIN.value: "Arrived at delivery hub",
+    ShipmentStatus.ASSIGNED_TO_CHAMP.value: "Preparing for delivery",
+    ShipmentStatus.OUT_FOR_DELIVERY.value: "Out for delivery",
+    ShipmentStatus.DELIVERED.value: "Delivered",
+    ShipmentStatus.CANCELLED.value: "Delivery cancelled",
+    ShipmentStatus.NO_RESPONSE.value: "Delivery attempted, no response",
+    ShipmentStatus.RESCHEDULED.value: "Delivery rescheduled",
+    ShipmentStatus.RETURNED_TO_WH.value: "Back at delivery hub",
+}
+
+# Both caches are per process: limits apply per worker and entries are never shared
+tracking_cache = InMemoryCache(max_entries=TRACKING_CACHE_ENTRIES)
+tracking_limiter = InMemoryCache(max_entries=TRACKING_CACHE_ENTRIES)
+_tracking_inflight: Dict[str, asyncio.Future] = {}
+
+def client_ip(request: Request) -> str:
+    if TRACKING_TRUST_PROXY:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",", 1)[0].strip()
+    return request.client.host if request.client else "unknown"
+
+def run_sheet_scanned_out(shipment: dict) -> Optional[str]:
+    return (shipment.get("run_sheet") or [{}])[0].get("scanned_out_at")
+
+def tracking_timeline(shipment: dict) -> List[dict]:
+    events = [{"status": ShipmentStatus.PENDING_HANDOVER.value, "at": shipment.get("created_at")}]
+    if shipment.get("inscan_date"):
+        events.append({
+            "status": ShipmentStatus.IN_SCANNED.value,
+            "at": f"{shipment['inscan_date']}T{shipment.get('inscan_time') or '00:00:00'}+00:00"
+        })
+    scanned_out_at = run_sheet_scanned_out(shipment)
+    if scanned_out_at:
+        events.append({"status": ShipmentStatus.OUT_FOR_DELIVERY.value, "at": scanned_out_at})
+    for attempt in shipment.get("attempts", []):
+        if attempt.get("outcome") != DeliveryOutcome.DELIVERED.value:
+            events.append({"status": attempt["outcome"], "at": attempt.get("attempted_at") or attempt.get("created_at")})
+    if shipment.get("delivery_timestamp"):
+        events.append({"status": ShipmentStatus.DELIVERED.value, "at": shipment["delivery_timestamp"]})
+    if shipment["status"] not in {e["status"] for e in events}:
+        events.append({"status": shipment["status"], "at": shipment.get("updated_at")})
+    events = [{**e, "at": e["at"].isoformat() if isinstance(e["at"], datetime) else e["at"]} for e in events]
+    events.sort(key=lambda e: e["at"] or "")
+    return [{**e, "label": TRACKING_STATUS_LABELS.get(e["status"], e["status"])} for e in events]
+
+async def load_tracking(awb: str) -> Optional[dict]:
+    """Cache entry for an AWB: {"etag", "body"}, or None when the AWB is unknown"""
+    docs = await reporting_db.shipments.aggregate(tracking_pipeline(awb, "delivery_attempts")).to_list(1)
+    if not docs:
+        docs = await reporting_db.shipments_archive.aggregate(tracking_pipeline(awb, "delivery_attempts_archive")).to_list(1)
+    if not docs:
+        return None
+    shipment = docs[0]
+    content = {
+        "awb": shipment["awb"],
+        "status": shipment["status"],
+        "status_label": TRACKING_STATUS_LABELS.get(shipment["status"], shipment["status"]),
+        "rescheduled_date": shipment.get("rescheduled_date"),
+        "eta": eta_for(await eta_predictor.current(), shipment, run_sheet_scanned_out(shipment)),
+        "timeline": tracking_timeline(shipment),
+    }
+    body = DefaultResponse(content).body
+    return {"etag": f'"{hashlib.sha1(body).hexdigest()[:20]}"', "body": body}
+
+def tracking_pipeline(awb: str, attempts_collection: str) -> List[dict]:
+    return [
+        {"$match": {"awb": awb}},
+        {"$limit": 1},
+        {"$project": {
+            "_id": 0, "id": 1, "awb": 1, "status": 1, "route": 1, "run_sheet_id": 1, "rescheduled_date": 1,
+            "inscan_date": 1, "inscan_time": 1, "delivery_timestamp": 1, "created_at": 1, "updated_at": 1
+        }},
+        {"$lookup": {
+            "from": attempts_collection, "localField": "id", "foreignField": "shipment_id", "as": "attempts",
+            "pipeline": [{"$project": {"_id": 0, "outcome": 1, "attempted_at": 1, "created_at": 1}}]
+        }},
+        {"$lookup": {
+            "from": "run_sheets", "localField": "run_sheet_id", "foreignField": "id", "as": "run_sheet",
+            "pipeline": [{"$project": {"_id": 0, "scanned_out_at": 1}}]
+        }},
+    ]
+
+async def get_tracking_entry(awb: str) -> Optional[dict]:
+    key = f"track:{awb}"
+    entry = await tracking_cache.get(key)
+    if entry is not None:
+        return entry or None
+    inflight = _tracking_inflight.get(awb)
+    if inflight is not None:
+        return await asyncio.shield(inflight)
+    future = asyncio.get_running_loop().create_future()
+    _tracking_inflight[awb] = future
+    try:
+        entry = await load_tracking(awb)
+        # Unknown AWBs are cached too (as {}) so guessing doesn't reach the database
+        await tracking_cache.set(key, entry or {}, TRACKING_CACHE_TTL_S if entry else TRACKING_NOT_FOUND_TTL_S)
+        future.set_result(entry)
+        return entry
+    except BaseException as exc:
+        future.set_exception(exc)
+        future.exception()  # mark retrieved when no other request was waiting
+        raise
+    finally:
+        del _tracking_inflight[awb]
+
+@api_router.get("/track/{awb}")
+async def track_shipment(awb: str, request: Request):
+    """Public shipment tracking: current status and timeline, with ETag revalidation"""
+    window = int(time.time() // 60)
+    hits = await tracking_limiter.incr(f"{client_ip(request)}:{window}", ttl=60)
+    if hits > TRACKING_RATE_PER_MIN:
+        raise HTTPException(
+            status_code=429, detail="Too many tracking requests",
+            headers={"Retry-After": str(60 - int(time.time()) % 60)}
+        )
+    entry = await get_tracking_entry(awb.strip())
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Shipment not found")
+    headers = {"ETag": entry["etag"], "Cache-Control": f"public, max-age={TRACKING_CACHE_TTL_S}"}
+    if entry["etag"] in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+    return Response(entry["body"], media_type="application/json", headers=headers)
+
+# ==================== ARCHIVE ====================
+# Shipments that reached a terminal status more than ARCHIVE_AFTER_DAYS ago move, with
+# their delivery attempts, to shipments_archive / delivery_attempts_archive so the live
+# collections only hold the working set. Proofs travel inside the shipment document
+# (uploaded photos stay in GridFS, referenced by file id). Single-shipment reads,
+# delivery attempts by shipment, search and tracking fall back to the archive.
+ARCHIVE_AFTER_DAYS = env_int("ARCHIVE_AFTER_DAYS", 90)  # 0 disables scheduled archiving
+ARCHIVE_INTERVAL_S = env_int("ARCHIVE_INTERVAL_S", 6 * 3600)
+ARCHIVE_BATCH_SIZE = env_int("ARCHIVE_BATCH_SIZE", 500)
+ARCHIVE_BATCHES_PER_JOB = env_int("ARCHIVE_BATCHES_PER_JOB", 20)
+ARCHIVE_JOB_KEY = "archive_shipments"
+ARCHIVED_SHIPMENT_STATUSES = [
+    ShipmentStatus.DELIVERED.value,
+    ShipmentStatus.CANCELLED.value,
+    ShipmentStatus.RETURNED_TO_WH.value,
+]
+
+async def find_shipment(query: dict) -> Optional[dict]:
+    """A live shipment, or its archived copy"""
+    shipment = await db.shipments.find_one(query, {"_id": 0})
+    if shipment is None:
+        shipment = await db.shipments_archive.find_one(query, {"_id": 0})
+    return shipment
+
+def archive_query(after_days: int) -> dict:
+    cutoff = (datetime.now(timezone.utc) - timedelta(days=after_days)).isoformat()
+    return {"status": {"$in": ARCHIVED_SHIPMENT_STATUSES}, "updated_at": {"$lt": cutoff}}
+
+async def archive_shipment_batch(query: dict, batch_size: int) -> Tuple[int, int]:
+    """Move one batch; returns (shipments read, shipments moved).
+
+    Copies are upserts keyed on _id and happen before the deletes, so a run that dies
+    part way leaves documents in both places and the next run finishes the move.
+    Attempts are only deleted for shipments that were actually deleted.
+    """
+    shipments = await db.shipments.find(query).limit(batch_size).to_list(batch_size)
+    if not shipments:
+        return 0, 0
+    attempts = await db.delivery_attempts.find(
+        {"shipment_id": {"$in": [s["id"] for s in shipments]}}
+    ).to_list(None)
+    now = datetime.now(timezone.utc).isoformat()
+    if attempts:
+        await db.delivery_attempts_archive.bulk_write(
+            [ReplaceOne({"_id": a["_id"]}, a, upsert=True) for a in attempts], ordered=False
+        )
+    await db.shipments_archive.bulk_write(
+        [ReplaceOne({"_id": s["_id"]}, {**s, "archived_at": now}, upsert=True) for s in shipments], ordered=False
+    )
+    # Re-checking the query skips shipments updated since they were read; their
+    # archived copies are overwritten when they qualify again
+    ids = [s["_id"] for s in shipments]
+    await db.shipments.delete_many({"_id": {"$in": ids}, **query})
+    kept = {d["_id"] for d in await db.shipments.find({"_id": {"$in": ids}}, {"_id": 1}).to_list(None)}
+    removed = {s["id"] for s in shipments if s["_id"] not in kept}
+    moved_attempts = [a["_id"] for a in attempts if a["shipment_id"] in removed]
+    if moved_attempts:
+        await db.delivery_attempts.delete_many({"_id": {"$in": moved_attempts}})
+    return len(shipments), len(removed)
+
+@job_handler("archive_shipments")
+async def archive_shipments(after_days: int):
+    query = archive_query(after_days)
+    moved = 0
+    more = False
+    for _ in range(ARCHIVE_BATCHES_PER_JOB):
+        read, count = await archive_shipment_batch(query, ARCHIVE_BATCH_SIZE)
+        moved += count
+        if read < ARCHIVE_BATCH_SIZE:
+            break
+    else:
+        more = True
+    if moved:
+        await touch("shipments", "delivery_attempts")
+        logger.info("Archived %d shipments older than %d days", moved, after_days)
+    if more:
+        # Continue in a fresh job so one run never outlives its visibility timeout
+        await enqueue_job("archive_shipments", key=ARCHIVE_JOB_KEY, after_days=after_days)
+    elif ARCHIVE_AFTER_DAYS:
+        await enqueue_job("archive_shipments", delay_s=ARCHIVE_INTERVAL_S, key=ARCHIVE_JOB_KEY, after_days=ARCHIVE_AFTER_DAYS)
+
+async def schedule_archiving():
+    if not ARCHIVE_AFTER_DAYS:
+        return
+    try:
+        await enqueue_job("archive_shipments", key=ARCHIVE_JOB_KEY, after_days=ARCHIVE_AFTER_DAYS)
+    except Exception:
+        logger.exception("Could not schedule shipment archiving")
+
+@api_router.post("/archive/run")
+async def run_archive(after_days: int = Query(ARCHIVE_AFTER_DAYS or 90, ge=1)):
+    """Queue an archive pass now; at most one pass waits in the queue at a time"""
+    job_id = await enqueue_job("archive_shipments", key=ARCHIVE_JOB_KEY, after_days=after_days)
+    return {"queued": job_id is not None, "job_id": job_id, "after_days": after_days}
+
+@api_router.get("/archive/stats")
+async def get_archive_stats():
+    live, eligible, archived, archived_attempts = await asyncio.gather(
+        reporting_db.shipments.estimated_document_count(),
+        reporting_db.shipments.count_documents(archive_query(ARCHIVE_AFTER_DAYS or 90)),
+        reporting_db.shipments_archive.estimated_document_count(),
+        reporting_db.delivery_attempts_archive.estimated_document_count(),
+    )
+    return {
+        "after_days": ARCHIVE_AFTER_DAYS,
+        "live_shipments": live,
+        "eligible_shipments": eligible,
+        "archived_shipments": archived,
+        "archived_delivery_attempts": archived_attempts,
+    }
+
+# ==================== BATCH READS ====================
+# One request and one $in query per collection for screens that would otherwise resolve
+# hundreds of IDs one GET at a time (a run sheet's parcels, an integration's sync).
+# Results are keyed by the requested identifier; identifiers with no document are listed
+# in `not_found`, in request order.
+BATCH_GET_MAX_IDS = env_int("BATCH_GET_MAX_IDS", 5000)
+
+class BatchGetRequest(BaseModel):
+    ids: List[str] = Field(default_factory=list, max_length=BATCH_GET_MAX_IDS)
+
+class ShipmentBatchGetRequest(BatchGetRequest):
+    awbs: List[str] = Field(default_factory=list, max_length=BATCH_GET_MAX_IDS)
+    include_archived: bool = True
+
+class ShipmentBatch(BaseModel):
+    found: Dict[str, Shipment]
+    not_found: List[str]
+
+class PickupBatch(BaseModel):
+    found: Dict[str, Pickup]
+    not_found: List[str]
+
+class RunSheetBatch(BaseModel):
+    found: Dict[str, RunSheet]
+    not_found: List[str]
+
+def batch_keys(values: List[str]) -> List[str]:
+    """Stripped identifiers without blanks or repeats, in request order"""
+    return list(dict.fromkeys(v.strip() for v in values if v and v.strip()))
+
+def batch_response(model: type, found: Dict[str, dict], requested: List[str]):
+    """Serialize a batch read the way list_response serializes lists"""
+    content = {"found": found, "not_found": [key for key in requested if key not in found]}
+    if SERIALIZATION_MODE == "adapter":
+        return Response(model.model_validate(content).model_dump_json(), media_type="application/json")
+    if SERIALIZATION_MODE == "passthrough":
+        return DefaultResponse(content)
+    return content
+
+async def find_by_keys(collection, field: str, keys: List[str], projection: dict) -> Dict[str, dict]:
+    if not keys:
+        return {}
+    docs = await collection.find({field: {"$in": keys}}, projection).to_list(None)
+    return {doc[field]: doc for doc in docs}
+
+@api_router.post("/shipments/batch-get", response_model=ShipmentBatch)
+async def batch_get_shipments(request: ShipmentBatchGetRequest):
+    """Shipments by `ids` and/or `awbs`, keyed by the requested ID or AWB"""
+    ids = batch_keys(request.ids)
+    awbs = batch_keys(request.awbs)
+    if len(ids) + len(awbs) > BATCH_GET_MAX_IDS:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_GET_MAX_IDS} ids and awbs per request")
+    projection = model_projection(Shipment)
+    found: Dict[str, dict] = {}
+
+    async def lookup(collection, ids: List[str], awbs: List[str]):
+        clauses = ([{"id": {"$in": ids}}] if ids else []) + ([{"awb": {"$in": awbs}}] if awbs else [])
+        if not clauses:
+            return
+        docs = await collection.find({"$or": clauses}, projection).to_list(None)
+        wanted_ids, wanted_awbs = set(ids), set(awbs)
+        for doc in docs:
+            if doc["id"] in wanted_ids:
+                found.setdefault(doc["id"], doc)
+            if doc["awb"] in wanted_awbs:
+                found.setdefault(doc["awb"], doc)
+
+    await lookup(db.shipments, ids, awbs)
+    if request.include_archived:
+        await lookup(db.shipments_archive, [i for i in ids if i not in found], [a for a in awbs if a not in found])
+    return batch_response(ShipmentBatch, found, ids + awbs)
+
+@api_router.post("/pickups/batch-get", response_model=PickupBatch)
+async def batch_get_pickups(request: BatchGetRequest):
+    """Pickups by `ids`, keyed by ID"""
+    ids = batch_keys(request.ids)
+    found = await find_by_keys(db.pickups, "id", ids, model_projection(Pickup))
+    return batch_response(PickupBatch, found, ids)
+
+@api_router.post("/run-sheets/batch-get", response_model=RunSheetBatch)
+async def batch_get_run_sheets(request: BatchGetRequest):
+    """Run sheets by `ids`, keyed by ID"""
+    ids = batch_keys(request.ids)
+    found = await find_by_keys(db.run_sheets, "id", ids, model_projection(RunSheet))
+    return batch_response(RunSheetBatch, found, ids)
+
+# ==================== DELIVERY ETA ====================
+# ETA = run sheet scan-out time + the median (and 80th percentile) scan-out-to-delivery
+# duration of past deliveries on the same route at the same scan-out hour. Training
+# streams delivered shipments (live and archived) joined to their run sheets, keeps a
+# bounded reservoir sample per (route, hour) bin and stores the bin quantiles in
+# `eta_models`. Scoring is a dict lookup against the model each worker holds in memory;
+# workers pick up a newly trained model within ETA_RELOAD_CHECK_S, without a restart.
+ETA_TRAINING_DAYS = env_int("ETA_TRAINING_DAYS", 60)
+ETA_MIN_SAMPLES = env_int("ETA_MIN_SAMPLES", 20)
+ETA_MAX_SAMPLES_PER_BIN = env_int("ETA_MAX_SAMPLES_PER_BIN", 5000)
+ETA_MAX_MINUTES = env_int("ETA_MAX_MINUTES", 24 * 60)
+ETA_TRAIN_OFFSET_S = env_int("ETA_TRAIN_OFFSET_S", 1800)
+ETA_RELOAD_CHECK_S = env_int("ETA_RELOAD_CHECK_S", 60)
+ETA_KEEP_MODELS = max(1, env_int("ETA_KEEP_MODELS", 7))
+ETA_JOB_KEY = "eta_train"
+ETA_VERSION_KEY = "eta:model_version"
+ETA_QUANTILES = (0.5, 0.8)
+ETA_ANY = "*"
+
+def quantiles(values: List[float], qs=ETA_QUANTILES) -> List[float]:
+    if np is not None:
+        return [float(v) for v in np.quantile(np.asarray(values, dtype=np.float64), qs)]
+    ordered = sorted(values)
+    result = []
+    for q in qs:
+        # Linear interpolation, matching numpy's default method
+        pos = q * (len(ordered) - 1)
+        low = int(pos)
+        high = min(low + 1, len(ordered) - 1)
+        result.append(ordered[low] + (ordered[high] - ordered[low]) * (pos - low))
+    return result
+
+def parse_timestamp(value: Any) -> Optional[datetime]:
+    if isinstance(value, datetime):
+        return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+    try:
+        parsed = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+class EtaModel:
+    """Quantile bins keyed (route, hour), with (route, *), (*, hour) and (*, *) fallbacks"""
+
+    def __init__(self, doc: Optional[dict] = None):
+        doc = doc or {}
+        self.version = doc.get("version")
+        self.trained_at = doc.get("trained_at")
+        self.bins: Dict[tuple, tuple] = {
+            (b["route"], b["hour"]): (b["p50"], b["p80"]) for b in doc.get("bins", [])
+        }
+
+    def predict(self, route: Optional[str], hour: int) -> Optional[tuple]:
+        """(p50 minutes, p80 minutes, basis) or None when there is no model"""
+        for key, basis in (((route, hour), "route_hour"), ((route, ETA_ANY), "route"), ((ETA_ANY, hour), "hour"), ((ETA_ANY, ETA_ANY), "global")):
+            found = self.bins.get(key)
+            if found:
+                return found[0], found[1], basis
+        return None
+
+def eta_for(model: EtaModel, shipment: dict, scanned_out_at: Any) -> Optional[dict]:
+    """Delivery window for a shipment out for delivery"""
+    if shipment.get("status") != ShipmentStatus.OUT_FOR_DELIVERY.value or not model.version:
+        return None
+    started = parse_timestamp(scanned_out_at)
+    if started is None:
+        return None
+    prediction = model.predict(shipment.get("route"), started.astimezone(OPERATIONS_TZ).hour)
+    if prediction is None:
+        return None
+    p50, p80, basis = prediction
+    return {
+        "expected_at": (started + timedelta(minutes=p50)).isoformat(),
+        "latest_at": (started + timedelta(minutes=p80)).isoformat(),
+        "basis": basis,
+        "model_version": model.version
+    }
+
+class EtaPredictor:
+    """The worker's current EtaModel, reloaded when a new one is trained"""
+
+    def __init__(self):
+        self.model = EtaModel()
+        self._checked_at = 0.0
+
+    async def load(self):
+        doc = await db.eta_models.find_one({}, {"_id": 0}, sort=[("trained_at", -1)])
+        self.model = EtaModel(doc)
+        self._checked_at = time.monotonic()
+
+    async def latest_version(self) -> Optional[str]:
+        # A per-process cache only knows versions this worker trained, so it can't be trusted
+        version = await cache.get(ETA_VERSION_KEY) if cache_is_shared() else None
+        if version is None:
+            # Only the version field, from the trained_at index, not the whole model
+            doc = await db.eta_models.find_one({}, {"_id": 0, "version": 1}, sort=[("trained_at", -1)])
+            version = doc["version"] if doc else None
+        return version
+
+    async def current(self) -> EtaModel:
+        if time.monotonic() - self._checked_at >= ETA_RELOAD_CHECK_S:
+            self._checked_at = time.monotonic()
+            if await self.latest_version() != self.model.version:
+                await self.load()
+        return self.model
+
+    async def fingerprint(self) -> str:
+        """Version of the model this worker scores with, for ETags of responses carrying an eta"""
+        return str((await self.current()).version)
+
+eta_predictor = EtaPredictor()
+
+def eta_training_pipeline(since: str) -> List[dict]:
+    return [
+        {"$match": {"status": ShipmentStatus.DELIVERED.value, "delivery_timestamp": {"$gte": since}}},
+        {"$project": {"_id": 0, "route": 1, "run_sheet_id": 1, "delivery_timestamp": 1}},
+        {"$lookup": {
+            "from": "run_sheets", "localField": "run_sheet_id", "foreignField": "id", "as": "run_sheet",
+            "pipeline": [{"$project": {"_id": 0, "scanned_out_at": 1}}]
+        }},
+        {"$project": {"route": 1, "delivery_timestamp": 1, "scanned_out_at": {"$first": "$run_sheet.scanned_out_at"}}},
+        {"$match": {"scanned_out_at": {"$ne": None}}},
+    ]
+
+async def train_eta_model() -> dict:
+    since = (datetime.now(timezone.utc) - timedelta(days=ETA_TRAINING_DAYS)).isoformat()
+    samples: Dict[tuple, List[float]] = {}
+    seen: Dict[tuple, int] = {}
+    rng = random.Random(0)
+    rows = 0
+    for collection in ("shipments", "shipments_archive"):
+        cursor = reporting_db[collection].aggregate(eta_training_pipeline(since), batchSize=5000)
+        async for row in cursor:
+            started = parse_timestamp(row["scanned_out_at"])
+            delivered = parse_timestamp(row["delivery_timestamp"])
+            if started is None or delivered is None:
+                continue
+            minutes = (delivered - started).total_seconds() / 60
+            if not 0 < minutes <= ETA_MAX_MINUTES:
+                continue
+            rows += 1
+            hour = started.astimezone(OPERATIONS_TZ).hour
+            route = row.get("route")
+            for key in ((route, hour), (route, ETA_ANY), (ETA_ANY, hour), (ETA_ANY, ETA_ANY)):
+                # Reservoir sampling keeps every bin's memory bounded however long the history
+                count = seen.get(key, 0) + 1
+                seen[key] = count
+                bucket = samples.setdefault(key, [])
+                if len(bucket) < ETA_MAX_SAMPLES_PER_BIN:
+                    bucket.append(minutes)
+                else:
+                    slot = rng.randrange(count)
+                    if slot < ETA_MAX_SAMPLES_PER_BIN:
+                        bucket[slot] = minutes
+    bins = []
+    for (route, hour), values in samples.items():
+        if len(values) < ETA_MIN_SAMPLES:
+            continue
+        p50, p80 = quantiles(values)
+        bins.append({"route": route, "hour": hour, "p50": round(p50, 1), "p80": round(p80, 1), "n": seen[(route, hour)]})
+    doc = {
+        "version": str(uuid.uuid4()),
+        "trained_at": datetime.now(timezone.utc).isoformat(),
+        "training_days": ETA_TRAINING_DAYS,
+        "samples": rows,
+        "bins": bins
+    }
+    await db.eta_models.insert_one(dict(doc))
+    await cache.set(ETA_VERSION_KEY, doc["version"])
+    logger.info("Trained ETA model %s from %d deliveries (%d bins)", doc["version"], rows, len(bins))
+    await prune_eta_models()
+    return doc
+
+async def prune_eta_models() -> int:
+    """Keep the newest ETA_KEEP_MODELS models; older ones are only history"""
+    oldest_kept = await db.eta_models.find({}, {"_id": 0, "trained_at": 1}).sort(
+        "trained_at", -1
+    ).skip(ETA_KEEP_MODELS - 1).limit(1).to_list(1)
+    if not oldest_kept:
+        return 0
+    result = await db.eta_models.delete_many({"trained_at": {"$lt": oldest_kept[0]["trained_at"]}})
+    return result.deleted_count
+
+@job_handler("eta_train")
+async def eta_train(reschedule: bool = True):
+    try:
+        await train_eta_model()
+    finally:
+        if reschedule:
+            await enqueue_job("eta_train", delay_s=seconds_until_after_midnight(ETA_TRAIN_OFFSET_S), key=ETA_JOB_KEY)
+
+async def schedule_eta_training():
+    try:
+        if await db.eta_models.count_documents({}, limit=1):
+            await enqueue_job("eta_train", delay_s=seconds_until_after_midnight(ETA_TRAIN_OFFSET_S), key=ETA_JOB_KEY)
+        else:
+            await enqueue_job("eta_train", key=ETA_JOB_KEY)
+    except Exception:
+        logger.exception("Could not schedule ETA training")
+
+@api_router.post("/eta/train")
+async def queue_eta_training():
+    """Retrain the ETA model now instead of waiting for the nightly run"""
+    job_id = await enqueue_job("eta_train", reschedule=False)
+    return {"queued": True, "job_id": job_id}
+
+@api_router.get("/eta/model")
+async def get_eta_model(include_bins: bool = False):
+    """The model this worker scores with"""
+    model = await eta_predictor.current()
+    doc = await db.eta_models.find_one(
+        {"version": model.version}, {"_id": 0} if include_bins else {"_id": 0, "bins": 0}
+    ) if model.version else None
+    return {"loaded_version": model.version, "bins_loaded": len(model.bins), "model": doc}
+
+# ==================== SLA MONITORING ====================
+# Every SLA_INTERVAL_S a job looks for shipments that have sat in a status longer than
+# its dwell threshold. Per status it keeps a watermark: the (updated_at, id) position
+# already examined. Each run only range-scans the (status, updated_at, id) index between
+# the watermark and the new cutoff, so its cost follows the number of shipments that
+# changed since the last run, not the size of the collection. Paging on the id as well
+# keeps the watermark moving when more than a batch of shipments share one updated_at.
+# Any update to a shipment restarts its dwell time and resolves its open breach; those
+# updates are found the same way, from a watermark over (updated_at, id).
+SLA_INTERVAL_S = env_int("SLA_INTERVAL_S", 60)
+SLA_BATCH_SIZE = env_int("SLA_BATCH_SIZE", 5000)
+# Resolution re-reads this much history each run, so an update whose updated_at was
+# taken just before the previous run but committed after it is still seen
+SLA_RESOLVE_OVERLAP_S = env_int("SLA_RESOLVE_OVERLAP_S", 60)
+SLA_RESOLVE_MARK = "_resolve"
+SLA_JOB_KEY = "sla_scan"
+SLA_DEFAULT_THRESHOLDS_MIN = {
+    ShipmentStatus.IN_SCANNED.value: 240,
+    ShipmentStatus.ASSIGNED_TO_BIN.value: 720,
+    ShipmentStatus.ASSIGNED_TO_CHAMP.value: 240,
+    ShipmentStatus.OUT_FOR_DELIVERY.value: 600,
+}
+
+def sla_thresholds() -> Dict[str, int]:
+    """Dwell limits in minutes; SLA_THRESHOLDS=status=minutes,... overrides the defaults"""
+    thresholds = dict(SLA_DEFAULT_THRESHOLDS_MIN)
+    for item in env_list("SLA_THRESHOLDS"):
+        status, _, minutes = item.partition("=")
+        if status.strip() not in ShipmentStatus._value2member_map_:
+            raise ValueError(f"Unknown status in SLA_THRESHOLDS: {status}")
+        thresholds[status.strip()] = int(minutes)
+    return {status: minutes for status, minutes in thresholds.items() if minutes > 0}
+
+SLA_THRESHOLDS_MIN = sla_thresholds()
+
+async def detect_sla_breaches(status: str, threshold_min: int, now: datetime) -> int:
+    """Record breaches for shipments that entered `status` between the watermark and now - threshold"""
+    cutoff = (now - timedelta(minutes=threshold_min)).isoformat()
+    mark = await db.sla_watermarks.find_one({"_id": status}) or {}
+    since, since_id = mark.get("watermark", ""), mark.get("watermark_id", "")
+    if since >= cutoff:
+        return 0
+    docs = await db.shipments.find(
+        {"status": status, **after_position(since, since_id, cutoff)},
+        {"_id": 0, "id": 1, "awb": 1, "route": 1, "champ_id": 1, "updated_at": 1}
+    ).sort([("updated_at", 1), ("id", 1)]).limit(SLA_BATCH_SIZE).to_list(SLA_BATCH_SIZE)
+    if docs:
+        await db.sla_breaches.bulk_write([
+            UpdateOne(
+                {"shipment_id": d["id"], "status": status, "entered_at": d["updated_at"]},
+                {"$setOnInsert": {
+                    "id": str(uuid.uuid4()),
+                    "awb": d["awb"],
+                    "route": d.get("route"),
+                    "champ_id": d.get("champ_id"),
+                    "threshold_min": threshold_min,
+                    "detected_at": now.isoformat(),
+                    "resolved_at": None
+                }},
+                upsert=True
+            )
+            for d in docs
+        ], ordered=False)
+    # A full batch may have stopped short of the cutoff; continue from where it ended.
+    # Shipments sitting exactly on the cutoff are re-read next run; the upsert makes that harmless.
+    if len(docs) == SLA_BATCH_SIZE:
+        watermark = {"watermark": docs[-1]["updated_at"], "watermark_id": docs[-1]["id"]}
+    else:
+        watermark = {"watermark": cutoff, "watermark_id": ""}
+    await db.sla_watermarks.update_one({"_id": status}, {"$set": watermark}, upsert=True)
+    return len(docs)
+
+def after_position(updated_at: str, shipment_id: str, until: str) -> dict:
+    """Shipments past (updated_at, shipment_id) in (updated_at, id) order, up to `until`"""
+    return {
+        "updated_at": {"$gte": updated_at, "$lte": until},
+        "$or": [{"updated_at": {"$gt": updated_at}}, {"id": {"$gt": shipment_id}}],
+    }
+
+async def close_changed_breaches(breaches: List[dict], now: datetime) -> int:
+    """Resolve those of `breaches` whose shipment is gone or no longer in the (status, updated_at) it breached in"""
+    current = {
+        s["id"]: s for s in await db.shipments.find(
+            {"id": {"$in": list({b["shipment_id"] for b in breaches})}},
+            {"_id": 0, "id": 1, "status": 1, "updated_at": 1}
+        ).to_list(None)
+    }
+    done = [
+        b["id"] for b in breaches
+        if (s := current.get(b["shipment_id"])) is None
+        or (s["status"], s["updated_at"]) != (b["status"], b["entered_at"])
+    ]
+    if done:
+        await db.sla_breaches.update_many({"id": {"$in": done}}, {"$set": {"resolved_at": now.isoformat()}})
+    return len(done)
+
+async def resolve_all_open_breaches(now: datetime) -> int:
+    """Check every open breach; only needed before the resolve watermark exists"""
+    resolved = 0
+    last_id = ""
+    while True:
+        breaches = await db.sla_breaches.find(
+            {"resolved_at": None, "id": {"$gt": last_id}},
+            {"_id": 0, "id": 1, "shipment_id": 1, "status": 1, "entered_at": 1}
+        ).sort("id", 1).limit(SLA_BATCH_SIZE).to_list(SLA_BATCH_SIZE)
+        if not breaches:
+            return resolved
+        last_id = breaches[-1]["id"]
+        resolved += await close_changed_breaches(breaches, now)
+
+async def resolve_sla_breaches(now: datetime) -> int:
+    """Close open breaches whose shipment has changed since the previous run.
+
+    A breach is keyed by the shipment's updated_at when it breached, so it can only be
+    resolved by an update, and every update moves updated_at forward. Walking the
+    shipments updated since the last run (minus SLA_RESOLVE_OVERLAP_S) therefore finds
+    every breach that may have closed without touching the rest.
+    """
+    mark = await db.sla_watermarks.find_one({"_id": SLA_RESOLVE_MARK})
+    until = now.isoformat()
+    if mark is None:
+        resolved = await resolve_all_open_breaches(now)
+    else:
+        resolved = 0
+        since = (datetime.fromisoformat(mark["watermark"]) - timedelta(seconds=SLA_RESOLVE_OVERLAP_S)).isoformat()
+        since_id = ""
+        while True:
+            changed = await db.shipments.find(
+                after_position(since, since_id, until), {"_id": 0, "id": 1, "updated_at": 1}
+            ).sort([("updated_at", 1), ("id", 1)]).limit(SLA_BATCH_SIZE).to_list(SLA_BATCH_SIZE)
+            if not changed:
+                break
+            since, since_id = changed[-1]["updated_at"], changed[-1]["id"]
+            breaches = await db.sla_breaches.find(
+                {"shipment_id": {"$in": [s["id"] for s in changed]}, "resolved_at": None},
+                {"_id": 0, "id": 1, "shipment_id": 1, "status": 1, "entered_at": 1}
+            ).to_list(None)
+            if breaches:
+                resolved += await close_changed_breaches(breaches, now)
+            if len(changed) < SLA_BATCH_SIZE:
+                break
+    await db.sla_watermarks.update_one({"_id": SLA_RESOLVE_MARK}, {"$set": {"watermark": until}}, upsert=True)
+    return resolved
+
+@job_handler("sla_scan")
+async def sla_scan():
+    now = datetime.now(timezone.utc)
+    try:
+        detected = 0
+        for status, threshold_min in SLA_THRESHOLDS_MIN.items():
+            detected += await detect_sla_breaches(status, threshold_min, now)
+        resolved = await resolve_sla_breaches(now)
+        if detected or resolved:
+            logger.info("SLA scan: %d new breaches, %d resolved", detected, resolved)
+    finally:
+        await enqueue_job("sla_scan", delay_s=SLA_INTERVAL_S, key=SLA_JOB_KEY)
+
+async def schedule_sla_scan():
+    if not SLA_THRESHOLDS_MIN:
+        return
+    try:
+        await enqueue_job("sla_scan", key=SLA_JOB_KEY)
+    except Exception:
+        logger.exception("Could not schedule the SLA scan")
+
+@api_router.get("/sla/breaches")
+async def get_sla_breaches(
+    status: Optional[ShipmentStatus] = None,
+    route: Optional[str] = None,
+    open_only: bool = Query(True, alias="open"),
+    limit: int = Query(100, ge=1, le=1000)
+):
+    """Breach records, newest first"""
+    query: Dict[str, Any] = {}
+    if open_only:
+        query["resolved_at"] = None
+    if status:
+        query["status"] = status.value
+    if route:
+        query["route"] = route
+    return await reporting_db.sla_breaches.find(query, {"_id": 0}).sort("detected_at", -1).limit(limit).to_list(limit)
+
+@api_router.get("/sla/summary")
+async def get_sla_summary():
+    """Open breach counts by status and route, for the dashboard"""
+    rows = await reporting_db.sla_breaches.aggregate([
+        {"$match": {"resolved_at": None}},
+        {"$group": {"_id": {"status": "$status", "route": "$route"}, "count": {"$sum": 1}}},
+    ]).to_list(None)
+    by_status: Dict[str, int] = {}
+    by_route: Dict[str, int] = {}
+    for row in rows:
+        by_status[row["_id"]["status"]] = by_status.get(row["_id"]["status"], 0) + row["count"]
+        route = row["_id"].get("route") or "unknown"
+        by_route[route] = by_route.get(route, 0) + row["count"]
+    return {
+        "open": sum(by_status.values()),
+        "by_status": by_status,
+        "by_route": by_route,
+        "thresholds_min": SLA_THRESHOLDS_MIN
+    }
 
 # ==================== DASHBOARD STATS ====================
 @api_router.get("/dashboard/stats")
@@ -1139,51 +5030,51 @@ async def get_dashboard_stats():
     pipeline = [
         {"$group": {"_id": "$status", "count": {"$sum": 1}}}
     ]
-    status_counts = await db.shipments.aggregate(pipeline).to_list(100)
+    status_counts = await reporting_db.shipments.aggregate(pipeline).to_list(100)
     status_dict = {s["_id"]: s["count"] for s in status_counts}
     
     # Today's deliveries
     today_start = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
-    today_delivered = await db.shipments.count_documents({
+    today_delivered = await reporting_db.shipments.count_documents({
         "status": ShipmentStatus.DELIVERED.value,
         "updated_at": {"$gte": today_start.isoformat()}
     })
     
     # Active run sheets
-    active_run_sheets = await db.run_sheets.count_documents({
+    active_run_sheets = await reporting_db.run_sheets.count_documents({
         "is_scanned_out": True,
         "is_scanned_in": False
     })
     
     # Total champs
-    total_champs = await db.champs.count_documents({"is_active": True})
+    total_champs = await reporting_db.champs.count_documents({"is_active": True})
     
     # Payment collection stats
     cash_pipeline = [
         {"$match": {"payment_method_used": PaymentMethod.CASH.value}},
         {"$group": {"_id": None, "total": {"$sum": "$payment_collected"}}}
     ]
-    cash_result = await db.delivery_attempts.aggregate(cash_pipeline).to_list(1)
+    cash_result = await reporting_db.delivery_attempts.aggregate(cash_pipeline).to_list(1)
     cash_collected = cash_result[0]["total"] if cash_result else 0
     
     card_pipeline = [
         {"$match": {"payment_method_used": PaymentMethod.CARD.value}},
         {"$group": {"_id": None, "total": {"$sum": "$payment_collected"}}}
     ]
-    card_result = await db.delivery_attempts.aggregate(card_pipeline).to_list(1)
+    card_result = await reporting_db.delivery_attempts.aggregate(card_pipeline).to_list(1)
     card_collected = card_result[0]["total"] if card_result else 0
     
     # Pickup stats
     pickup_pipeline = [
         {"$group": {"_id": "$pickup_type", "count": {"$sum": 1}}}
     ]
-    pickup_counts = await db.pickups.aggregate(pickup_pipeline).to_list(100)
+    pickup_counts = await reporting_db.pickups.aggregate(pickup_pipeline).to_list(100)
     pickups_by_type = {p["_id"]: p["count"] for p in pickup_counts}
     
     pickup_status_pipeline = [
         {"$group": {"_id": "$status", "count": {"$sum": 1}}}
     ]
-    pickup_status_counts = await db.pickups.aggregate(pickup_status_pipeline).to_list(100)
+    pickup_status_counts = await reporting_db.pickups.aggregate(pickup_status_pipeline).to_list(100)
     pickups_by_status = {p["_id"]: p["count"] for p in pickup_status_counts}
     
     total_pickups = sum(pickups_by_type.values()) if pickups_by_type else 0
@@ -1208,8 +5099,289 @@ async def get_dashboard_stats():
 # Get available routes
 @api_router.get("/routes")
 async def get_routes():
-    routes = await db.shipments.distinct("route")
-    return routes
+    return await get_reference("routes")
+
+# ==================== STARTUP & WARMUP ====================
+# Indexes every worker makes sure exist before serving traffic
+INDEXES: Dict[str, List[IndexModel]] = {
+    "bin_locations": [IndexModel("id", unique=True), IndexModel("route")],
+    "champs": [IndexModel("id", unique=True), IndexModel("is_active")],
+    "shipments": [
+        IndexModel("id", unique=True),
+        IndexModel("awb"),
+        IndexModel([("status", 1), ("created_at", -1)]),
+        IndexModel([("created_at", -1)]),
+        IndexModel("route"),
+        IndexModel("champ_id"),
+        IndexModel("run_sheet_id"),
+        IndexModel("bin_location_id"),
+        IndexModel("inscan_date"),
+        IndexModel([("delivery_location", "2dsphere")]),
+        IndexModel("awb_norm"),
+        IndexModel("phone_digits"),
+        IndexModel("phone_digits_rev"),
+        IndexModel("name_norm"),
+        IndexModel([("status", 1), ("updated_at", 1), ("id", 1)]),
+        IndexModel([("updated_at", 1), ("id", 1)]),
+        IndexModel([("status", 1), ("reschedule_day", 1)]),
+        IndexModel([("status", 1), ("delivery_timestamp", 1)]),
+        IndexModel([("requeued_for", 1), ("status", 1)]),
+        IndexModel(
+            [("awb", "text"), ("recipient_name", "text"), ("recipient_address", "text")],
+            weights={"awb": 10, "recipient_name": 5, "recipient_address": 1},
+            name="shipments_text"
+        ),
+    ],
+    "shipments_archive": [
+        IndexModel("id", unique=True),
+        IndexModel("awb"),
+        IndexModel("awb_norm"),
+        IndexModel("phone_digits"),
+        IndexModel("phone_digits_rev"),
+        IndexModel("name_norm"),
+        IndexModel(
+            [("awb", "text"), ("recipient_name", "text"), ("recipient_address", "text")],
+            weights={"awb": 10, "recipient_name": 5, "recipient_address": 1},
+            name="shipments_archive_text"
+        ),
+    ],
+    "delivery_attempts_archive": [IndexModel("shipment_id")],
+    "champ_locations": [IndexModel([("champ_id", 1), ("received_at", 1)])],
+    "eta_models": [IndexModel([("trained_at", -1)]), IndexModel("version", unique=True)],
+    "sla_breaches": [
+        IndexModel("id", unique=True),
+        IndexModel([("shipment_id", 1), ("status", 1), ("entered_at", 1)], unique=True),
+        IndexModel([("resolved_at", 1), ("id", 1)]),
+        IndexModel([("resolved_at", 1), ("detected_at", -1)]),
+    ],
+    "run_sheets": [IndexModel("id", unique=True), IndexModel([("champ_id", 1), ("is_scanned_in", 1)])],
+    "delivery_attempts": [IndexModel("shipment_id"), IndexModel("run_sheet_id"), IndexModel("champ_id")],
+    "pickups": [
+        IndexModel("id", unique=True),
+        IndexModel([("pickup_type", 1), ("status", 1), ("created_at", -1)]),
+        IndexModel([("champ_id", 1), ("status", 1)]),
+        IndexModel([("location", "2dsphere"), ("status", 1)]),
+        IndexModel([("proof_location", "2dsphere")]),
+        IndexModel("phone_digits"),
+        IndexModel("phone_digits_rev"),
+        IndexModel("name_norm"),
+        IndexModel(
+            [("seller_name", "text"), ("customer_name", "text"), ("seller_address", "text"),
+             ("customer_address", "text"), ("notes", "text")],
+            weights={"seller_name": 5, "customer_name": 5, "seller_address": 1, "customer_address": 1, "notes": 1},
+            name="pickups_text"
+        ),
+    ],
+    "shopping_history": [IndexModel([("pickup_id", 1), ("created_at", -1), ("id", -1)])],
+    "proofs": [IndexModel("id", unique=True)],
+    "notifications": [
+        IndexModel("id", unique=True),
+        IndexModel(
+            [("recipient", 1), ("channel", 1)], unique=True, name="one_pending_per_recipient",
+            partialFilterExpression={"status": "pending"}
+        ),
+        IndexModel([("status", 1), ("send_after", 1)]),
+        IndexModel("claim", sparse=True),
+        IndexModel("expires_at", expireAfterSeconds=0),
+    ],
+    "jobs": [
+        IndexModel("id", unique=True),
+        IndexModel("key", unique=True, partialFilterExpression={"key": {"$exists": True}}),
+        IndexModel([("status", 1), ("run_at", 1)]),
+        IndexModel([("status", 1), ("locked_until", 1)]),
+        IndexModel("expires_at", expireAfterSeconds=0),
+    ],
+    "profiles": [
+        IndexModel("id", unique=True),
+        IndexModel([("created_at", -1)]),
+        IndexModel("expires_at", expireAfterSeconds=0),
+    ],
+    "cache_entries": [IndexModel("expires_at", expireAfterSeconds=0)],
+    "upload_sessions": [IndexModel("id", unique=True), IndexModel("expires_at", expireAfterSeconds=0)],
+    "upload_chunks": [
+        IndexModel([("upload_id", 1), ("offset", 1)], unique=True),
+        IndexModel("expires_at", expireAfterSeconds=0),
+    ],
+}
+
+# Models whose list validators are primed during warmup
+WARMUP_MODELS = [BinLocation, Champ, Shipment, RunSheet, DeliveryAttempt, Pickup, ShoppingHistoryEntry]
+
+warmup_report: Dict[str, Any] = {}
+
+async def ensure_indexes():
+    """Create the indexes in INDEXES; failures are logged rather than blocking startup"""
+    try:
+        await ensure_location_collection()
+    except Exception:
+        logger.exception("Failed to create the champ_locations collection")
+    for collection, indexes in INDEXES.items():
+        try:
+            await db[collection].create_indexes(indexes)
+        except Exception:
+            logger.exception("Failed to create indexes on %s", collection)
+
+def warm_validators():
+    """Build the list validators up front and exercise them once"""
+    for model in WARMUP_MODELS:
+        adapter = list_adapter(model)
+        adapter.dump_json(adapter.validate_python([]))
+
+async def warmup():
+    """Prime indexes, reference data and validators so the first requests are not cold"""
+    steps = [
+        ("indexes", ensure_indexes()),
+        # Data may have changed while this worker was down (migrations, restores)
+        ("collection_versions", touch(*{c for _, colls in CONDITIONAL_GET_PREFIXES for c in colls})),
+        ("champ_directory", champ_directory.load()),
+        ("eta_model", eta_predictor.load()),
+        ("latest_locations", latest_locations.load()),
+        *[(f"reference:{name}", get_reference(name, refresh=True)) for name in REFERENCE_LOADERS],
+    ]
+    for step, coro in steps:
+        started = time.perf_counter()
+        try:
+            await coro
+        except Exception:
+            logger.exception("Warmup step %s failed", step)
+        warmup_report[step] = round((time.perf_counter() - started) * 1000, 2)
+    started = time.perf_counter()
+    warm_validators()
+    warmup_report["validators"] = round((time.perf_counter() - started) * 1000, 2)
+    logger.info("Worker %s warmed up in %s ms", os.getpid(), round(sum(warmup_report.values()), 2))
+
+# ==================== SYSTEM ====================
+@api_router.get("/system/worker")
+async def get_worker_info():
+    """Identity, cache backend and warmup timings (ms) of the worker serving this request"""
+    return {
+        "pid": os.getpid(),
+        "cache_backend": cache.name,
+        "warmup_ms": warmup_report
+    }
+
+@api_router.get("/system/jobs")
+async def get_job_stats():
+    """Job counts by type and status, and the most recent failures"""
+    counts = await db.jobs.aggregate([
+        {"$group": {"_id": {"type": "$type", "status": "$status"}, "count": {"$sum": 1}}}
+    ]).to_list(None)
+    by_type: Dict[str, Dict[str, int]] = {}
+    for row in counts:
+        by_type.setdefault(row["_id"]["type"], {})[row["_id"]["status"]] = row["count"]
+    failed = await db.jobs.find(
+        {"status": "failed"}, {"_id": 0, "payload": 0}
+    ).sort("updated_at", -1).limit(20).to_list(20)
+    return {"workers": len(_job_tasks), "handlers": sorted(JOB_HANDLERS), "counts": by_type, "recent_failures": failed}
+
+@api_router.post("/system/jobs/{job_id}/retry")
+async def retry_job(job_id: str):
+    result = await db.jobs.update_one(
+        {"id": job_id, "status": "failed"},
+        {"$set": {"status": "queued", "attempts": 0, "run_at": datetime.now(timezone.utc)}, "$unset": {"expires_at": ""}}
+    )
+    if result.matched_count == 0:
+        raise HTTPException(status_code=404, detail="Failed job not found")
+    _job_wakeup.set()
+    return {"id": job_id, "status": "queued"}
+
+@api_router.get("/system/notifications")
+async def get_notification_stats(recipient: Optional[str] = None, limit: int = Query(50, ge=1, le=500)):
+    """Outbox counts by status and the latest notifications, optionally for one phone number"""
+    counts = await db.notifications.aggregate([
+        {"$group": {"_id": "$status", "count": {"$sum": 1}}}
+    ]).to_list(None)
+    query = {"recipient": phone_digits(recipient)} if recipient else {}
+    latest = await db.notifications.find(query, {"_id": 0, "claim": 0}).sort("created_at", -1).limit(limit).to_list(limit)
+    stats = {
+        "provider": NOTIFY_PROVIDER,
+        "channel": NOTIFY_CHANNEL,
+        "counts": {row["_id"]: row["count"] for row in counts},
+        "latest": latest
+    }
+    if isinstance(notification_provider, FakeNotificationProvider):
+        stats["fake_sent"] = list(notification_provider.sent)[-limit:]
+    return stats
+
+@api_router.get("/system/admission")
+async def get_admission_stats():
+    """Per priority class limits and counters for this worker"""
+    return {
+        "pid": os.getpid(),
+        "enabled": ADMISSION_ENABLED,
+        "reporting_yield_at": ADMISSION_REPORTING_YIELD_AT,
+        "classes": {name: lane.snapshot() for name, lane in admission_lanes.items()}
+    }
+
+@api_router.get("/system/profiling/rules")
+async def get_profiling_rules(request: Request):
+    require_profile_token(request)
+    return await cache.get(PROFILE_RULES_KEY) or []
+
+@api_router.post("/system/profiling/rules")
+async def add_profiling_rule(rule: ProfilingRule, request: Request):
+    """Profile one in `every` requests whose path starts with `path`, at most `max_profiles` per worker"""
+    require_profile_token(request)
+    doc = {"id": str(uuid.uuid4()), **rule.model_dump(), "method": rule.method.upper()}
+    await profiling_rules.save([*(await cache.get(PROFILE_RULES_KEY) or []), doc])
+    return doc
+
+@api_router.delete("/system/profiling/rules/{rule_id}")
+async def delete_profiling_rule(rule_id: str, request: Request):
+    require_profile_token(request)
+    rules = await cache.get(PROFILE_RULES_KEY) or []
+    remaining = [r for r in rules if r["id"] != rule_id]
+    if len(remaining) == len(rules):
+        raise HTTPException(status_code=404, detail="Profiling rule not found")
+    await profiling_rules.save(remaining)
+    return {"deleted": rule_id}
+
+@api_router.get("/system/profiles")
+async def get_profiles(request: Request, path: Optional[str] = None, limit: int = Query(50, ge=1, le=500)):
+    """Stored profiles, newest first, without their stack data"""
+    require_profile_token(request)
+    query = {"path": {"$regex": f"^{re.escape(path)}"}} if path else {}
+    return await db.profiles.find(
+        query, {"_id": 0, "collapsed": 0, "top_functions": 0, "memory.top_allocations": 0, "expires_at": 0}
+    ).sort("created_at", -1).limit(limit).to_list(limit)
+
+@api_router.get("/system/profiles/{profile_id}")
+async def get_profile(profile_id: str, request: Request, format: str = Query("json", pattern="^(json|collapsed)$")):
+    """A stored profile; format=collapsed returns the stacks as text for flamegraph tools"""
+    require_profile_token(request)
+    profile = await db.profiles.find_one({"id": profile_id}, {"_id": 0, "expires_at": 0})
+    if not profile:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    if format == "collapsed":
+        if "collapsed" not in profile:
+            raise HTTPException(status_code=400, detail="Only sample profiles have collapsed stacks")
+        return Response(profile["collapsed"], media_type="text/plain")
+    return profile
+
+@api_router.get("/system/write-batching")
+async def get_write_batching_stats():
+    """Write batching settings and per-collection batch counters for this worker"""
+    return {
+        "pid": os.getpid(),
+        "max_delay_ms": WRITE_BATCH_MS,
+        "max_ops": WRITE_BATCH_MAX_OPS,
+        "collections": {name: dict(batcher.stats) for name, batcher in WRITE_BATCHERS.items()}
+    }
+
+@api_router.get("/system/db-pool")
+async def get_db_pool_stats():
+    """Connection pool configuration and utilisation for this worker"""
+    max_pool_size = MONGO_SETTINGS["maxPoolSize"]
+    pools = pool_metrics.snapshot()
+    for counters in pools.values():
+        counters["utilisation"] = round(counters["checked_out"] / max_pool_size, 3) if max_pool_size else None
+    return {
+        "pid": os.getpid(),
+        "settings": MONGO_SETTINGS,
+        "reporting_read_preference": REPORTING_READ_PREFERENCE,
+        "reporting_max_staleness_s": REPORTING_MAX_STALENESS_S,
+        "pools": pools
+    }
 
 # ==================== EXISTING ROUTES ====================
 class StatusCheck(BaseModel):
@@ -1236,7 +5408,7 @@ async def create_status_check(input: StatusCheckCreate):
 
 @api_router.get("/status", response_model=List[StatusCheck])
 async def get_status_checks():
-    status_checks = await db.status_checks.find({}, {"_id": 0}).to_list(1000)
+    status_checks = await reporting_db.status_checks.find({}, {"_id": 0}).to_list(1000)
     for check in status_checks:
         if isinstance(check['timestamp'], str):
             check['timestamp'] = datetime.fromisoformat(check['timestamp'])
@@ -1245,21 +5417,32 @@ async def get_status_checks():
 # Include the router in the main app
 app.include_router(api_router)
 
+app.add_middleware(ProfilingMiddleware)
+app.add_middleware(BaseHTTPMiddleware, dispatch=conditional_get)
+if ADMISSION_ENABLED:
+    app.add_middleware(AdmissionMiddleware, lanes=admission_lanes)
+app.add_middleware(CompressionMiddleware, minimum_size=COMPRESSION_MIN_BYTES)
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag", "Last-Modified", "Retry-After", "X-Profile-Id"],
 )
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
-logger = logging.getLogger(__name__)
+async def startup():
+    await warmup()
+    start_job_workers(JOB_WORKERS)
+    await schedule_archiving()
+    await schedule_reschedule_rollover()
+    await schedule_sla_scan()
+    await schedule_eta_training()
 
-@app.on_event("shutdown")
-async def shutdown_db_client():
+async def shutdown():
+    for batcher in WRITE_BATCHERS.values():
+        await batcher.close()
+    await drain_notifications()
+    await stop_job_workers()
+    await shutdown_image_executor()
     client.close()
@@ -0,0 +1,28 @@
+"""Run background jobs in their own process, without serving HTTP.
+
+    JOB_WORKERS=0 gunicorn -c gunicorn.conf.py server:app   # web nodes enqueue only
+    JOB_WORKERS=4 python worker.py                          # job nodes run them
+"""
+import asyncio
+import signal
+
+import server
+
+
+async def main():
+    await server.ensure_indexes()
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    count = max(1, server.JOB_WORKERS)
+    server.start_job_workers(count)
+    server.logger.info("Running %d job workers for: %s", count, ", ".join(sorted(server.JOB_HANDLERS)))
+    await stop.wait()
+    await server.stop_job_workers()
+    await server.shutdown_image_executor()
+    server.client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
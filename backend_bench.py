@@ -0,0 +1,207 @@
+import asyncio
+import json
+import os
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+
+# server.py only needs these to build its (lazy) Motor client; benchmarks that
+# talk to MongoDB read the real values from the environment.
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "last_mile_bench")
+sys.path.insert(0, str(Path(__file__).parent / "backend"))
+
+import server  # noqa: E402
+
+
+def make_shipment_docs(count):
+    """Shipment documents shaped like the ones stored by create_shipment"""
+    now = datetime.now(timezone.utc).isoformat()
+    return [
+        {
+            "id": str(uuid.uuid4()),
+            "awb": f"AWB{i:08d}",
+            "recipient_name": f"Recipient {i}",
+            "recipient_address": f"{i} Market Street, Bengaluru",
+            "recipient_phone": f"+9198{i:08d}",
+            "route": f"ROUTE-{i % 20}",
+            "payment_method": "cash" if i % 2 else "card",
+            "value": 100.0 + i,
+            "status": "out_for_delivery",
+            "champ_id": str(uuid.uuid4()),
+            "run_sheet_id": str(uuid.uuid4()),
+            "inscan_date": now[:10],
+            "inscan_time": now[11:19],
+            "created_at": now,
+            "updated_at": now,
+        }
+        for i in range(count)
+    ]
+
+
+class LastMileBenchmarks:
+    def __init__(self, repeat=20):
+        self.repeat = repeat
+        self.results = []
+
+    def run_bench(self, name, fn, per=1000):
+        """Time fn over self.repeat runs and record the best and mean per `per` items"""
+        fn()  # warm caches and lazily built validators
+        timings = []
+        for _ in range(self.repeat):
+            started = time.perf_counter()
+            fn()
+            timings.append(time.perf_counter() - started)
+        best = min(timings) * 1000
+        mean = sum(timings) / len(timings) * 1000
+        self.results.append((name, best, mean, per))
+        print(f"{name:<48} best {best:8.2f} ms  mean {mean:8.2f} ms  per {per}")
+
+    def bench_serialization(self, count=1000):
+        """Serialization cost of a List[Shipment] response"""
+        print(f"\n=== Serializing {count} shipments ===")
+        from fastapi.routing import serialize_response
+        from fastapi.utils import create_response_field
+        from typing import List
+
+        docs = make_shipment_docs(count)
+        field = create_response_field(name="Response_bench", type_=List[server.Shipment])
+        # One loop for every iteration, so loop setup isn't counted against the FastAPI paths
+        loop = asyncio.new_event_loop()
+
+        def fastapi_default():
+            content = loop.run_until_complete(serialize_response(field=field, response_content=docs))
+            return server.JSONResponse(content).body
+
+        def fastapi_orjson():
+            content = loop.run_until_complete(serialize_response(field=field, response_content=docs))
+            return server.ORJSONResponse(content).body
+
+        adapter = server.list_adapter(server.Shipment)
+
+        def type_adapter():
+            return adapter.dump_json(adapter.validate_python(docs))
+
+        def passthrough_orjson():
+            return server.ORJSONResponse(docs).body
+
+        def passthrough_json():
+            return json.dumps(docs).encode()
+
+        self.run_bench("before: response_model + stdlib json", fastapi_default, count)
+        self.run_bench("response_model + orjson", fastapi_orjson, count)
+        self.run_bench("SERIALIZATION_MODE=adapter", type_adapter, count)
+        if server.orjson is not None:
+            self.run_bench("SERIALIZATION_MODE=passthrough (orjson)", passthrough_orjson, count)
+        self.run_bench("SERIALIZATION_MODE=passthrough (stdlib json)", passthrough_json, count)
+        loop.close()
+
+    def bench_images(self, count=None):
+        """Proof photo ingest: throughput on one core and across a process pool"""
+        import base64
+        import io
+        from concurrent.futures import ProcessPoolExecutor
+        import image_pipeline
+
+        if image_pipeline.Image is None:
+            print("\n=== Skipping image benchmark: Pillow is not installed ===")
+            return
+        from PIL import Image, ImageFilter
+
+        # A 12 MP phone-sized photo with enough detail that JPEG can't compress it away
+        img = Image.effect_noise((4000, 3000), 64).convert("RGB").filter(ImageFilter.GaussianBlur(1))
+        raw = io.BytesIO()
+        img.save(raw, "JPEG", quality=92)
+        payload = base64.b64encode(raw.getvalue()).decode("ascii")
+        args = (server.PROOF_IMAGE_MAX_DIM, server.PROOF_THUMBNAIL_DIM, server.PROOF_IMAGE_QUALITY)
+        print(f"\n=== Processing a {len(raw.getvalue()) // 1024} KiB 4000x3000 JPEG proof ===")
+
+        for fmt in ("JPEG", "WEBP"):
+            result = image_pipeline.process_proof_image(payload, *args, fmt=fmt)
+            print(f"{fmt}: {result['meta']['width']}x{result['meta']['height']}, "
+                  f"{result['meta']['bytes'] // 1024} KiB (thumbnail {len(result['thumbnail']) // 1024} KiB base64)")
+            self.run_bench(f"process_proof_image {fmt} (1 core)",
+                           lambda: image_pipeline.process_proof_image(payload, *args, fmt=fmt), per=1)
+
+        workers = os.cpu_count() or 1
+        count = count or workers * 4
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(image_pipeline.process_proof_image, [payload] * workers, *[[a] * workers for a in args]))
+            started = time.perf_counter()
+            list(pool.map(image_pipeline.process_proof_image, [payload] * count, *[[a] * count for a in args]))
+            elapsed = time.perf_counter() - started
+        print(f"pool of {workers}: {count / elapsed:.1f} images/s total, {count / elapsed / workers:.1f} images/s per core")
+
+    def bench_eta(self, count=1000):
+        """ETA scoring cost for a champ's shipment list"""
+        print(f"\n=== Scoring ETAs for {count} shipments ===")
+        docs = make_shipment_docs(count)
+        bins = [
+            {"route": route, "hour": hour, "p50": 120.0, "p80": 180.0}
+            for route in [f"ROUTE-{i}" for i in range(20)] + [server.ETA_ANY]
+            for hour in list(range(24)) + [server.ETA_ANY]
+        ]
+        model = server.EtaModel({"version": "bench", "bins": bins})
+        scanned_out_at = datetime.now(timezone.utc).isoformat()
+
+        def score():
+            return [server.eta_for(model, doc, scanned_out_at) for doc in docs]
+
+        self.run_bench("eta_for (in-memory model)", score, count)
+
+    def bench_write_batching(self, count=2000, concurrency=200):
+        """Concurrent single-shipment updates: one update_one each vs WriteBatcher (needs MongoDB)"""
+        print(f"\n=== {count} shipment updates from {concurrency} concurrent callers ===")
+        from motor.motor_asyncio import AsyncIOMotorClient
+
+        async def run():
+            client = AsyncIOMotorClient(os.environ["MONGO_URL"], serverSelectionTimeoutMS=2000)
+            collection = client[os.environ["DB_NAME"]]["bench_write_batching"]
+            try:
+                await collection.drop()
+            except Exception as exc:
+                print(f"Skipping: MongoDB is not reachable ({exc.__class__.__name__})")
+                return
+            docs = make_shipment_docs(count)
+            await collection.insert_many(docs)
+            await collection.create_index("id", unique=True)
+            ids = [d["id"] for d in docs]
+
+            async def drive(update_one):
+                semaphore = asyncio.Semaphore(concurrency)
+
+                async def one(sid):
+                    async with semaphore:
+                        return await update_one({"id": sid}, {"$set": {"status": "in_scanned", "updated_at": time.time()}})
+
+                started = time.perf_counter()
+                results = await asyncio.gather(*[one(sid) for sid in ids])
+                assert sum(r.modified_count for r in results) == count
+                return time.perf_counter() - started
+
+            elapsed = await drive(collection.update_one)
+            print(f"{'per-call update_one':<48} {elapsed * 1000:8.2f} ms  {count / elapsed:8.0f} updates/s")
+            for delay_ms in (2, 5, 10):
+                batcher = server.WriteBatcher(collection, delay_ms, server.WRITE_BATCH_MAX_OPS)
+                elapsed = await drive(batcher.update_one)
+                await batcher.close()
+                label = f"WriteBatcher ({delay_ms} ms, {batcher.stats['batches']} batches)"
+                print(f"{label:<48} {elapsed * 1000:8.2f} ms  {count / elapsed:8.0f} updates/s")
+            await collection.drop()
+            client.close()
+
+        asyncio.run(run())
+
+
+def main():
+    bench = LastMileBenchmarks(repeat=int(os.environ.get("BENCH_REPEAT", 20)))
+    selected = sys.argv[1:] or ["serialization"]
+    for name in selected:
+        getattr(bench, f"bench_{name}")()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2859,8 +2859,12 @@ const Pickups = () => {
                         <p className="text-sm text-green-600">Value: ₹{entry.value_collected?.toLocaleString()}</p>
                         {entry.champ_name && <p className="text-xs text-muted-foreground">By: {entry.champ_name}</p>}
                         {entry.notes && <p className="text-xs text-muted-foreground mt-1">{entry.notes}</p>}
-                        {entry.proof_image && (
-                          <img src={entry.proof_image} alt="Proof" className="mt-2 w-20 h-20 object-cover rounded" />
+                        {(entry.proof_id || entry.proof_image) && (
+                          <img
+                            src={entry.proof_id ? `${API}/proofs/${entry.proof_id}?thumbnail=true` : entry.proof_image}
+                            alt="Proof"
+                            className="mt-2 w-20 h-20 object-cover rounded"
+                          />
                         )}
                       </div>
                     ))}
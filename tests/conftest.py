@@ -0,0 +1,98 @@
+"""Shared fixtures.
+
+Tests that need MongoDB run against a throwaway database on TEST_MONGO_URL
+(default mongodb://localhost:27017) and are skipped when no server answers there,
+unless TEST_REQUIRE_MONGO is set, in which case they fail. Motor binds its client to
+the first event loop that uses it, so `async def` tests all run on one session-wide
+loop and talk to the app in-process through httpx's ASGI transport rather than
+starlette's TestClient (which runs its own loop).
+"""
+import asyncio
+import inspect
+import os
+import sys
+import uuid
+from pathlib import Path
+
+import httpx
+import pytest
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+
+TEST_MONGO_URL = os.environ.get("TEST_MONGO_URL", "mongodb://localhost:27017")
+TEST_REQUIRE_MONGO = os.environ.get("TEST_REQUIRE_MONGO", "").lower() in ("1", "true", "yes")
+TEST_DB_NAME = f"last_mile_test_{uuid.uuid4().hex[:8]}"
+os.environ["MONGO_URL"] = TEST_MONGO_URL
+os.environ["DB_NAME"] = TEST_DB_NAME
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import server  # noqa: E402
+
+
+def mongo_available() -> bool:
+    try:
+        MongoClient(TEST_MONGO_URL, serverSelectionTimeoutMS=500).admin.command("ping")
+        return True
+    except PyMongoError:
+        return False
+
+
+MONGO_AVAILABLE = mongo_available()
+
+
+@pytest.fixture(scope="session", autouse=True)
+def loop():
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
+@pytest.hookimpl(tryfirst=True)
+def pytest_pyfunc_call(pyfuncitem):
+    """Run `async def` tests to completion on the session loop"""
+    if not inspect.iscoroutinefunction(pyfuncitem.obj):
+        return None
+    kwargs = {name: pyfuncitem.funcargs[name] for name in inspect.signature(pyfuncitem.obj).parameters}
+    pyfuncitem.funcargs["loop"].run_until_complete(pyfuncitem.obj(**kwargs))
+    return True
+
+
+@pytest.fixture
+def mongo(loop, monkeypatch):
+    """A clean test database with indexes, and fresh per-process caches"""
+    if not MONGO_AVAILABLE:
+        if TEST_REQUIRE_MONGO:
+            pytest.fail(f"MongoDB is not reachable at {TEST_MONGO_URL} and TEST_REQUIRE_MONGO is set")
+        pytest.skip(f"MongoDB is not reachable at {TEST_MONGO_URL}")
+    monkeypatch.setattr(server, "cache", server.InMemoryCache())
+    monkeypatch.setattr(server, "champ_directory", server.ChampDirectory())
+    loop.run_until_complete(server.ensure_indexes())
+    yield server.db
+    MongoClient(TEST_MONGO_URL).drop_database(TEST_DB_NAME)
+
+
+@pytest.fixture
+def api(loop, mongo):
+    """An httpx client calling the app in-process (startup and job workers are not run)"""
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=server.app), base_url="http://test")
+    yield client
+    loop.run_until_complete(client.aclose())
+
+
+def shipment_payload(awb: str, **overrides) -> dict:
+    return {
+        "awb": awb,
+        "recipient_name": "Asha Rao",
+        "recipient_address": "12 Market Street, Bengaluru",
+        "recipient_phone": "+91 98450 12345",
+        "route": "ROUTE-1",
+        "payment_method": "cash",
+        "value": 499.0,
+        **overrides,
+    }
+
+
+async def create_shipment(api, awb: str, **overrides) -> dict:
+    response = await api.post("/api/shipments", json=shipment_payload(awb, **overrides))
+    assert response.status_code == 200, response.text
+    return response.json()
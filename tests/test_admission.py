@@ -0,0 +1,63 @@
+import asyncio
+
+import httpx
+
+from tests.conftest import server
+
+
+def test_routes_are_classified_by_method_and_path():
+    assert server.admission_class("POST", "/api/logistics/in-scan/AWB1") == "critical"
+    assert server.admission_class("POST", "/api/pickups/p1/add-delivery") == "critical"
+    assert server.admission_class("GET", "/api/champ/c1/shipments") == "critical"
+    assert server.admission_class("GET", "/api/dashboard/stats") == "reporting"
+    assert server.admission_class("GET", "/api/shipments") == "reporting"
+    assert server.admission_class("GET", "/api/shipments/s1") == "default"
+    assert server.admission_class("POST", "/api/shipments") == "default"
+
+
+async def test_lane_queues_then_sheds_when_full_or_too_slow():
+    lane = server.AdmissionLane("reporting", limit=1, max_queue=1, queue_timeout_ms=50)
+    assert await lane.acquire() is None
+    waiting = asyncio.create_task(lane.acquire())
+    await asyncio.sleep(0)
+    assert lane.queued == 1
+    # The queue holds one request, so the next one is turned away immediately
+    assert await lane.acquire() == "queue_full"
+    assert await waiting == "timeout"
+    assert lane.queued == 0
+
+    lane.release(1.0)
+    assert await lane.acquire() is None
+    snapshot = lane.snapshot()
+    assert snapshot["admitted"] == 2
+    assert snapshot["peak_queued"] == 1
+
+
+async def test_critical_lane_never_queues():
+    lane = server.AdmissionLane("critical", limit=0, max_queue=0, queue_timeout_ms=0)
+    results = [await lane.acquire() for _ in range(100)]
+    assert results == [None] * 100
+    assert lane.in_flight == 100
+
+
+async def test_reporting_yields_to_busy_critical_lane(monkeypatch):
+    async def ok(scope, receive, send):
+        await server.JSONResponse({"ok": True})(scope, receive, send)
+
+    lanes = {
+        "critical": server.AdmissionLane("critical", 0, 0, 0),
+        "default": server.AdmissionLane("default", 4, 4, 1000),
+        "reporting": server.AdmissionLane("reporting", 4, 4, 1000),
+    }
+    monkeypatch.setattr(server, "ADMISSION_REPORTING_YIELD_AT", 2)
+    app = server.AdmissionMiddleware(ok, lanes)
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        assert (await client.get("/api/dashboard/stats")).status_code == 200
+        for _ in range(2):
+            await lanes["critical"].acquire()
+        shed = await client.get("/api/dashboard/stats")
+        assert shed.status_code == 503
+        assert shed.headers["retry-after"] == str(server.ADMISSION_RETRY_AFTER_S)
+        assert lanes["reporting"].shed["yield"] == 1
+        # Other classes are unaffected
+        assert (await client.get("/api/shipments/s1")).status_code == 200
@@ -0,0 +1,72 @@
+from datetime import datetime, timezone
+
+from tests.conftest import create_shipment, server, shipment_payload
+
+LONG_AGO = "2020-01-01T00:00:00+00:00"
+
+
+class RacingDb:
+    """Wraps the database so a shipment changes between the archive copy and the delete"""
+
+    def __init__(self, db, on_archive_write):
+        self.db = db
+        self.on_archive_write = on_archive_write
+
+    def __getattr__(self, name):
+        collection = getattr(self.db, name)
+        if name != "shipments_archive":
+            return collection
+        hook = self.on_archive_write
+
+        class Archive:
+            def __getattr__(self, attr):
+                return getattr(collection, attr)
+
+            async def bulk_write(self, ops, **kwargs):
+                result = await collection.bulk_write(ops, **kwargs)
+                await hook()
+                return result
+
+        return Archive()
+
+
+async def delivered_long_ago(api, mongo, awb):
+    shipment = await create_shipment(api, awb)
+    await mongo.shipments.update_one(
+        {"id": shipment["id"]}, {"$set": {"status": "delivered", "updated_at": LONG_AGO}}
+    )
+    await mongo.delivery_attempts.insert_one({"id": f"attempt-{awb}", "shipment_id": shipment["id"]})
+    return shipment["id"]
+
+
+async def test_old_shipments_move_with_their_attempts(api, mongo):
+    shipment_id = await delivered_long_ago(api, mongo, "AWBARCH001")
+    assert await server.archive_shipment_batch(server.archive_query(90), 100) == (1, 1)
+
+    assert await mongo.shipments.count_documents({"id": shipment_id}) == 0
+    assert await mongo.shipments_archive.count_documents({"id": shipment_id}) == 1
+    assert await mongo.delivery_attempts.count_documents({"shipment_id": shipment_id}) == 0
+    assert await mongo.delivery_attempts_archive.count_documents({"shipment_id": shipment_id}) == 1
+
+    # Archived AWBs still count as taken
+    again = await api.post("/api/shipments", json=shipment_payload("AWBARCH001"))
+    assert again.status_code == 400
+
+
+async def test_shipment_updated_mid_batch_keeps_its_attempts(api, mongo, monkeypatch):
+    moved = await delivered_long_ago(api, mongo, "AWBARCH002")
+    reopened = await delivered_long_ago(api, mongo, "AWBARCH003")
+
+    async def reopen():
+        await mongo.shipments.update_one(
+            {"id": reopened},
+            {"$set": {"status": "returned_to_wh", "updated_at": datetime.now(timezone.utc).isoformat()}}
+        )
+
+    monkeypatch.setattr(server, "db", RacingDb(mongo, reopen))
+    assert await server.archive_shipment_batch(server.archive_query(90), 100) == (2, 1)
+
+    assert await mongo.shipments.count_documents({"id": moved}) == 0
+    assert await mongo.delivery_attempts.count_documents({"shipment_id": moved}) == 0
+    assert await mongo.shipments.count_documents({"id": reopened}) == 1
+    assert await mongo.delivery_attempts.count_documents({"shipment_id": reopened}) == 1
@@ -0,0 +1,48 @@
+from tests.conftest import server
+
+
+async def create_champ(api, name):
+    response = await api.post("/api/champs", json={"name": name, "phone": "+91 90000 00000", "assigned_routes": ["ROUTE-1"]})
+    return response.json()["id"]
+
+
+async def create_pickup(api):
+    response = await api.post("/api/pickups/seller", json={
+        "seller_name": "Lakshmi Textiles",
+        "seller_address": "4 Mill Road, Bengaluru",
+        "seller_phone": "+91 98860 55555",
+        "pickup_items": [{"category": "apparel", "quantity": 3}],
+        "route": "ROUTE-1",
+    })
+    return response.json()["id"]
+
+
+async def test_dispatch_skips_duplicates_and_moves_load_off_the_previous_champ(api):
+    first, second = await create_champ(api, "Ravi"), await create_champ(api, "Meena")
+    moved, fresh = await create_pickup(api), await create_pickup(api)
+    await api.post("/api/pickups/dispatch", json={"assignments": [{"pickup_id": moved, "champ_id": first}]})
+
+    response = await api.post("/api/pickups/dispatch", json={"assignments": [
+        {"pickup_id": moved, "champ_id": second},
+        {"pickup_id": moved},
+        {"pickup_id": fresh},
+    ]})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["skipped"] == [{"pickup_id": moved, "reason": "duplicate pickup_id"}]
+    assert body["modified_count"] == 2
+    # The moved pickup no longer counts against the first champ, so the new one goes there
+    assigned = {a["pickup_id"]: a["champ_id"] for a in body["assigned"]}
+    assert assigned == {moved: second, fresh: first}
+    assert body["champ_loads"] == {first: 1, second: 1}
+
+
+async def test_dispatch_to_an_inactive_champ_is_rejected(api, mongo):
+    retired = await create_champ(api, "Suresh")
+    pickup = await create_pickup(api)
+    await mongo.champs.update_one({"id": retired}, {"$set": {"is_active": False}})
+    await server.champ_directory.load()
+
+    response = await api.post("/api/pickups/dispatch", json={"assignments": [{"pickup_id": pickup, "champ_id": retired}]})
+    assert response.status_code == 400
+    assert (await api.get(f"/api/pickups/{pickup}")).json()["status"] == "pending"
@@ -0,0 +1,158 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from tests.conftest import server
+
+
+def past() -> datetime:
+    return datetime.now(timezone.utc) - timedelta(seconds=1)
+
+
+@pytest.fixture
+def register(monkeypatch):
+    """Register a handler for the test; its job type is the function's name"""
+    def add(handler):
+        monkeypatch.setitem(server.JOB_HANDLERS, handler.__name__, handler)
+        return handler.__name__
+    return add
+
+
+async def test_claimed_job_runs_once_and_is_marked_done(mongo, register):
+    seen = []
+
+    async def echo(value):
+        seen.append(value)
+
+    job_id = await server.enqueue_job(register(echo), value=7)
+    job = await server.claim_job()
+    assert job["id"] == job_id
+    assert job["status"] == "running" and job["attempts"] == 1
+    # A leased job is hidden from other workers
+    assert await server.claim_job() is None
+
+    await server.run_job(job)
+    stored = await mongo.jobs.find_one({"id": job_id})
+    assert stored["status"] == "done"
+    assert "locked_until" not in stored and "expires_at" in stored
+    assert seen == [7]
+
+
+async def test_keyed_job_waits_in_the_queue_at_most_once(mongo, register):
+    async def noop():
+        pass
+
+    job_type = register(noop)
+    assert await server.enqueue_job(job_type, key="only-one")
+    assert await server.enqueue_job(job_type, key="only-one") is None
+    # Once the queued job is claimed a follow-up may be queued
+    await server.claim_job()
+    assert await server.enqueue_job(job_type, key="only-one")
+
+
+async def test_failed_job_is_retried_with_backoff_then_fails(mongo, register):
+    async def broken():
+        raise RuntimeError("carrier API down")
+
+    job_id = await server.enqueue_job(register(broken), max_attempts=2)
+    await server.run_job(await server.claim_job())
+    stored = await mongo.jobs.find_one({"id": job_id})
+    assert stored["status"] == "queued"
+    assert stored["run_at"] > stored["created_at"]
+    assert "carrier API down" in stored["last_error"]
+    assert await server.claim_job() is None
+
+    await mongo.jobs.update_one({"id": job_id}, {"$set": {"run_at": past()}})
+    job = await server.claim_job()
+    assert job["attempts"] == 2
+    await server.run_job(job)
+    stored = await mongo.jobs.find_one({"id": job_id})
+    assert stored["status"] == "failed" and "expires_at" in stored
+
+
+async def test_permanent_error_is_not_retried(mongo, register):
+    async def rejected():
+        raise server.PermanentJobError("bad payload")
+
+    job_id = await server.enqueue_job(register(rejected))
+    await server.run_job(await server.claim_job())
+    stored = await mongo.jobs.find_one({"id": job_id})
+    assert stored["status"] == "failed" and stored["attempts"] == 1
+
+
+async def test_expired_lease_is_reclaimed_and_the_stale_worker_cannot_finish_it(mongo, register):
+    async def noop():
+        pass
+
+    job_id = await server.enqueue_job(register(noop))
+    stale = await server.claim_job()
+    # The first worker stalls past its visibility timeout
+    await mongo.jobs.update_one({"id": job_id}, {"$set": {"locked_until": past()}})
+    retry = await server.claim_job()
+    assert retry["id"] == job_id and retry["attempts"] == 2
+
+    await server.run_job(stale)
+    stored = await mongo.jobs.find_one({"id": job_id})
+    assert stored["status"] == "running" and stored["attempts"] == 2
+
+    await server.run_job(retry)
+    assert (await mongo.jobs.find_one({"id": job_id}))["status"] == "done"
+
+
+async def test_running_job_extends_its_lease(mongo, register, monkeypatch):
+    leases = []
+
+    async def slow():
+        for _ in range(2):
+            leases.append((await mongo.jobs.find_one({"type": "slow"}))["locked_until"])
+            await asyncio.sleep(0.3)
+
+    monkeypatch.setattr(server, "JOB_HEARTBEAT_S", 0.1)
+    await server.enqueue_job(register(slow))
+    await server.run_job(await server.claim_job())
+    assert leases[1] > leases[0]
+
+
+async def test_job_whose_workers_keep_dying_is_failed_not_rerun(mongo, register):
+    runs = []
+
+    async def crashes_its_worker():
+        runs.append(1)
+
+    job_id = await server.enqueue_job(register(crashes_its_worker), max_attempts=1)
+    await server.claim_job()
+    # Its only worker died without recording anything
+    await mongo.jobs.update_one({"id": job_id}, {"$set": {"locked_until": past()}})
+    await server.run_job(await server.claim_job())
+    stored = await mongo.jobs.find_one({"id": job_id})
+    assert stored["status"] == "failed" and "expires_at" in stored
+    assert runs == []
+
+
+async def test_worker_survives_a_failure_recording_a_result(mongo, register, monkeypatch):
+    finished = asyncio.Event()
+    ran = []
+    run_job = server.run_job
+
+    async def first():
+        pass
+
+    async def second():
+        finished.set()
+
+    async def flaky_run_job(job):
+        ran.append(job["type"])
+        if len(ran) == 1:
+            raise ConnectionError("primary stepped down")
+        await run_job(job)
+
+    monkeypatch.setattr(server, "run_job", flaky_run_job)
+    await server.enqueue_job(register(first))
+    await server.enqueue_job(register(second))
+    stop = asyncio.Event()
+    worker = asyncio.create_task(server.job_worker(stop))
+    await asyncio.wait_for(finished.wait(), 5)
+    stop.set()
+    await asyncio.wait_for(worker, 5)
+    assert ran == ["first", "second"]
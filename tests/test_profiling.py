@@ -0,0 +1,38 @@
+import httpx
+import pytest
+
+from tests.conftest import server
+
+
+async def ok(scope, receive, send):
+    await server.JSONResponse({"ok": True})(scope, receive, send)
+
+
+@pytest.fixture
+def profiled_app(loop, monkeypatch):
+    monkeypatch.setattr(server, "PROFILE_TOKEN", "s3cret")
+    monkeypatch.setattr(server, "cache", server.InMemoryCache())
+    transport = httpx.ASGITransport(app=server.ProfilingMiddleware(ok), raise_app_exceptions=False)
+    client = httpx.AsyncClient(transport=transport, base_url="http://test")
+    yield client
+    loop.run_until_complete(client.aclose())
+
+
+async def test_token_in_the_query_string_is_ignored(profiled_app):
+    response = await profiled_app.get("/api/shipments", params={"profile_token": "s3cret"})
+    assert response.status_code == 200
+    assert "x-profile-id" not in response.headers
+
+
+async def test_failing_profiler_does_not_disable_profiling(profiled_app, monkeypatch):
+    class BrokenProfiler:
+        def __init__(self, mode):
+            pass
+
+        def start(self):
+            raise RuntimeError("tracemalloc unavailable")
+
+    monkeypatch.setattr(server, "RequestProfiler", BrokenProfiler)
+    response = await profiled_app.get("/api/shipments", headers={"X-Profile-Token": "s3cret"})
+    assert response.status_code == 500
+    assert server._profiling_active is False
@@ -0,0 +1,17 @@
+from tests.conftest import server
+
+PIXEL = "data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAQAAAC1HAwCAAAAC0lEQVR42mNkYAAAAAYAAjCB0C8AAAAASUVORK5CYII="
+
+
+async def test_full_image_standing_in_for_a_thumbnail_is_not_cached_for_long(api, mongo):
+    await mongo.proofs.insert_one({"id": "proof-1", "image": PIXEL, "thumbnail": None})
+    stand_in = await api.get("/api/proofs/proof-1", params={"thumbnail": "true"})
+    assert stand_in.status_code == 200
+    assert stand_in.headers["cache-control"] == f"private, max-age={server.PROOF_FALLBACK_MAX_AGE_S}"
+
+    full = await api.get("/api/proofs/proof-1")
+    assert "immutable" in full.headers["cache-control"]
+
+    await mongo.proofs.update_one({"id": "proof-1"}, {"$set": {"thumbnail": PIXEL}})
+    thumbnail = await api.get("/api/proofs/proof-1", params={"thumbnail": "true"})
+    assert "immutable" in thumbnail.headers["cache-control"]
@@ -0,0 +1,72 @@
+import io
+
+from PIL import Image
+
+from tests.conftest import create_shipment
+
+
+def jpeg_bytes() -> bytes:
+    out = io.BytesIO()
+    Image.new("RGB", (64, 48), (200, 30, 30)).save(out, "JPEG")
+    return out.getvalue()
+
+
+async def test_multipart_proof_is_readable_from_the_shipment(api):
+    shipment = await create_shipment(api, "AWBPROOF001")
+    photo = jpeg_bytes()
+    response = await api.post(
+        "/api/champ/delivery-action/upload",
+        data={"shipment_id": shipment["id"], "action": "delivered"},
+        files={"proof_image": ("proof.jpg", photo, "image/jpeg")},
+    )
+    assert response.status_code == 200
+    delivered = response.json()
+    assert delivered["status"] == "delivered"
+    file_id = delivered["delivery_proof_file_id"]
+    assert file_id
+    assert delivered["delivery_proof_meta"]["bytes"] == len(photo)
+
+    # The stored shipment, not just the action response, still references the file
+    stored = (await api.get(f"/api/shipments/{shipment['id']}")).json()
+    assert stored["delivery_proof_file_id"] == file_id
+
+    download = await api.get(f"/api/proofs/files/{file_id}")
+    assert download.status_code == 200
+    assert download.headers["content-type"] == "image/jpeg"
+    assert download.content == photo
+
+
+async def test_resumable_upload_proof_is_readable_from_the_shipment(api):
+    shipment = await create_shipment(api, "AWBPROOF002")
+    photo = jpeg_bytes()
+    session = (await api.post("/api/uploads", json={"total_bytes": len(photo)})).json()
+    half = len(photo) // 2
+    await api.put(f"/api/uploads/{session['id']}", params={"offset": 0}, content=photo[:half])
+    done = (await api.put(f"/api/uploads/{session['id']}", params={"offset": half}, content=photo[half:])).json()
+    assert done["status"] == "complete"
+
+    response = await api.post(
+        "/api/champ/delivery-action/upload",
+        data={"shipment_id": shipment["id"], "action": "delivered", "upload_id": session["id"]},
+    )
+    assert response.status_code == 200
+    file_id = response.json()["delivery_proof_file_id"]
+    assert file_id
+
+    download = await api.get(f"/api/proofs/files/{file_id}")
+    assert download.content == photo
+
+
+async def test_retried_final_put_completes_without_a_second_file(api, mongo):
+    photo = jpeg_bytes()
+    session = (await api.post("/api/uploads", json={"total_bytes": len(photo)})).json()
+    done = (await api.put(f"/api/uploads/{session['id']}", params={"offset": 0}, content=photo)).json()
+    # The process died after writing the GridFS file but before completing the session
+    await mongo.upload_sessions.update_one({"id": session["id"]}, {"$set": {"status": "open", "file_id": None}})
+
+    retried = await api.put(f"/api/uploads/{session['id']}", params={"offset": len(photo)}, content=b"")
+    assert retried.status_code == 200
+    assert retried.json()["status"] == "complete"
+    assert retried.json()["file_id"] == done["file_id"]
+    assert await mongo["proof_files.files"].count_documents({}) == 1
+    assert (await api.get(f"/api/proofs/files/{done['file_id']}")).content == photo
@@ -0,0 +1,24 @@
+from tests.conftest import create_shipment
+
+
+async def test_reschedule_date_is_parsed_or_rejected(api):
+    shipment = await create_shipment(api, "AWBRESCHED01")
+
+    rejected = await api.put(f"/api/shipments/{shipment['id']}", json={"rescheduled_date": "next tuesday"})
+    assert rejected.status_code == 400
+    assert (await api.get(f"/api/shipments/{shipment['id']}")).json()["reschedule_day"] is None
+
+    accepted = await api.put(f"/api/shipments/{shipment['id']}", json={"rescheduled_date": "25/12/2026"})
+    assert accepted.status_code == 200
+    assert accepted.json()["reschedule_day"] == "2026-12-25"
+
+
+async def test_queue_rejects_a_day_it_cannot_parse(api):
+    # A rescheduled shipment with no day must not be returned for a bad `day`
+    shipment = await create_shipment(api, "AWBRESCHED02")
+    await api.put(f"/api/shipments/{shipment['id']}", json={"status": "rescheduled"})
+
+    assert (await api.get("/api/reschedules/queue", params={"day": "someday"})).status_code == 400
+    assert (await api.get("/api/reschedules/queue", params={"day": " "})).status_code == 400
+    queued = await api.get("/api/reschedules/queue", params={"day": "2026-12-25"})
+    assert queued.status_code == 200 and queued.json() == []
@@ -0,0 +1,35 @@
+import asyncio
+
+
+async def deliver(api, pickup_id, indices):
+    response = await api.post(f"/api/pickups/{pickup_id}/add-delivery", json={
+        "pickup_id": pickup_id, "delivered_item_indices": indices
+    })
+    assert response.status_code == 200
+    return response.json()
+
+
+async def test_concurrent_partial_deliveries_are_both_counted(api, mongo):
+    pickup = (await api.post("/api/pickups/personal-shopping", json={
+        "customer_name": "Farah Khan",
+        "customer_address": "7 Lake View, Bengaluru",
+        "customer_phone": "+91 99000 11111",
+        "shopping_items": [
+            {"item_name": "rice", "value": 100},
+            {"item_name": "oil", "value": 200},
+            {"item_name": "tea", "value": 300},
+        ],
+        "route": "ROUTE-1",
+    })).json()
+
+    # Two champs hand over different items at the same moment
+    await asyncio.gather(deliver(api, pickup["id"], [0]), deliver(api, pickup["id"], [2]))
+    stored = (await api.get(f"/api/pickups/{pickup['id']}")).json()
+    assert stored["collected_value"] == 400
+    assert stored["status"] == "partial"
+    assert [item["is_delivered"] for item in stored["shopping_items"]] == [True, False, True]
+    assert await mongo.shopping_history.count_documents({"pickup_id": pickup["id"]}) == 2
+
+    done = await deliver(api, pickup["id"], [1])
+    assert done["collected_value"] == 600
+    assert done["status"] == "completed"
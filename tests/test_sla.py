@@ -0,0 +1,58 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from tests.conftest import server
+
+ENTERED_AT = "2020-01-01T00:00:00+00:00"
+
+
+@pytest.fixture
+def small_batches(monkeypatch):
+    monkeypatch.setattr(server, "SLA_BATCH_SIZE", 2)
+
+
+async def insert_stuck_shipments(mongo, n):
+    await mongo.shipments.insert_many([
+        {"id": f"sla-{i}", "awb": f"AWBSLA{i:03d}", "status": "in_scanned", "route": "ROUTE-1", "updated_at": ENTERED_AT}
+        for i in range(n)
+    ])
+
+
+async def test_detection_pages_through_shipments_with_the_same_timestamp(mongo, small_batches):
+    await insert_stuck_shipments(mongo, 5)
+    now = datetime.now(timezone.utc)
+    found = [await server.detect_sla_breaches("in_scanned", 240, now) for _ in range(4)]
+    assert found == [2, 2, 1, 0]
+    assert await mongo.sla_breaches.count_documents({}) == 5
+
+    # Past the last shipment the watermark jumps to the cutoff
+    mark = await mongo.sla_watermarks.find_one({"_id": "in_scanned"})
+    assert mark["watermark"] > ENTERED_AT and mark["watermark_id"] == ""
+
+
+async def test_full_batch_leaves_the_watermark_on_the_last_shipment(mongo, small_batches):
+    await insert_stuck_shipments(mongo, 3)
+    await server.detect_sla_breaches("in_scanned", 240, datetime.now(timezone.utc))
+    mark = await mongo.sla_watermarks.find_one({"_id": "in_scanned"})
+    assert (mark["watermark"], mark["watermark_id"]) == (ENTERED_AT, "sla-1")
+
+
+async def test_breaches_resolve_once_the_shipment_moves_on(mongo, small_batches):
+    await insert_stuck_shipments(mongo, 3)
+    now = datetime.now(timezone.utc)
+    while await server.detect_sla_breaches("in_scanned", 240, now):
+        pass
+
+    # The first run has no watermark and checks every open breach
+    await mongo.shipments.update_one({"id": "sla-0"}, {"$set": {"status": "assigned_to_bin", "updated_at": now.isoformat()}})
+    assert await server.resolve_sla_breaches(datetime.now(timezone.utc)) == 1
+
+    # Later runs only look at shipments updated since the previous one
+    moved_at = datetime.now(timezone.utc).isoformat()
+    await mongo.shipments.update_one({"id": "sla-2"}, {"$set": {"status": "assigned_to_bin", "updated_at": moved_at}})
+    assert await server.resolve_sla_breaches(datetime.now(timezone.utc)) == 1
+    assert await server.resolve_sla_breaches(datetime.now(timezone.utc)) == 0
+
+    open_breaches = await mongo.sla_breaches.find({"resolved_at": None}, {"_id": 0, "shipment_id": 1}).to_list(None)
+    assert [b["shipment_id"] for b in open_breaches] == ["sla-1"]
@@ -0,0 +1,112 @@
+import asyncio
+
+import pytest
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from tests.conftest import server
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    async def to_list(self, length):
+        return self.docs
+
+
+class FakeCollection:
+    """Just enough of a collection for WriteBatcher: filters are exact-match on top-level fields"""
+
+    def __init__(self, docs, duplicate_ids=()):
+        self.docs = {d["id"]: dict(d) for d in docs}
+        self.duplicate_ids = set(duplicate_ids)
+        self.bulk_writes = []
+        self.finds = 0
+
+    def matches(self, doc, filter):
+        return all(doc.get(k) == v for k, v in filter.items())
+
+    async def bulk_write(self, ops, ordered=True):
+        self.bulk_writes.append(len(ops))
+        matched, errors = 0, []
+        for index, op in enumerate(ops):
+            if op._filter.get("id") in self.duplicate_ids:
+                errors.append({"index": index, "code": 11000, "errmsg": "duplicate key"})
+                continue
+            for doc in self.docs.values():
+                if self.matches(doc, op._filter):
+                    doc.update(op._doc["$set"])
+                    matched += 1
+                    break
+        if errors:
+            raise BulkWriteError({"writeErrors": errors, "nMatched": matched, "upserted": []})
+        return type("Result", (), {"matched_count": matched, "upserted_ids": {}})()
+
+    def find(self, filter, projection=None):
+        self.finds += 1
+        wanted = set(filter["write_id"]["$in"])
+        return FakeCursor([{"write_id": d["write_id"]} for d in self.docs.values() if d.get("write_id") in wanted])
+
+    async def update_one(self, filter, update, upsert=False):
+        raise AssertionError("batched updates must not go out one by one")
+
+
+def shipments(n):
+    return [{"id": f"s{i}", "status": "in_scanned"} for i in range(n)]
+
+
+async def scan(batcher, ids):
+    return await asyncio.gather(*[
+        batcher.update_one({"id": sid, "status": "in_scanned"}, {"$set": {"status": "assigned_to_bin"}})
+        for sid in ids
+    ], return_exceptions=True)
+
+
+async def test_each_caller_gets_its_own_result():
+    collection = FakeCollection(shipments(3))
+    batcher = server.WriteBatcher(collection, max_delay_ms=5, max_ops=100)
+    # s9 does not exist, so one update in the batch matches nothing
+    results = await scan(batcher, ["s0", "s1", "s9", "s2"])
+    assert [r.modified_count for r in results] == [1, 1, 0, 1]
+    assert collection.bulk_writes == [4]
+    # The totals didn't add up, so one query sorted out which updates matched
+    assert collection.finds == 1
+    assert batcher.stats["lookups"] == 1
+
+
+async def test_no_lookup_when_every_update_matched():
+    collection = FakeCollection(shipments(3))
+    batcher = server.WriteBatcher(collection, max_delay_ms=5, max_ops=100)
+    results = await scan(batcher, ["s0", "s1", "s2"])
+    assert [r.matched_count for r in results] == [1, 1, 1]
+    assert collection.finds == 0
+
+
+async def test_batches_split_at_max_ops():
+    collection = FakeCollection(shipments(10))
+    batcher = server.WriteBatcher(collection, max_delay_ms=1000, max_ops=4)
+    results = await asyncio.wait_for(scan(batcher, [f"s{i}" for i in range(8)]), 1)
+    assert collection.bulk_writes == [4, 4]
+    assert all(r.modified_count == 1 for r in results)
+
+
+async def test_write_errors_go_to_the_failing_caller_only():
+    collection = FakeCollection(shipments(3), duplicate_ids={"s1"})
+    batcher = server.WriteBatcher(collection, max_delay_ms=5, max_ops=100)
+    first, failed, last = await scan(batcher, ["s0", "s1", "s2"])
+    assert isinstance(failed, DuplicateKeyError)
+    assert first.modified_count == 1 and last.modified_count == 1
+
+
+async def test_close_flushes_pending_updates():
+    collection = FakeCollection(shipments(2))
+    batcher = server.WriteBatcher(collection, max_delay_ms=60_000, max_ops=100)
+    task = asyncio.ensure_future(scan(batcher, ["s0", "s1"]))
+    while len(batcher._pending) < 2:
+        await asyncio.sleep(0)
+    await batcher.close()
+    results = await asyncio.wait_for(task, 1)
+    assert [r.modified_count for r in results] == [1, 1]
+    with pytest.raises(AssertionError):
+        # Once closed, updates go straight to the collection
+        await batcher.update_one({"id": "s0"}, {"$set": {"status": "x"}})